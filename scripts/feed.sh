@@ -67,6 +67,9 @@ if [[ $ACTION == "reset_data" ]]; then
     $PELIAS elastic create
     $PELIAS prepare interpolation
     cd -
+    # Pelias data changed: bePelias API workers empty their response cache (PELIAS_CACHE_VERSION_FILE)
+    mkdir -p data/best
+    touch data/best/data_version
     set +x
 fi
 
@@ -84,6 +87,19 @@ if [[ $ACTION == "update" || $ACTION ==  "all" ]] ; then
         cp pelias.json $DIR
     fi
 
+    # Local copy for bePelias API (BEST_DATA_DIR). New files and their indexes are prepared in a
+    # staging directory, then renamed into data/best (never overwritten in place): running API
+    # workers keep reading the files they opened until they reload them (see local_data.LocalData)
+    mkdir -p data/best
+    rm -rf data/best/.staging
+    mkdir -p data/best/.staging
+    cp data/best/bestaddresses_*.csv data/best/.staging/ || true  # Other regions
+    cp -f data/bestaddresses_*be$R.csv data/best/.staging/
+    # Build local indexes (id store, address index...) from this copy
+    $DOCKER_COMPOSE run --rm --no-deps api python3 -m bepelias.local_data /data/best/.staging
+    mv -f data/best/.staging/* data/best/
+    rmdir data/best/.staging
+
     mv -f data/bestaddresses_*be$R.csv $DIR/data
     echo "" > $DIR/data/nodata.csv
 
@@ -101,6 +117,9 @@ if [[ $ACTION == "update" || $ACTION ==  "all" ]] ; then
 
     cd -
 
+    # Pelias data changed: bePelias API workers empty their response cache (PELIAS_CACHE_VERSION_FILE)
+    touch data/best/data_version
+
     echo "Import done"
     echo 
     set +x
@@ -0,0 +1,5 @@
+"""Command line bulk geocoding: python -m bepelias (see bepelias.cli)
+"""
+from bepelias.cli import main
+
+main()
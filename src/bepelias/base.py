@@ -1,21 +1,28 @@
 """
 Base code for bePelias
 """
+import asyncio
+import copy
 import json
 import re
 
-from unidecode import unidecode
-
 
+import numpy as np
 import pandas as pd
 from fastapi import status
-from elasticsearch import Elasticsearch, NotFoundError
+from elasticsearch import NotFoundError
+
 
+from bepelias.pelias import PeliasException, CircuitOpenException, DeadlineExceededException
 
-from bepelias.pelias import PeliasException
+from bepelias.utils import apply_sim_functions, log, vlog, get_street_names, get_best_name, pelias_check_postcode, to_rest_guidelines, batch_sim_decisions
+from bepelias.normalization import normalize_name
 
-from bepelias.utils import apply_sim_functions, log, vlog, remove_street_types, get_street_names, pelias_check_postcode, to_rest_guidelines
 
+# Concurrent structured/unstructured calls (see struct_or_unstruct_async):
+# - concurrent: number of unstructured calls sent concurrently with a structured one
+# - unstruct_wasted: among them, number of unstructured results not used
+struct_unstruct_stats = {"concurrent": 0, "unstruct_wasted": 0}
 
 transformer_sequence = [
     [],
@@ -59,8 +66,8 @@ def check_locality(feature, locality_name, threshold=0.8):
     prop = feature["properties"]
 
     if "locality" in prop:
-        sim = apply_sim_functions(unidecode(locality_name).lower(),
-                                  prop["locality"].lower(),
+        sim = apply_sim_functions(normalize_name(locality_name, ("unidecode", "lower")),
+                                  normalize_name(prop["locality"], ("lower",)),
                                   threshold)
         if sim and sim >= threshold:
             vlog(f"locality ('{locality_name}' vs '{prop['locality']}'): {sim}")
@@ -69,10 +76,10 @@ def check_locality(feature, locality_name, threshold=0.8):
     if "addendum" in prop and "best" in prop["addendum"]:
         for c in ["postname", "municipality_name", "part_of_municipality_name"]:
             for lang in ["fr", "nl", "de"]:
-                if f"{c}_{lang}" in prop["addendum"]["best"]:
-
-                    cty = unidecode(prop["addendum"]["best"][f"{c}_{lang}"].lower())
-                    sim = apply_sim_functions(unidecode(locality_name).lower(), cty, threshold)
+                cty = get_best_name(prop["addendum"]["best"], c, lang, normalized=True)
+                if cty is not None:
+                    cty = cty.lower()
+                    sim = apply_sim_functions(normalize_name(locality_name, ("unidecode", "lower")), cty, threshold)
                     vlog(f"{c}_{lang} ('{locality_name}' vs '{cty}'): {sim}")
                     if sim and sim >= threshold:
                         return sim
@@ -105,17 +112,12 @@ def check_streetname(feature, street_name, threshold=0.8):
     if pd.isnull(street_name):
         return 1
 
-    street_name = remove_street_types(unidecode(street_name.upper()))
-
-    for pat, rep in remove_patterns:
-        street_name = re.sub(pat, rep, street_name) if not pd.isnull(street_name) else None
+    street_name = normalize_name(street_name, ("upper", "unidecode", "street_types", "clean"))
 
     feat_street_names = []
 
     vlog(f"checking '{street_name}'")
-    for feat_street_name in get_street_names(feature):
-
-        feat_street_name = remove_street_types(unidecode(feat_street_name))
+    for feat_street_name in get_street_names(feature, normalized=True):
         if feat_street_name in feat_street_names:
             continue
 
@@ -130,10 +132,7 @@ def check_streetname(feature, street_name, threshold=0.8):
         return 1
 
     # Cleansing
-    for pat, rep in remove_patterns:
-        street_name = re.sub(pat, rep, street_name)
-        for i, _ in enumerate(feat_street_names):
-            feat_street_names[i] = re.sub(pat, rep, feat_street_names[i])
+    street_name = normalize_name(street_name, ("clean",))
 
     for feat_street_name in get_street_names(feature):
         sim = apply_sim_functions(feat_street_name, street_name, threshold)
@@ -142,11 +141,14 @@ def check_streetname(feature, street_name, threshold=0.8):
 
     # Adding city name
 
-    for c in ["postname_fr", "postname_nl", "postname_de",
-              "municipality_name_fr", "municipality_name_nl", "municipality_name_de"]:
+    if "addendum" not in feature["properties"] or "best" not in feature["properties"]["addendum"]:
+        return None
 
-        if "addendum" in feature["properties"] and "best" in feature["properties"]["addendum"] and c in feature["properties"]["addendum"]["best"]:
-            cty = unidecode(feature["properties"]["addendum"]["best"][c].upper())
+    for c in ["postname", "municipality_name"]:
+        for lang in ["fr", "nl", "de"]:
+            cty = get_best_name(feature["properties"]["addendum"]["best"], c, lang, normalized=True)
+            if cty is None:
+                continue
 
             for feat_street_name in get_street_names(feature):
                 sim = apply_sim_functions(f"{cty}, {feat_street_name}", street_name, threshold)
@@ -155,6 +157,64 @@ def check_streetname(feature, street_name, threshold=0.8):
     return None
 
 
+def check_streetnames(features, street_name, threshold=0.8):
+    """
+    Same as "[check_streetname(feat, street_name, threshold) is not None for feat in features]",
+    but comparing all candidate names (with and without city names) of all features at once
+    (see utils.batch_sim_decisions)
+
+    Parameters
+    ----------
+    features : list
+        Pelias features.
+    street_name : str
+        Input street name.
+    threshold : float, optional
+        Similarity threshold. The default is 0.8.
+
+    Returns
+    -------
+    list
+        For each feature, True if it matches street_name.
+    """
+
+    if pd.isnull(street_name):
+        return [True] * len(features)
+
+    # Same comparisons as check_streetname: normalized names vs normalized street_name, then
+    # names and "city, name" vs street_name cleansed a second time
+    queries = [normalize_name(street_name, ("upper", "unidecode", "street_types", "clean"))]
+    queries.append(normalize_name(queries[0], ("clean",)))
+
+    keep = np.zeros(len(features), dtype=bool)
+    candidates = {}  # (name, query index) -> feature indexes
+    for i, feature in enumerate(features):
+        feat_street_names = list(dict.fromkeys(get_street_names(feature)))
+        if len(feat_street_names) == 0:  # No street name found --> ok
+            keep[i] = True
+            continue
+
+        names = [(n, 0) for n in get_street_names(feature, normalized=True)]
+        names += [(n, 1) for n in feat_street_names]
+
+        best = feature["properties"]["addendum"]["best"] if "addendum" in feature["properties"] and "best" in feature["properties"]["addendum"] else {}
+        for c in ["postname", "municipality_name"]:
+            for lang in ["fr", "nl", "de"]:
+                cty = get_best_name(best, c, lang, normalized=True)
+                if cty is not None:
+                    names += [(f"{cty}, {n}", 1) for n in feat_street_names]
+
+        for name in names:
+            candidates.setdefault(name, []).append(i)
+
+    decisions = batch_sim_decisions([n for n, _ in candidates], queries, [q for _, q in candidates], threshold)
+    for feat_indexes, decision in zip(candidates.values(), decisions):
+        if decision:
+            keep[feat_indexes] = True
+
+    return keep.tolist()
+
+
 def check_best_streetname(pelias_res, street_name, threshold=0.8):
     """
     Filter a Pelias feature list to keep only with a street name similar to "street_name"
@@ -176,8 +236,8 @@ def check_best_streetname(pelias_res, street_name, threshold=0.8):
 
     nb_res = len(pelias_res["features"])
 
-    filtered_feat = list(filter(lambda feat: check_streetname(feat, street_name, threshold) is not None,
-                                pelias_res["features"]))
+    keep = check_streetnames(pelias_res["features"], street_name, threshold)
+    filtered_feat = [feat for feat, k in zip(pelias_res["features"], keep) if k]
 
     pelias_res["features"] = filtered_feat
 
@@ -205,35 +265,52 @@ def is_building(feature):
     return (feature["properties"]["match_type"] in ("exact", "interpolated") or feature["properties"]["accuracy"] == "point") and "housenumber" in feature["properties"]
 
 
-def interpolate(feature, pelias):
+def get_street_center_query(feature):
     """
-    Try to interpolate the building position (typically because coordinates are missing)
+    Build the structured query used to find the center of the street of a feature
 
     Parameters
     ----------
-    feature : str
+    feature : dict
         A Pelias feature.
 
     Returns
     -------
-    interp_res : dict
-        Object containing interpolated geometry.
+    dict or None
+        Structured query, or None if feature does not contain street or postal code.
     """
 
-    # get street center
     if 'street' not in feature['properties']:
         log("No street property in feature: ")
         log(feature['properties'])
-        return {}
+        return None
     if 'postalcode' not in feature['properties']:
         log("No postalcode property in feature: ")
         log(feature['properties'])
-        return {}
+        return None
 
-    addr = {"address": f"{feature['properties']['street']}",
+    return {"address": f"{feature['properties']['street']}",
             "postalcode": feature['properties']['postalcode'],
             "locality": ""}
-    street_res = pelias.geocode(addr)
+
+
+def get_street_center_coordinates(street_res, feature):
+    """
+    From the result of a street center query, get the coordinates of the first
+    street matching the feature postal code
+
+    Parameters
+    ----------
+    street_res : dict
+        Pelias result for get_street_center_query(feature).
+    feature : dict
+        A Pelias feature.
+
+    Returns
+    -------
+    list or None
+        Street center coordinates ([lon, lat]), or None if no street matches.
+    """
     vlog(f"Interpolate: street center: {street_res}")
 
     # Keep only results maching input postalcode
@@ -242,15 +319,114 @@ def interpolate(feature, pelias):
                                          street_res["features"]))
 
     if len(street_res["features"]) == 0:
-        return {}
+        return None
 
     street_center_coords = street_res["features"][0]["geometry"]["coordinates"]
     vlog(f"street_center_coords: {street_center_coords}")
+    return street_center_coords
+
+
+def get_local_street_center(feature, pelias):
+    """
+    Street center of a feature from the local street table (see local_data.StreetCenterTable)
+
+    Returns
+    -------
+    list or None
+        Street center coordinates ([lon, lat]), or None if there is no local table, or the street is not in it
+        (then Pelias should be asked, see get_street_center_query).
+    """
+    if pelias.local_data.street_centers is None:
+        return None
+
+    return pelias.local_data.street_centers.get_center(feature['properties']['street'], feature['properties']['postalcode'])
+
+
+def interpolate(feature, pelias, deadline=None):
+    """
+    Try to interpolate the building position (typically because coordinates are missing)
+
+    Parameters
+    ----------
+    feature : str
+        A Pelias feature.
+    deadline : float
+        See Pelias.call_service. If reached, fall back on street center (if known),
+        or give up.
+
+    Returns
+    -------
+    interp_res : dict
+        Object containing interpolated geometry.
+    """
+
+    # get street center
+    addr = get_street_center_query(feature)
+    if addr is None:
+        return {}
+
+    street_center_coords = get_local_street_center(feature, pelias)
+    if street_center_coords is None:
+        try:
+            street_res = pelias.geocode(addr, deadline=deadline)
+        except DeadlineExceededException as exc:
+            log(exc)
+            return {}
+
+        street_center_coords = get_street_center_coordinates(street_res, feature)
+        if street_center_coords is None:
+            return {}
+
+    try:
+        interp_res = pelias.interpolate(lat=street_center_coords[1],
+                                        lon=street_center_coords[0],
+                                        number=feature['properties']['housenumber'],
+                                        street=feature['properties']['street'],
+                                        deadline=deadline)
+    except (CircuitOpenException, DeadlineExceededException) as exc:
+        # Interpolation engine known to be down, or no time left: fall back on street center
+        log(exc)
+        interp_res = {}
+
+    if len(interp_res) == 0:
+        interp_res = {"street_geometry": {"coordinates": street_center_coords}}
+
+    vlog(interp_res)
+    return interp_res
+
+
+async def interpolate_async(feature, pelias, deadline=None):
+    """
+    Asyncio version of interpolate (pelias being an AsyncPelias object)
+    """
+
+    # get street center
+    addr = get_street_center_query(feature)
+    if addr is None:
+        return {}
+
+    street_center_coords = get_local_street_center(feature, pelias)
+    if street_center_coords is None:
+        try:
+            street_res = await pelias.geocode(addr, deadline=deadline)
+        except DeadlineExceededException as exc:
+            log(exc)
+            return {}
+
+        street_center_coords = get_street_center_coordinates(street_res, feature)
+        if street_center_coords is None:
+            return {}
 
-    interp_res = pelias.interpolate(lat=street_center_coords[1],
-                                    lon=street_center_coords[0],
-                                    number=feature['properties']['housenumber'],
-                                    street=feature['properties']['street'])
+    try:
+        interp_res = await pelias.interpolate(lat=street_center_coords[1],
+                                              lon=street_center_coords[0],
+                                              number=feature['properties']['housenumber'],
+                                              street=feature['properties']['street'],
+                                              deadline=deadline)
+    except (CircuitOpenException, DeadlineExceededException) as exc:
+        # See interpolate
+        log(exc)
+        interp_res = {}
 
     if len(interp_res) == 0:
         interp_res = {"street_geometry": {"coordinates": street_center_coords}}
@@ -308,11 +484,14 @@ def build_city(post_code, post_name):
     return f"{post_code} {post_name}"
 
 
-def search_for_coordinates(feat, pelias):
+def use_box_coordinates(feat):
     """
-    If a feature has (0,0) as coordinates, try to find better location:
-    - If address contains boxes and the first box has non null coordinates, use them
-    - Otherwise, try the interpolation engine
+    If the first box number of a (0,0) feature has non null coordinates, use them
+
+    Returns
+    -------
+    bool
+        True if coordinates were found in boxes.
     """
 
     vlog("Coordinates==0,0, check if any box number contains coordinates...")
@@ -327,49 +506,61 @@ def search_for_coordinates(feat, pelias):
         feat["geometry"]["coordinates_orig"] = [0, 0]
         feat["geometry"]["coordinates"] = boxes[0]["coordinates"]["lon"], boxes[0]["coordinates"]["lat"]
         feat["bepelias"] = {"interpolated": "from_boxnumber"}
-    else:
+        return True
+    return False
+
+
+def use_interpolated_coordinates(feat, interp):
+    """
+    Update (0,0) coordinates of a feature with the output of interpolate
+    """
+    if "geometry" in interp:
+        feat["geometry"]["coordinates_orig"] = [0, 0]
+        feat["geometry"]["coordinates"] = interp["geometry"]["coordinates"]
+        feat["bepelias"] = {"interpolated": True}
+    elif "street_geometry" in interp:
+        feat["geometry"]["coordinates_orig"] = [0, 0]
+        feat["geometry"]["coordinates"] = interp["street_geometry"]["coordinates"]
+        feat["bepelias"] = {"interpolated": "street_center"}
+
+
+def search_for_coordinates(feat, pelias, deadline=None):
+    """
+    If a feature has (0,0) as coordinates, try to find better location:
+    - If address contains boxes and the first box has non null coordinates, use them
+    - Otherwise, try the interpolation engine
+    """
+
+    if not use_box_coordinates(feat):
         vlog("Coordinates==0,0, try to interpolate...")
-        interp = interpolate(feat, pelias)
-        if "geometry" in interp:
-            feat["geometry"]["coordinates_orig"] = [0, 0]
-            feat["geometry"]["coordinates"] = interp["geometry"]["coordinates"]
-            feat["bepelias"] = {"interpolated": True}
-        elif "street_geometry" in interp:
-            feat["geometry"]["coordinates_orig"] = [0, 0]
-            feat["geometry"]["coordinates"] = interp["street_geometry"]["coordinates"]
-            feat["bepelias"] = {"interpolated": "street_center"}
+        use_interpolated_coordinates(feat, interpolate(feat, pelias, deadline))
 
 
-def struct_or_unstruct(street_name, house_number, post_code, post_name, pelias, check_postcode=True):
+async def search_for_coordinates_async(feat, pelias, deadline=None):
+    """
+    Asyncio version of search_for_coordinates
     """
-    Try structed version of Pelias. If it did not succeed, try the unstructured version, and keep the best result.
 
-    Parameters
-    ----------
-    street_name : str
-        Street name.
-    house_number : str
-        House number.
-    post_code : str
-        Postal code.
-    post_name : str
-        City name.
+    if not use_box_coordinates(feat):
+        vlog("Coordinates==0,0, try to interpolate...")
+        use_interpolated_coordinates(feat, await interpolate_async(feat, pelias, deadline))
+
+
+def build_struct_query(street_name, house_number, post_code, post_name):
+    """
+    Build the query (and layers) for the structured version of Pelias
 
     Returns
     -------
-    dict
-        Pelias result.
+    tuple
+        (query, layers)
     """
 
-    vlog(f"struct_or_unstruct('{street_name}', '{house_number}', '{post_code}', '{post_name}', {check_postcode})")
-    # Try structured
     addr = {"address": build_address(street_name, house_number),
             "locality": post_name}
     if post_code is not None:
         addr["postalcode"] = post_code
 
-    vlog(f"Call struct: {addr}")
-
     layers = None
     # If street name is empty, prevent to receive a "street" of "address" result by setting layers to "locality"
     if street_name is None or len(street_name) == 0:
@@ -377,11 +568,96 @@ def struct_or_unstruct(street_name, house_number, post_code, post_name, pelias,
     # If there is no digit in street+housenumber, only keep street and locality layers
     elif re.search("[0-9]", addr["address"]) is None:
         layers = "street,locality"
-    pelias_struct = pelias.geocode(addr, layers=layers)
+
+    return addr, layers
+
+
+def build_unstruct_query(street_name, house_number, post_code, post_name):
+    """
+    Build the query for the unstructured version of Pelias
+
+    Returns
+    -------
+    str
+        Full address in a single string
+    """
+    addr = build_address(street_name, house_number) + ", " + build_city(post_code, post_name)
+    addr = re.sub("^,", "", addr.strip()).strip()
+    return re.sub(",$", "", addr).strip()
+
+
+def is_valid_unstruct_query(addr):
+    """
+    Check that an unstructured query is worth sending to Pelias (i.e., is not empty
+    and does not contain only numbers)
+    """
+    return bool(addr) and len(addr.strip()) > 0 and not re.match("^[0-9]+$", addr)
+
+
+def get_raw_response(raw_responses, query, layers):
+    """
+    Get (a copy of) the raw Pelias result kept in raw_responses for (query, layers)
+
+    Returns:
+        dict or None: None if raw_responses is None or the call was not done yet
+    """
+    if raw_responses is None:
+        return None
+    key = json.dumps([query, layers], sort_keys=True)
+    if key not in raw_responses:
+        return None
+    vlog(f"Reusing raw Pelias result for {query}")
+    return copy.deepcopy(raw_responses[key])
+
+
+def keep_raw_response(raw_responses, query, layers, pelias_res):
+    """
+    Keep (a copy of) the raw Pelias result for (query, layers) in raw_responses
+    (if not None), before it gets filtered
+    """
+    if raw_responses is not None:
+        raw_responses[json.dumps([query, layers], sort_keys=True)] = copy.deepcopy(pelias_res)
+
+
+def geocode_reusing(pelias, query, layers, raw_responses, deadline=None):
+    """
+    Call pelias.geocode(query, layers), unless the same call was already done
+    (see raw_responses in struct_or_unstruct)
+
+    Returns:
+        tuple: (Pelias result, number of calls actually sent to Pelias: 0 or 1)
+    """
+    pelias_res = get_raw_response(raw_responses, query, layers)
+    if pelias_res is not None:
+        return pelias_res, 0
+
+    pelias_res = pelias.geocode(query, layers=layers, deadline=deadline)
+    keep_raw_response(raw_responses, query, layers, pelias_res)
+    return pelias_res, 1
+
+
+async def geocode_reusing_async(pelias, query, layers, raw_responses, deadline=None):
+    """
+    Asyncio version of geocode_reusing (pelias being an AsyncPelias object)
+    """
+    pelias_res = get_raw_response(raw_responses, query, layers)
+    if pelias_res is not None:
+        return pelias_res, 0
+
+    pelias_res = await pelias.geocode(query, layers=layers, deadline=deadline)
+    keep_raw_response(raw_responses, query, layers, pelias_res)
+    return pelias_res, 1
+
+
+def process_struct_result(pelias_struct, addr, post_code, check_postcode, call_count=1):
+    """
+    Add bePelias info to a structured Pelias result, and (if check_postcode)
+    remove features not matching post_code
+    """
 
     pelias_struct["bepelias"] = {"call_type": "struct",
                                  "in_addr": addr,
-                                 "pelias_call_count": 1}
+                                 "pelias_call_count": call_count}
 
     if post_code is not None:
         if check_postcode:
@@ -389,37 +665,18 @@ def struct_or_unstruct(street_name, house_number, post_code, post_name, pelias,
     else:
         vlog("No postcode in input")
 
-    if len(pelias_struct["features"]) > 0:
-        for feat in pelias_struct["features"]:
-            vlog(feat["properties"]["name"] if "name" in feat["properties"] else feat["properties"]["label"] if "label" in feat["properties"] else "--")
-            if is_building(feat):
-                if feat["geometry"]["coordinates"] == [0, 0]:
-                    search_for_coordinates(feat, pelias)
-
-                vlog("Found a building in res1")
-                vlog(feat)
-                vlog("pelias_struct")
-                vlog(pelias_struct)
-                vlog("-------")
+    return pelias_struct
 
-                return pelias_struct
 
-    # Try unstructured
-    addr = build_address(street_name, house_number) + ", " + build_city(post_code, post_name)
-    addr = re.sub("^,", "", addr.strip()).strip()
-    addr = re.sub(",$", "", addr).strip()
-    vlog(f"Call unstruct: '{addr}'")
-    if addr and len(addr.strip()) > 0 and not re.match("^[0-9]+$", addr):
-        pelias_unstruct = pelias.geocode(addr, layers=layers)
-        cnt = 2
-    else:
-        vlog("Unstructured: empty inputs or only numbers, skip call")
-        cnt = 1
-        pelias_unstruct = {"features": []}
+def process_unstruct_result(pelias_unstruct, addr, street_name, post_code, check_postcode, call_count):
+    """
+    Add bePelias info to an unstructured Pelias result, and remove features
+    not matching post_code (if check_postcode) or street_name
+    """
+
     pelias_unstruct["bepelias"] = {"call_type": "unstruct",
                                    "in_addr": addr,
-                                   "pelias_call_count": cnt}
-    pelias_struct["bepelias"]["pelias_call_count"] = cnt
+                                   "pelias_call_count": call_count}
 
     if post_code is not None:
         if check_postcode:
@@ -427,18 +684,35 @@ def struct_or_unstruct(street_name, house_number, post_code, post_name, pelias,
     else:
         vlog("No postcode in input")
 
-    pelias_unstruct = check_best_streetname(pelias_unstruct, street_name)
+    return check_best_streetname(pelias_unstruct, street_name)
+
+
+def get_first_building(pelias_res):
+    """
+    Get the first feature of a Pelias result corresponding to a building
+
+    Returns
+    -------
+    dict or None
+        First feature for which is_building is True, or None
+    """
+    for feat in pelias_res["features"]:
+        vlog(feat["properties"]["name"] if "name" in feat["properties"] else feat["properties"]["label"] if "label" in feat["properties"] else "--")
+        if is_building(feat):
+            return feat
+    return None
 
-    if len(pelias_unstruct["features"]) > 0:
 
-        for feat in pelias_unstruct["features"]:
-            vlog(feat["properties"]["name"] if "name" in feat["properties"] else feat["properties"]["label"] if "label" in feat["properties"] else "--")
-            if is_building(feat):
-                if feat["geometry"]["coordinates"] == [0, 0]:
-                    search_for_coordinates(feat, pelias)
-                return pelias_unstruct
+def select_struct_or_unstruct(pelias_struct, pelias_unstruct):
+    """
+    None of the structured and unstructured results has a building precision:
+    get the best one, according the first feature
 
-    # No result has a building precision -> get the best one, according the first feature
+    Returns
+    -------
+    dict
+        pelias_struct or pelias_unstruct
+    """
 
     # If confidence of struct is better that confidence of unstruct OR struct contains 'street' --> choose struct
     if len(pelias_struct["features"]) > 0:
@@ -459,60 +733,213 @@ def struct_or_unstruct(street_name, house_number, post_code, post_name, pelias,
     return pelias_unstruct
 
 
-remove_patterns = [(r"\(.+\)$",      ""),
-                   ("[, ]*(SN|ZN)$", ""),
-                   ("' ", "'"),
-                   (" [a-zA-Z][. ]", " "),
-                   ("[.]", " "),
-                   (",[a-zA-Z .'-]*$", " ")
-                   ]
+async def cancel_pending_async(runs):
+    """
+    Cancel (or close) all awaitables in runs (possibly None) which were not awaited yet
+    """
+    tasks = []
+    for run in runs:
+        if run is None:
+            continue
+        if asyncio.isfuture(run):
+            run.cancel()
+            tasks.append(run)
+        else:
+            run.close()
+    if tasks:
+        vlog(f"Cancel {len(tasks)} pending call(s)")
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
-def transform(addr_data, transformer):
+def struct_or_unstruct(street_name, house_number, post_code, post_name, pelias, check_postcode=True, raw_responses=None, deadline=None):
     """
-    Transform an address applying a transformer.
+    Try structed version of Pelias. If it did not succeed, try the unstructured version, and keep the best result.
 
     Parameters
     ----------
-    addr_data : dict
-        dict with fields "post_name", "house_number", "street_name"
-    transformer : str
-        Transformer name. Could be:
-            - no_city: Remove city name
-            - no_hn: Remove house number
-            - clean_hn: Clean house number, by keeping only the first sequence of digits
-            - clean: Clean street and city names, by applying the substitutions
-              described in 'remove_patterns'
+    street_name : str
+        Street name.
+    house_number : str
+        House number.
+    post_code : str
+        Postal code.
+    post_name : str
+        City name.
+    check_postcode : bool
+        If True, remove results not matching post_code.
+    raw_responses : dict or None
+        If not None, unfiltered Pelias results are kept in this dict, and reused
+        (instead of calling Pelias again) if the same call is done later on.
+    deadline : float or None
+        See Pelias.call_service. If reached after the structured call, its result
+        is returned (flagged with "deadline_exceeded").
 
     Returns
     -------
-    addr_data : dict
+    dict
+        Pelias result.
     """
 
-    addr_data = addr_data.copy()
-
-    if transformer == "no_city":
-        addr_data["post_name"] = ""
+    vlog(f"struct_or_unstruct('{street_name}', '{house_number}', '{post_code}', '{post_name}', {check_postcode})")
+    # Try structured
+    addr, layers = build_struct_query(street_name, house_number, post_code, post_name)
 
-    elif transformer == "no_hn":
-        addr_data["house_number"] = ""
+    vlog(f"Call struct: {addr}")
+    pelias_struct, cnt = geocode_reusing(pelias, addr, layers, raw_responses, deadline)
+    pelias_struct = process_struct_result(pelias_struct, addr, post_code, check_postcode, cnt)
 
-    elif transformer == "no_street":
-        addr_data["street_name"] = ""
-        addr_data["house_number"] = ""
+    feat = get_first_building(pelias_struct)
+    if feat:
+        if feat["geometry"]["coordinates"] == [0, 0]:
+            search_for_coordinates(feat, pelias, deadline)
 
-    elif transformer == "clean_hn":
-        if "house_number" in addr_data and not pd.isnull(addr_data["house_number"]):
-            if "-" in addr_data["house_number"]:
-                addr_data["house_number"] = addr_data["house_number"].split("-")[0].strip()  # useful? "match" bellow will do the same
+        vlog("Found a building in res1")
+        vlog(feat)
+        vlog("pelias_struct")
+        vlog(pelias_struct)
+        vlog("-------")
 
-            hn = re.match("^[0-9]+", addr_data["house_number"])
-            if hn:
-                addr_data["house_number"] = hn[0]
-    elif transformer == "clean":
-        for pat, rep in remove_patterns:
-            addr_data["street_name"] = re.sub(pat, rep, addr_data["street_name"]) if not pd.isnull(addr_data["street_name"]) else None
-            addr_data["post_name"] = re.sub(pat, rep, addr_data["post_name"]) if not pd.isnull(addr_data["post_name"]) else None
+        return pelias_struct
+
+    # Try unstructured
+    addr = build_unstruct_query(street_name, house_number, post_code, post_name)
+    vlog(f"Call unstruct: '{addr}'")
+    if is_valid_unstruct_query(addr):
+        try:
+            pelias_unstruct, unstruct_cnt = geocode_reusing(pelias, addr, layers, raw_responses, deadline)
+        except DeadlineExceededException as exc:
+            log(exc)
+            pelias_struct["bepelias"]["deadline_exceeded"] = True
+            return pelias_struct
+        cnt += unstruct_cnt
+    else:
+        vlog("Unstructured: empty inputs or only numbers, skip call")
+        pelias_unstruct = {"features": []}
+    pelias_unstruct = process_unstruct_result(pelias_unstruct, addr, street_name, post_code, check_postcode, cnt)
+    pelias_struct["bepelias"]["pelias_call_count"] = cnt
+
+    feat = get_first_building(pelias_unstruct)
+    if feat:
+        if feat["geometry"]["coordinates"] == [0, 0]:
+            search_for_coordinates(feat, pelias, deadline)
+        return pelias_unstruct
+
+    return select_struct_or_unstruct(pelias_struct, pelias_unstruct)
+
+
+async def struct_or_unstruct_async(street_name, house_number, post_code, post_name, pelias, check_postcode=True, raw_responses=None,
+                                   deadline=None, concurrent_unstruct=False):
+    """
+    Asyncio version of struct_or_unstruct (pelias being an AsyncPelias object)
+
+    If concurrent_unstruct, the unstructured call is sent at the same time as
+    the structured one, instead of only when the structured result does not
+    contain any building. Selection rules are unchanged; when the structured result
+    contains a building, the unstructured call is wasted (and cancelled if still
+    pending). See struct_unstruct_stats.
+    """
+
+    vlog(f"struct_or_unstruct_async('{street_name}', '{house_number}', '{post_code}', '{post_name}', {check_postcode})")
+    addr, layers = build_struct_query(street_name, house_number, post_code, post_name)
+    unstruct_addr = build_unstruct_query(street_name, house_number, post_code, post_name)
+
+    unstruct_run = None
+    if concurrent_unstruct and is_valid_unstruct_query(unstruct_addr):
+        vlog(f"Call unstruct (concurrently): '{unstruct_addr}'")
+        unstruct_run = asyncio.ensure_future(geocode_reusing_async(pelias, unstruct_addr, layers, raw_responses, deadline))
+        struct_unstruct_stats["concurrent"] += 1
+
+    try:
+        # Try structured
+        vlog(f"Call struct: {addr}")
+        pelias_struct, cnt = await geocode_reusing_async(pelias, addr, layers, raw_responses, deadline)
+        pelias_struct = process_struct_result(pelias_struct, addr, post_code, check_postcode, cnt)
+
+        feat = get_first_building(pelias_struct)
+        if feat:
+            if unstruct_run:
+                struct_unstruct_stats["unstruct_wasted"] += 1
+                await cancel_pending_async([unstruct_run])
+                unstruct_run = None
+
+            if feat["geometry"]["coordinates"] == [0, 0]:
+                await search_for_coordinates_async(feat, pelias, deadline)
+            vlog("Found a building in res1")
+            return pelias_struct
+
+        # Try unstructured
+        vlog(f"Call unstruct: '{unstruct_addr}'")
+        if is_valid_unstruct_query(unstruct_addr):
+            try:
+                pelias_unstruct, unstruct_cnt = await (unstruct_run or geocode_reusing_async(pelias, unstruct_addr, layers, raw_responses, deadline))
+            except DeadlineExceededException as exc:
+                log(exc)
+                pelias_struct["bepelias"]["deadline_exceeded"] = True
+                return pelias_struct
+            unstruct_run = None
+            cnt += unstruct_cnt
+        else:
+            vlog("Unstructured: empty inputs or only numbers, skip call")
+            pelias_unstruct = {"features": []}
+    finally:
+        await cancel_pending_async([unstruct_run])
+
+    pelias_unstruct = process_unstruct_result(pelias_unstruct, unstruct_addr, street_name, post_code, check_postcode, cnt)
+    pelias_struct["bepelias"]["pelias_call_count"] = cnt
+
+    feat = get_first_building(pelias_unstruct)
+    if feat:
+        if feat["geometry"]["coordinates"] == [0, 0]:
+            await search_for_coordinates_async(feat, pelias, deadline)
+        return pelias_unstruct
+
+    return select_struct_or_unstruct(pelias_struct, pelias_unstruct)
+
+
+def transform(addr_data, transformer):
+    """
+    Transform an address applying a transformer.
+
+    Parameters
+    ----------
+    addr_data : dict
+        dict with fields "post_name", "house_number", "street_name"
+    transformer : str
+        Transformer name. Could be:
+            - no_city: Remove city name
+            - no_hn: Remove house number
+            - clean_hn: Clean house number, by keeping only the first sequence of digits
+            - clean: Clean street and city names, by applying the substitutions
+              described in 'utils.remove_patterns'
+
+    Returns
+    -------
+    addr_data : dict
+    """
+
+    addr_data = addr_data.copy()
+
+    if transformer == "no_city":
+        addr_data["post_name"] = ""
+
+    elif transformer == "no_hn":
+        addr_data["house_number"] = ""
+
+    elif transformer == "no_street":
+        addr_data["street_name"] = ""
+        addr_data["house_number"] = ""
+
+    elif transformer == "clean_hn":
+        if "house_number" in addr_data and not pd.isnull(addr_data["house_number"]):
+            if "-" in addr_data["house_number"]:
+                addr_data["house_number"] = addr_data["house_number"].split("-")[0].strip()  # useful? "match" bellow will do the same
+
+            hn = re.match("^[0-9]+", addr_data["house_number"])
+            if hn:
+                addr_data["house_number"] = hn[0]
+    elif transformer == "clean":
+        for field in ["street_name", "post_name"]:
+            addr_data[field] = normalize_name(addr_data[field], ("clean",)) if not pd.isnull(addr_data[field]) else None
 
     return addr_data
 
@@ -584,62 +1011,54 @@ def add_precision(pelias_res):
         feat["bepelias"]["precision"] = get_precision(feat)
 
 
-def advanced_mode(street_name, house_number, post_code, post_name, pelias):
-    """The full logic of bePelias
+def get_transformed_addresses(addr_data):
+    """
+    Apply each transformer sequence of transformer_sequence to addr_data,
+    skipping variants already tried or without any value
+
+    Parameters
+    ----------
+    addr_data : dict
+        dict with fields "street_name", "house_number", "post_name", "post_code"
+
+    Yields
+    ------
+    tuple
+        (transformer list, transformed addr_data)
+    """
+    previous_attempts = []
+    for transf in transformer_sequence:
+        transf_addr_data = addr_data.copy()
+        for t in transf:
+            transf_addr_data = transform(transf_addr_data, t)
+
+        vlog(f"transformed address: ({ ';'.join(transf)})")
+        if transf_addr_data in previous_attempts:
+            vlog("Transformed address already tried, skip Pelias call")
+        elif len(list(filter(lambda v: v and len(v) > 0, transf_addr_data.values()))) == 0:
+            vlog("No value to send, skip Pelias call")
+        else:
+            previous_attempts.append(transf_addr_data)
+            yield transf, transf_addr_data
+
+
+def select_best_result(all_res, street_name, house_number, post_code, post_name, call_cnt):
+    """
+    None of the results of advanced_mode has a building precision: give a score to
+    each of them, and keep the best one
 
     Args:
+        all_res (list): Pelias results
         street_name (str): Street name
         house_number (str): House number
         post_code (str): Postal code
         post_name (str): Post (city/locality/...) name
-        pelias (Pelias): Pelias object
+        call_cnt (int): Number of Pelias calls
 
     Returns:
         dict: json result
     """
 
-    addr_data = {"street_name": street_name,
-                 "house_number": house_number,
-                 "post_name": post_name,
-                 "post_code": post_code}
-    all_res = []
-
-    call_cnt = 0
-    for check_postcode in [True, False]:
-        previous_attempts = []
-        for transf in transformer_sequence:
-            transf_addr_data = addr_data.copy()
-            for t in transf:
-                transf_addr_data = transform(transf_addr_data, t)
-
-            vlog(f"transformed address: ({ ';'.join(transf)})")
-            if transf_addr_data in previous_attempts:
-                vlog("Transformed address already tried, skip Pelias call")
-            elif len(list(filter(lambda v: v and len(v) > 0, transf_addr_data.values()))) == 0:
-                vlog("No value to send, skip Pelias call")
-            else:
-                previous_attempts.append(transf_addr_data)
-
-                pelias_res = struct_or_unstruct(transf_addr_data["street_name"],
-                                                transf_addr_data["house_number"],
-                                                transf_addr_data["post_code"],
-                                                transf_addr_data["post_name"],
-                                                pelias,
-                                                check_postcode=check_postcode)
-                pelias_res["bepelias"]["transformers"] = ";".join(transf) + ("(no postcode check)" if not check_postcode else "")
-                call_cnt += pelias_res["bepelias"]["pelias_call_count"]
-
-                if len(pelias_res["features"]) > 0 and is_building(pelias_res["features"][0]):
-                    pelias_res["bepelias"]["pelias_call_count"] = call_cnt
-                    add_precision(pelias_res)
-                    return pelias_res
-                all_res.append(pelias_res)
-        if sum(len(r["features"]) for r in all_res) > 0:
-            # If some result were found (even street-level), we stop here and select the best one.
-            # Otherwise, we start again, accepting any postcode in the result
-            vlog("Some result found with check_postcode=True")
-            break
-
     vlog("No building result, keep the best match")
     # Get a score for each result
     fields = ["housenumber", "street", "locality", "postalcode", "best"]
@@ -708,26 +1127,194 @@ def advanced_mode(street_name, house_number, post_code, post_name, pelias):
     return {"features": [], "bepelias": {"pelias_call_count": call_cnt}}
 
 
-def call_unstruct(address, pelias):
-    """
-    Call the unstructured version of Pelias with "address" as input
-    If Pelias was able to parse the address (i.e., split it into component),
-    we try to check that the results is not too far away from the input.
+def advanced_mode(street_name, house_number, post_code, post_name, pelias, deadline=None):
+    """The full logic of bePelias
 
     Args:
-        address (str): full address in a single string
+        street_name (str): Street name
+        house_number (str): House number
+        post_code (str): Postal code
+        post_name (str): Post (city/locality/...) name
         pelias (Pelias): Pelias object
+        deadline (float): see Pelias.call_service. If reached, stop trying variants, and
+                          return the best result found so far (flagged with "deadline_exceeded")
 
     Returns:
         dict: json result
     """
 
-    layers = None
+    addr_data = {"street_name": street_name,
+                 "house_number": house_number,
+                 "post_name": post_name,
+                 "post_code": post_code}
+    all_res = []
+    # The second pass (check_postcode=False) sends the same calls as the first one:
+    # keep raw Pelias results to avoid sending them twice
+    raw_responses = {}
+
+    call_cnt = 0
+    deadline_exceeded = False
+    for check_postcode in [True, False]:
+        for transf, transf_addr_data in get_transformed_addresses(addr_data):
+            try:
+                pelias_res = struct_or_unstruct(transf_addr_data["street_name"],
+                                                transf_addr_data["house_number"],
+                                                transf_addr_data["post_code"],
+                                                transf_addr_data["post_name"],
+                                                pelias,
+                                                check_postcode=check_postcode,
+                                                raw_responses=raw_responses,
+                                                deadline=deadline)
+            except DeadlineExceededException as exc:
+                log(exc)
+                deadline_exceeded = True
+                break
+            pelias_res["bepelias"]["transformers"] = ";".join(transf) + ("(no postcode check)" if not check_postcode else "")
+            call_cnt += pelias_res["bepelias"]["pelias_call_count"]
+
+            if len(pelias_res["features"]) > 0 and is_building(pelias_res["features"][0]):
+                pelias_res["bepelias"]["pelias_call_count"] = call_cnt
+                add_precision(pelias_res)
+                return pelias_res
+            all_res.append(pelias_res)
+            if pelias_res["bepelias"].get("deadline_exceeded"):
+                deadline_exceeded = True
+                break
+        if deadline_exceeded:
+            break
+        if sum(len(r["features"]) for r in all_res) > 0:
+            # If some result were found (even street-level), we stop here and select the best one.
+            # Otherwise, we start again, accepting any postcode in the result
+            vlog("Some result found with check_postcode=True")
+            break
+
+    return select_best_result_so_far(all_res, street_name, house_number, post_code, post_name, call_cnt, deadline_exceeded)
+
+
+def select_best_result_so_far(all_res, street_name, house_number, post_code, post_name, call_cnt, deadline_exceeded):
+    """
+    select_best_result, flagging the result with "deadline_exceeded" if the variants
+    could not all be tried
+    """
+    final_res = select_best_result(all_res, street_name, house_number, post_code, post_name, call_cnt)
+    if deadline_exceeded:
+        vlog("Deadline exceeded, return the best result found so far")
+        final_res["bepelias"]["deadline_exceeded"] = True
+    return final_res
+
+
+def start_variants_async(variants, pelias, check_postcode, fan_out, raw_responses=None, deadline=None, concurrent_unstruct=False):
+    """
+    Start struct_or_unstruct_async on all (transformer, address) variants
+
+    Args:
+        variants (list): output of get_transformed_addresses
+        pelias (AsyncPelias): AsyncPelias object
+        check_postcode (bool): see struct_or_unstruct
+        raw_responses (dict): see struct_or_unstruct
+        deadline (float): see struct_or_unstruct
+        fan_out (int): maximal number of variants run concurrently. If 1, nothing
+                       is started: variants are run one by one, when awaited
+        concurrent_unstruct (bool): see struct_or_unstruct_async
+
+    Returns:
+        list: one awaitable per variant, in the same order as variants
+    """
+
+    if fan_out <= 1:
+        return [struct_or_unstruct_async(addr["street_name"], addr["house_number"], addr["post_code"], addr["post_name"],
+                                         pelias, check_postcode=check_postcode, raw_responses=raw_responses, deadline=deadline,
+                                         concurrent_unstruct=concurrent_unstruct)
+                for _, addr in variants]
+
+    semaphore = asyncio.Semaphore(fan_out)
+
+    async def run_variant(addr):
+        async with semaphore:
+            return await struct_or_unstruct_async(addr["street_name"], addr["house_number"], addr["post_code"], addr["post_name"],
+                                                  pelias, check_postcode=check_postcode, raw_responses=raw_responses, deadline=deadline,
+                                                  concurrent_unstruct=concurrent_unstruct)
+
+    return [asyncio.ensure_future(run_variant(addr)) for _, addr in variants]
+
+
+async def advanced_mode_async(street_name, house_number, post_code, post_name, pelias, fan_out=1, concurrent_unstruct=False,
+                              deadline=None):
+    """Asyncio version of advanced_mode (pelias being an AsyncPelias object)
+
+    If fan_out > 1, all variants of an address (see transformer_sequence) are
+    sent concurrently (at most fan_out at a time). Results are still considered
+    in the transformer_sequence order: as soon as all variants before a "building"
+    result are in, the remaining ones are cancelled, giving the same result as
+    the sequential (fan_out=1) version.
+
+    concurrent_unstruct: see struct_or_unstruct_async
+    deadline: see advanced_mode
+    """
+
+    addr_data = {"street_name": street_name,
+                 "house_number": house_number,
+                 "post_name": post_name,
+                 "post_code": post_code}
+    all_res = []
+    # See advanced_mode
+    raw_responses = {}
+
+    call_cnt = 0
+    deadline_exceeded = False
+    for check_postcode in [True, False]:
+        variants = list(get_transformed_addresses(addr_data))
+        runs = start_variants_async(variants, pelias, check_postcode, fan_out, raw_responses, deadline, concurrent_unstruct)
+        try:
+            for i, (transf, _) in enumerate(variants):
+                try:
+                    pelias_res = await runs[i]
+                except DeadlineExceededException as exc:
+                    log(exc)
+                    deadline_exceeded = True
+                    break
+                finally:
+                    runs[i] = None
+                pelias_res["bepelias"]["transformers"] = ";".join(transf) + ("(no postcode check)" if not check_postcode else "")
+                call_cnt += pelias_res["bepelias"]["pelias_call_count"]
+
+                if len(pelias_res["features"]) > 0 and is_building(pelias_res["features"][0]):
+                    pelias_res["bepelias"]["pelias_call_count"] = call_cnt
+                    add_precision(pelias_res)
+                    return pelias_res
+                all_res.append(pelias_res)
+                if pelias_res["bepelias"].get("deadline_exceeded"):
+                    deadline_exceeded = True
+                    break
+        finally:
+            await cancel_pending_async(runs)
+
+        if deadline_exceeded:
+            break
+        if sum(len(r["features"]) for r in all_res) > 0:
+            # If some result were found (even street-level), we stop here and select the best one.
+            # Otherwise, we start again, accepting any postcode in the result
+            vlog("Some result found with check_postcode=True")
+            break
+
+    return select_best_result_so_far(all_res, street_name, house_number, post_code, post_name, call_cnt, deadline_exceeded)
+
+
+def get_unstruct_layers(address):
+    """
+    Layers to use when calling unstructured Pelias with address
+    """
     # If there is no digit in street+housenumber, only keep street and locality layers
     if re.search("[0-9]", address) is None:
-        layers = "street,locality"
+        return "street,locality"
+    return None
 
-    pelias_unstruct = pelias.geocode(address, layers=layers)
+
+def process_call_unstruct_result(pelias_unstruct, address):
+    """
+    If Pelias was able to parse the address (i.e., split it into component),
+    we try to check that the results is not too far away from the input.
+    """
 
     pelias_unstruct["bepelias"] = {"call_type": "unstruct",
                                    "in_addr": address,
@@ -751,23 +1338,40 @@ def call_unstruct(address, pelias):
     return pelias_unstruct
 
 
-def unstructured_mode(address, pelias):
-    """The full logic of bePelias when input in unstructured
+def call_unstruct(address, pelias, deadline=None):
+    """
+    Call the unstructured version of Pelias with "address" as input
+    If Pelias was able to parse the address (i.e., split it into component),
+    we try to check that the results is not too far away from the input.
 
     Args:
-        address (str): address (unstructured) to geocode
+        address (str): full address in a single string
         pelias (Pelias): Pelias object
+        deadline (float): see Pelias.call_service
 
     Returns:
         dict: json result
     """
 
-    pelias_unstruct = call_unstruct(address, pelias)
+    pelias_unstruct = pelias.geocode(address, layers=get_unstruct_layers(address), deadline=deadline)
 
-    if len(pelias_unstruct["features"]) > 0 and is_building(pelias_unstruct["features"][0]):
-        return pelias_unstruct
+    return process_call_unstruct_result(pelias_unstruct, address)
 
-    vlog("No (address) result with simple unstructured call, try a simple clean")
+
+async def call_unstruct_async(address, pelias, deadline=None):
+    """
+    Asyncio version of call_unstruct (pelias being an AsyncPelias object)
+    """
+
+    pelias_unstruct = await pelias.geocode(address, layers=get_unstruct_layers(address), deadline=deadline)
+
+    return process_call_unstruct_result(pelias_unstruct, address)
+
+
+def clean_unstruct_address(address):
+    """
+    Simple cleansing of an unstructured address (remove parenthesized parts)
+    """
     address_clean = address
 
     remove_patterns_unstruct = [(r"\(.+?\)",  "")]
@@ -775,10 +1379,55 @@ def unstructured_mode(address, pelias):
     for pat, rep in remove_patterns_unstruct:
         address_clean = re.sub(pat, rep, address_clean)
 
+    return address_clean
+
+
+def get_parsed_address(pelias_unstruct):
+    """
+    Get the address components parsed by Pelias (on an unstructured call), as
+    advanced_mode arguments
+
+    Returns:
+        dict or None: None if street or postal code could not be parsed
+    """
+    parsed = pelias_unstruct["geocoding"]["query"]["parsed_text"]
+    if "street" in parsed and "postalcode" in parsed:
+        return {"street_name": parsed["street"],
+                "house_number": parsed["housenumber"] if "housenumber" in parsed else "",
+                "post_code": parsed["postalcode"],
+                "post_name": parsed["city"] if "city" in parsed else ""}
+    return None
+
+
+def unstructured_mode(address, pelias, deadline=None):
+    """The full logic of bePelias when input in unstructured
+
+    Args:
+        address (str): address (unstructured) to geocode
+        pelias (Pelias): Pelias object
+        deadline (float): see advanced_mode
+
+    Returns:
+        dict: json result
+    """
+
+    pelias_unstruct = call_unstruct(address, pelias, deadline)
+
+    if len(pelias_unstruct["features"]) > 0 and is_building(pelias_unstruct["features"][0]):
+        return pelias_unstruct
+
+    vlog("No (address) result with simple unstructured call, try a simple clean")
+    address_clean = clean_unstruct_address(address)
+
     if address_clean != address:
         vlog(f"cleansed address: '{address_clean}'")
         vlog(f"initial  address: '{address}'")
-        pelias_unstruct = call_unstruct(address_clean, pelias)
+        try:
+            pelias_unstruct = call_unstruct(address_clean, pelias, deadline)
+        except DeadlineExceededException as exc:
+            log(exc)
+            pelias_unstruct["bepelias"]["deadline_exceeded"] = True
+            return pelias_unstruct
         pelias_unstruct["bepelias"]["pelias_call_count"] = 2
 
         if len(pelias_unstruct["features"]) > 0 and is_building(pelias_unstruct["features"][0]):
@@ -788,17 +1437,57 @@ def unstructured_mode(address, pelias):
 
     vlog("No (address) result with simple unstructured call, try advanced structured mode")
     # No result with a simple call, try advanced mode
-    parsed = pelias_unstruct["geocoding"]["query"]["parsed_text"]
-    if "street" in parsed and "postalcode" in parsed:
-        pelias_res = advanced_mode(street_name=parsed["street"],
-                                   house_number=parsed["housenumber"] if "housenumber" in parsed else "",
-                                   post_code=parsed["postalcode"],
-                                   post_name=parsed["city"] if "city" in parsed else "",
-                                   pelias=pelias)
+    parsed = get_parsed_address(pelias_unstruct)
+    if parsed:
+        pelias_res = advanced_mode(**parsed, pelias=pelias, deadline=deadline)
         pelias_res["bepelias"]["pelias_call_count"] += 2
         return pelias_res
+
+    vlog("Cannot parse address, skip...")
+
+    # Advanced mode not applicable, return (empty) initial result
+    return pelias_unstruct
+
+
+async def unstructured_mode_async(address, pelias, fan_out=1, concurrent_unstruct=False, deadline=None):
+    """Asyncio version of unstructured_mode (pelias being an AsyncPelias object)
+    fan_out, concurrent_unstruct: see advanced_mode_async
+    """
+
+    pelias_unstruct = await call_unstruct_async(address, pelias, deadline)
+
+    if len(pelias_unstruct["features"]) > 0 and is_building(pelias_unstruct["features"][0]):
+        return pelias_unstruct
+
+    vlog("No (address) result with simple unstructured call, try a simple clean")
+    address_clean = clean_unstruct_address(address)
+
+    if address_clean != address:
+        vlog(f"cleansed address: '{address_clean}'")
+        vlog(f"initial  address: '{address}'")
+        try:
+            pelias_unstruct = await call_unstruct_async(address_clean, pelias, deadline)
+        except DeadlineExceededException as exc:
+            log(exc)
+            pelias_unstruct["bepelias"]["deadline_exceeded"] = True
+            return pelias_unstruct
+        pelias_unstruct["bepelias"]["pelias_call_count"] = 2
+
+        if len(pelias_unstruct["features"]) > 0 and is_building(pelias_unstruct["features"][0]):
+            return pelias_unstruct
     else:
-        vlog("Cannot parse address, skip...")
+        vlog("Cleansing has no impact, skip...")
+
+    vlog("No (address) result with simple unstructured call, try advanced structured mode")
+    # No result with a simple call, try advanced mode
+    parsed = get_parsed_address(pelias_unstruct)
+    if parsed:
+        pelias_res = await advanced_mode_async(**parsed, pelias=pelias, fan_out=fan_out, concurrent_unstruct=concurrent_unstruct,
+                                               deadline=deadline)
+        pelias_res["bepelias"]["pelias_call_count"] += 2
+        return pelias_res
+
+    vlog("Cannot parse address, skip...")
 
     # Advanced mode not applicable, return (empty) initial result
     return pelias_unstruct
@@ -809,49 +1498,87 @@ def unstructured_mode(address, pelias):
 #################
 
 
-def geocode(pelias, street_name, house_number, post_code, post_name, mode, with_pelias_result):
-    """ cf api._geocode """
+def local_exact_match(street_name, house_number, post_code, post_name, pelias):
+    """
+    Fast path: look for an exact match (postal code, street name, house number) in the local address
+    index (see local_data.AddressIndex), without calling Pelias
 
-    if street_name:
-        street_name = street_name.strip()
-    if house_number:
-        house_number = house_number.strip()
-    if post_code:
-        post_code = post_code.strip()
-    if post_name:
-        post_name = post_name.strip()
+    Returns:
+        dict or None: Pelias-like result (with a single building), None if there is no local index,
+                      some inputs are missing, or no (unambiguous) match was found
+    """
+    if pelias.local_data.addresses is None or not street_name or not house_number or not post_code:
+        return None
+
+    features = pelias.local_data.addresses.lookup(post_code, street_name, house_number)
+    if len(features) == 0:
+        return None
+
+    vlog("Exact match found in local address index")
+    return {"features": features,
+            "bepelias": {"call_type": "local",
+                         "in_addr": build_struct_query(street_name, house_number, post_code, post_name)[0],
+                         "pelias_call_count": 0}}
+
+
+def strip_inputs(*inputs):
+    """ Strip all non empty string inputs"""
+    return [inp.strip() if inp else inp for inp in inputs]
+
+
+def geocode(pelias, street_name, house_number, post_code, post_name, mode, with_pelias_result, deadline=None):
+    """ cf api._geocode
+    deadline: see advanced_mode
+    """
+
+    street_name, house_number, post_code, post_name = strip_inputs(street_name, house_number, post_code, post_name)
 
     try:
         if mode in ("basic"):
             pelias_res = pelias.geocode({"address": build_address(street_name, house_number),
                                          "postalcode": post_code,
-                                         "locality": post_name})
+                                         "locality": post_name},
+                                        deadline=deadline)
             add_precision(pelias_res)
 
             return to_rest_guidelines(pelias_res, with_pelias_result)
 
-        elif mode == "simple":
-            pelias_res = struct_or_unstruct(street_name, house_number, post_code, post_name, pelias)
+        pelias_res = local_exact_match(street_name, house_number, post_code, post_name, pelias)
+        if pelias_res is not None:
+            if pelias_res["features"][0]["geometry"]["coordinates"] == [0, 0]:
+                search_for_coordinates(pelias_res["features"][0], pelias, deadline)
+            if mode == "advanced":
+                pelias_res["bepelias"]["transformers"] = ""
             add_precision(pelias_res)
 
             return to_rest_guidelines(pelias_res, with_pelias_result)
 
-        else:  # --> mode == "advanced":
-            log("advanced...")
+        if mode == "simple":
+            pelias_res = struct_or_unstruct(street_name, house_number, post_code, post_name, pelias, deadline=deadline)
+            add_precision(pelias_res)
 
-            pelias_res = advanced_mode(street_name, house_number, post_code, post_name, pelias)
+            return to_rest_guidelines(pelias_res, with_pelias_result)
 
-            vlog("result (before rest_guidelines):")
-            vlog(pelias_res)
-            vlog("------")
-            res = to_rest_guidelines(pelias_res, with_pelias_result)
+        # --> mode == "advanced":
+        log("advanced...")
+
+        pelias_res = advanced_mode(street_name, house_number, post_code, post_name, pelias, deadline=deadline)
+
+        vlog("result (before rest_guidelines):")
+        vlog(pelias_res)
+        vlog("------")
+        res = to_rest_guidelines(pelias_res, with_pelias_result)
 
-            vlog("after rest guidelines")
-            vlog(res)
-            vlog("------")
+        vlog("after rest guidelines")
+        vlog(res)
+        vlog("------")
 
-            return res
+        return res
 
+    except DeadlineExceededException as exc:
+        log(exc)
+        return {"error": str(exc),
+                "status_code": status.HTTP_504_GATEWAY_TIMEOUT}
     except PeliasException as exc:
         log("Exception during process: ")
         log(exc)
@@ -859,24 +1586,145 @@ def geocode(pelias, street_name, house_number, post_code, post_name, mode, with_
                 "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR}
 
 
-def geocode_unstructured(pelias, address, mode, with_pelias_result):
+async def geocode_async(pelias, street_name, house_number, post_code, post_name, mode, with_pelias_result,
+                        fan_out=1, concurrent_unstruct=False, deadline=None):
+    """ Asyncio version of geocode (pelias being an AsyncPelias object)
+    fan_out, concurrent_unstruct: see advanced_mode_async
+    """
+
+    street_name, house_number, post_code, post_name = strip_inputs(street_name, house_number, post_code, post_name)
+
+    try:
+        local_res = None if mode in ("basic") else local_exact_match(street_name, house_number, post_code, post_name, pelias)
+
+        if mode in ("basic"):
+            pelias_res = await pelias.geocode({"address": build_address(street_name, house_number),
+                                               "postalcode": post_code,
+                                               "locality": post_name},
+                                              deadline=deadline)
+            add_precision(pelias_res)
+
+        elif local_res is not None:
+            pelias_res = local_res
+            if pelias_res["features"][0]["geometry"]["coordinates"] == [0, 0]:
+                await search_for_coordinates_async(pelias_res["features"][0], pelias, deadline)
+            if mode == "advanced":
+                pelias_res["bepelias"]["transformers"] = ""
+            add_precision(pelias_res)
+
+        elif mode == "simple":
+            pelias_res = await struct_or_unstruct_async(street_name, house_number, post_code, post_name, pelias,
+                                                        deadline=deadline, concurrent_unstruct=concurrent_unstruct)
+            add_precision(pelias_res)
+
+        else:  # --> mode == "advanced":
+            log("advanced...")
+            pelias_res = await advanced_mode_async(street_name, house_number, post_code, post_name, pelias,
+                                                   fan_out=fan_out, concurrent_unstruct=concurrent_unstruct, deadline=deadline)
+
+        return to_rest_guidelines(pelias_res, with_pelias_result)
+
+    except DeadlineExceededException as exc:
+        log(exc)
+        return {"error": str(exc),
+                "status_code": status.HTTP_504_GATEWAY_TIMEOUT}
+    except PeliasException as exc:
+        log("Exception during process: ")
+        log(exc)
+        return {"error": str(exc),
+                "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR}
+
+
+async def geocode_batch_async(pelias, addresses, mode, with_pelias_result, concurrency=10,
+                              fan_out=1, concurrent_unstruct=False, get_deadline=None):
+    """ see _geocode_batch
+
+    Args:
+        pelias (AsyncPelias): Pelias object
+        addresses (list): list of dict with street_name, house_number, post_code, post_name, and optionally mode
+        mode (str): mode for addresses without their own mode
+        with_pelias_result (bool): see geocode
+        concurrency (int): maximum number of addresses geocoded at the same time
+        fan_out, concurrent_unstruct: see advanced_mode_async
+        get_deadline (function): called (without argument) when the geocoding of an address starts, gives its deadline
+                                 (see advanced_mode). If None, no deadline
+
+    Returns:
+        list: one item per address, in input order: {"status": 200, "result": <geocode result>}
+              or {"status": <error status>, "error": <message>}
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def geocode_one(address):
+        async with semaphore:
+            try:
+                res = await geocode_async(pelias, address["street_name"], address["house_number"], address["post_code"], address["post_name"],
+                                          address.get("mode") or mode, with_pelias_result,
+                                          fan_out=fan_out, concurrent_unstruct=concurrent_unstruct,
+                                          deadline=get_deadline() if get_deadline else None)
+            except Exception as exc:
+                # An unexpected error on one address should not make the whole batch fail
+                log(f"Exception during batch process: {exc}")
+                return {"status": status.HTTP_500_INTERNAL_SERVER_ERROR, "error": str(exc)}
+
+        if "status_code" in res:
+            return {"status": res["status_code"], "error": res["error"]}
+        return {"status": status.HTTP_200_OK, "result": res}
+
+    return await asyncio.gather(*[geocode_one(address) for address in addresses])
+
+
+def geocode_unstructured(pelias, address, mode, with_pelias_result, deadline=None):
     """ see _geocode_unstructured
+    deadline: see advanced_mode
     """
 
     log(f"Geocode (unstruct - {mode}): {address}")
 
     try:
         if mode in ("basic"):
-            pelias_res = pelias.geocode(address)
+            pelias_res = pelias.geocode(address, deadline=deadline)
             add_precision(pelias_res)
             res = to_rest_guidelines(pelias_res, with_pelias_result)
 
         else:  # --> mode == "advanced":
-            pelias_res = unstructured_mode(address, pelias)
+            pelias_res = unstructured_mode(address, pelias, deadline)
             res = to_rest_guidelines(pelias_res, with_pelias_result)
 
         return res
 
+    except DeadlineExceededException as exc:
+        log(exc)
+        return {"error": str(exc),
+                "status_code": status.HTTP_504_GATEWAY_TIMEOUT}
+    except PeliasException as exc:
+        log("Exception during process: ")
+        log(exc)
+        return {"error": str(exc),
+                "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR}
+
+
+async def geocode_unstructured_async(pelias, address, mode, with_pelias_result, fan_out=1, concurrent_unstruct=False, deadline=None):
+    """ Asyncio version of geocode_unstructured (pelias being an AsyncPelias object)
+    fan_out, concurrent_unstruct: see advanced_mode_async
+    """
+
+    log(f"Geocode (unstruct - {mode}): {address}")
+
+    try:
+        if mode in ("basic"):
+            pelias_res = await pelias.geocode(address, deadline=deadline)
+            add_precision(pelias_res)
+        else:  # --> mode == "advanced":
+            pelias_res = await unstructured_mode_async(address, pelias, fan_out=fan_out, concurrent_unstruct=concurrent_unstruct,
+                                                       deadline=deadline)
+
+        return to_rest_guidelines(pelias_res, with_pelias_result)
+
+    except DeadlineExceededException as exc:
+        log(exc)
+        return {"error": str(exc),
+                "status_code": status.HTTP_504_GATEWAY_TIMEOUT}
     except PeliasException as exc:
         log("Exception during process: ")
         log(exc)
@@ -884,6 +1732,130 @@ def geocode_unstructured(pelias, address, mode, with_pelias_result):
                 "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR}
 
 
+STREAM_STRUCT_FIELDS = ["streetName", "houseNumber", "postCode", "postName"]
+
+
+async def geocode_record_async(pelias, record, mode, with_pelias_result, fan_out=1, concurrent_unstruct=False, deadline=None):
+    """ Geocode a single record of a stream (see geocode_stream_async)
+
+    Args:
+        record (dict): either {"address": ...} (unstructured) or with some of STREAM_STRUCT_FIELDS (structured),
+                       optionally with its own "mode"
+        mode (str): mode if record does not give one
+
+    Returns:
+        dict: {"status": 200, "result": ...} or {"status": <error status>, "error": ...}
+    """
+    if not isinstance(record, dict):
+        return {"status": status.HTTP_422_UNPROCESSABLE_ENTITY, "error": "Record should be a JSON object"}
+
+    mode = record.get("mode") or mode
+
+    if "address" in record:
+        if mode not in ("basic", "advanced") or not isinstance(record["address"], str):
+            return {"status": status.HTTP_422_UNPROCESSABLE_ENTITY, "error": f"Invalid unstructured record (mode '{mode}')"}
+        res = await geocode_unstructured_async(pelias, record["address"], mode, with_pelias_result,
+                                               fan_out=fan_out, concurrent_unstruct=concurrent_unstruct, deadline=deadline)
+    else:
+        if mode not in ("basic", "simple", "advanced"):
+            return {"status": status.HTTP_422_UNPROCESSABLE_ENTITY, "error": f"Invalid mode '{mode}'"}
+        # Numbers (houseNumber, postCode) are accepted, as in the CSV files we usually receive
+        street_name, house_number, post_code, post_name = [None if record.get(f) is None else str(record[f]) for f in STREAM_STRUCT_FIELDS]
+        res = await geocode_async(pelias, street_name, house_number, post_code, post_name, mode, with_pelias_result,
+                                  fan_out=fan_out, concurrent_unstruct=concurrent_unstruct, deadline=deadline)
+
+    if "status_code" in res:
+        return {"status": res["status_code"], "error": res["error"]}
+    return {"status": status.HTTP_200_OK, "result": res}
+
+
+async def geocode_stream_async(pelias, records, mode, with_pelias_result, concurrency=10,
+                               fan_out=1, concurrent_unstruct=False, get_deadline=None):
+    """ see _geocode_stream
+
+    Results are yielded as soon as they are available (not in input order). At most 'concurrency'
+    records are in progress (or waiting to be consumed) at any time: when the consumer is slower
+    than geocoding, records stop being read from 'records' (backpressure)
+
+    Args:
+        pelias (AsyncPelias): Pelias object
+        records (async iterable): records (dict, see geocode_record_async), or exceptions for records that could not be parsed
+        mode, with_pelias_result, concurrency, fan_out, concurrent_unstruct, get_deadline: see geocode_batch_async
+
+    Yields:
+        dict: {"index": <position in records>, "status": ..., "result"/"error": ...} (and "id" if the record has one)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results = asyncio.Queue(maxsize=concurrency)
+    tasks = set()
+
+    async def geocode_one(index, record):
+        try:
+            if isinstance(record, Exception):
+                res = {"status": status.HTTP_422_UNPROCESSABLE_ENTITY, "error": f"Cannot parse record: {record}"}
+            else:
+                res = await geocode_record_async(pelias, record, mode, with_pelias_result,
+                                                 fan_out=fan_out, concurrent_unstruct=concurrent_unstruct,
+                                                 deadline=get_deadline() if get_deadline else None)
+        except Exception as exc:
+            log(f"Exception during stream process: {exc}")
+            res = {"status": status.HTTP_500_INTERNAL_SERVER_ERROR, "error": str(exc)}
+
+        res = {"index": index} | res
+        if isinstance(record, dict) and "id" in record:
+            res["id"] = record["id"]
+
+        await results.put(res)
+        semaphore.release()
+
+    async def read_records():
+        index = 0
+        try:
+            async for record in records:
+                await semaphore.acquire()
+                task = asyncio.create_task(geocode_one(index, record))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                index += 1
+            await asyncio.gather(*tasks)
+        except Exception:
+            await results.put(None)  # Stops the consumer, which then gets the exception
+            raise
+        await results.put(None)
+
+    reader = asyncio.create_task(read_records())
+    try:
+        while True:
+            res = await results.get()
+            if res is None:
+                break
+            yield res
+        await reader  # Raises exception from the input stream, if any
+    finally:
+        # Client disconnected (or input stream failed): stop everything
+        reader.cancel()
+        for task in list(tasks):
+            task.cancel()
+
+
+def reverse_to_rest_guidelines(pelias_res, size, with_pelias_result):
+    """
+    Convert a reverse Pelias result (with size*2 features) into REST Guideline,
+    keeping only the first 'size' distinct items
+    """
+    res = to_rest_guidelines(pelias_res, with_pelias_result)
+    res["items"] = res["items"][0:size]
+    res["total"] = len(res["items"])
+    return res
+
+
+def local_reverse(pelias, lat, lon, radius, size, with_pelias_result):
+    """
+    Reverse geocoding with the local spatial index (see local_data.SpatialIndex), without calling Pelias
+    """
+    return to_rest_guidelines({"features": pelias.local_data.reverse.nearest(lat, lon, radius, size)}, with_pelias_result)
+
+
 def geocode_reverse(pelias, lat, lon, radius, size, with_pelias_result):
     """
     see _geocode_reverse
@@ -893,6 +1865,9 @@ def geocode_reverse(pelias, lat, lon, radius, size, with_pelias_result):
 
     log(f"Reverse geocode: ({lat}, {lon}) / radius: {radius} / size:{size} ")
 
+    if pelias.local_data.reverse is not None and pelias.local_data.reverse.serves(radius):
+        return local_reverse(pelias, lat, lon, radius, size, with_pelias_result)
+
     try:
         # Note: max size for Pelias = 40. But as most records are duplicated in Pelias (one record in each languages for bilingual regions,
         # we first take twice too many results)
@@ -901,10 +1876,7 @@ def geocode_reverse(pelias, lat, lon, radius, size, with_pelias_result):
                                     radius=radius,
                                     size=size*2)
 
-        res = to_rest_guidelines(pelias_res, with_pelias_result)
-        res["items"] = res["items"][0:size]
-        res["total"] = len(res["items"])
-        return res
+        return reverse_to_rest_guidelines(pelias_res, size, with_pelias_result)
     except PeliasException as exc:
         log("Exception during process: ")
         log(exc)
@@ -912,9 +1884,64 @@ def geocode_reverse(pelias, lat, lon, radius, size, with_pelias_result):
                 "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR}
 
 
-def search_city(es_client, post_code, city_name):
+async def geocode_reverse_async(pelias, lat, lon, radius, size, with_pelias_result):
+    """
+    Asyncio version of geocode_reverse (pelias being an AsyncPelias object)
+    """
+
+    log(f"Reverse geocode: ({lat}, {lon}) / radius: {radius} / size:{size} ")
+
+    if pelias.local_data.reverse is not None and pelias.local_data.reverse.serves(radius):
+        return local_reverse(pelias, lat, lon, radius, size, with_pelias_result)
+
+    try:
+        # See geocode_reverse for size*2
+        pelias_res = await pelias.reverse(lat=lat,
+                                          lon=lon,
+                                          radius=radius,
+                                          size=size*2)
+
+        return reverse_to_rest_guidelines(pelias_res, size, with_pelias_result)
+    except PeliasException as exc:
+        log("Exception during process: ")
+        log(exc)
+        return {"error": str(exc),
+                "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR}
+
+
+async def geocode_reverse_batch_async(pelias, points, radius, size, with_pelias_result, concurrency=10):
+    """ see _geocode_reverse_batch
+
+    Args:
+        pelias (AsyncPelias): Pelias object
+        points (list): list of (lat, lon)
+        radius, size, with_pelias_result: see geocode_reverse
+        concurrency (int): maximum number of points sent to Pelias at the same time (without local spatial index)
+
+    Returns:
+        list: one item per point, in input order: {"status": 200, "result": <reverse result>}
+              or {"status": <error status>, "error": <message>}
+    """
+    if pelias.local_data.reverse is not None and pelias.local_data.reverse.serves(radius):
+        results = [to_rest_guidelines({"features": features}, with_pelias_result)
+                   for features in pelias.local_data.reverse.nearest_many(points, radius, size)]
+    else:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def reverse_one(lat, lon):
+            async with semaphore:
+                return await geocode_reverse_async(pelias, lat, lon, radius, size, with_pelias_result)
+
+        results = await asyncio.gather(*[reverse_one(lat, lon) for lat, lon in points])
+
+    return [{"status": res["status_code"], "error": res["error"]} if "status_code" in res else {"status": status.HTTP_200_OK, "result": res}
+            for res in results]
+
+
+def search_city(es_client, post_code, city_name, localities=None):
     """
     see _search_city
+    localities: local_data.LocalityTable. If given, used instead of Elasticsearch
     """
     vlog("search city")
 
@@ -924,6 +1951,9 @@ def search_city(es_client, post_code, city_name):
         return {"error": "Either 'postCode' or 'cityName' should be provided",
                 "status_code": status.HTTP_422_UNPROCESSABLE_ENTITY}
 
+    if localities is not None:
+        return to_rest_guidelines({"features": localities.search(post_code, city_name)}, False)
+
     must = [{"term": {"layer": "locality"}}]
     if post_code:
         must.append({"term": {"address_parts.zip": post_code}})
@@ -979,7 +2009,7 @@ def get_by_id(pelias, bestid):
 
     log(f"Get by id: {bestid}")
 
-    client = Elasticsearch(pelias.elastic_api)
+    client = pelias.elastic
 
     mtch, bestid = bestid  # check_valid_bestid result
 
@@ -999,6 +2029,10 @@ def get_by_id(pelias, bestid):
         return {"error": f"Object type '{mtch[3]}' not supported so far in '{bestid}'",
                 "status_code": status.HTTP_422_UNPROCESSABLE_ENTITY}
 
+    if pelias.local_data.ids is not None:
+        items = pelias.local_data.ids.lookup(obj_type, bestid)
+        return {"items": items, "total": len(items)}
+
     try:
         resp = client.search(index="pelias", body={
             "query": {
@@ -1043,12 +2077,12 @@ def get_by_id(pelias, bestid):
                 "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR}
 
 
-def health(pelias):
-    """Health status
-    """
-    # Checking Pelias
+def check_pelias_health(pelias_res):
+    """Health status according to the result of Pelias.check
 
-    pelias_res = pelias.check()
+    Returns:
+        dict or None: None if Pelias is up & running
+    """
 
     if pelias_res is False:
         log("Pelias not up & running")
@@ -1063,26 +2097,71 @@ def health(pelias):
                 "details": {"errorMessage": "Pelias server answers, but gives an unexpected answer",
                             "details": f"Pelias answer: {pelias_res}"},
                 "status_code": status.HTTP_503_SERVICE_UNAVAILABLE}
+    return None
 
-    # Checking Interpolation
 
-    try:
-        interp_res = pelias.interpolate(lat=50.83582,
-                                        lon=4.33844,
-                                        number=20,
-                                        street="Avenue Fonsny")
-        vlog(interp_res)
-        if len(interp_res) > 0 and "geometry" not in interp_res:
-            return {
-                "status": "DEGRADED",
-                "details": {
-                    "errorMessage": "Interpolation server answers, but gives an unexpected answer",
-                    "details": f"Interpolation answer: {interp_res}"
-                }}
-
-    except Exception as exc:
-        return {"status": "DEGRADED",
-                "details": {"errorMessage": "Interpolation server does not answer",
-                            "details": f"Interpolation server does not answer: {exc}"}}
+def check_interpolation_health(interp_res):
+    """Health status according to the result of a call to interpolation engine
 
+    Returns:
+        dict
+    """
+    vlog(interp_res)
+    if len(interp_res) > 0 and "geometry" not in interp_res:
+        return {
+            "status": "DEGRADED",
+            "details": {
+                "errorMessage": "Interpolation server answers, but gives an unexpected answer",
+                "details": f"Interpolation answer: {interp_res}"
+            }}
     return {"status": "UP"}
+
+
+def health(pelias):
+    """Health status, including the state of circuit breakers
+    """
+    # Checking Pelias
+
+    res = check_pelias_health(pelias.check())
+    if res is None:
+        # Checking Interpolation
+        try:
+            interp_res = pelias.interpolate(lat=50.83582,
+                                            lon=4.33844,
+                                            number=20,
+                                            street="Avenue Fonsny",
+                                            use_cache=False)
+            res = check_interpolation_health(interp_res)
+
+        except Exception as exc:
+            res = {"status": "DEGRADED",
+                   "details": {"errorMessage": "Interpolation server does not answer",
+                               "details": f"Interpolation server does not answer: {exc}"}}
+
+    res["circuitBreakers"] = pelias.get_circuit_breaker_states()
+    return res
+
+
+async def health_async(pelias):
+    """Asyncio version of health (pelias being an AsyncPelias object)
+    """
+    # Checking Pelias
+
+    res = check_pelias_health(await pelias.check())
+    if res is None:
+        # Checking Interpolation
+        try:
+            interp_res = await pelias.interpolate(lat=50.83582,
+                                                  lon=4.33844,
+                                                  number=20,
+                                                  street="Avenue Fonsny",
+                                                  use_cache=False)
+            res = check_interpolation_health(interp_res)
+
+        except Exception as exc:
+            res = {"status": "DEGRADED",
+                   "details": {"errorMessage": "Interpolation server does not answer",
+                               "details": f"Interpolation server does not answer: {exc}"}}
+
+    res["circuitBreakers"] = pelias.get_circuit_breaker_states()
+    return res
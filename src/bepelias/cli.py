@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Command line bulk geocoding with bePelias: geocode a CSV file (with columns
+streetName, houseNumber, postCode, postName) directly against Pelias, without
+going through the REST API.
+
+Usage: python -m bepelias -i data.csv -o result.csv [options] (see --help)
+
+Input is read by chunks, each chunk being geocoded by a pool of workers (processes or threads)
+and appended to the output file. After each chunk, a checkpoint file (<output>.checkpoint) is
+updated, allowing an interrupted run to be resumed by running the same command again.
+
+@author: Vandy Berten (vandy.berten@smals.be)
+
+"""
+import argparse
+import concurrent.futures
+import functools
+import json
+import logging
+import os
+import sys
+import time
+
+import pandas as pd
+
+from bepelias.base import geocode
+from bepelias.pelias import Pelias
+
+
+INPUT_FIELDS = ["streetName", "houseNumber", "postCode", "postName"]
+
+# Output column -> path in geocode result (first item). Name lists are tried in order (fr, nl, de)
+OUTPUT_FIELDS = {
+    "bestId": ["bestId"],
+    "precision": ["precision"],
+    "lat": ["coordinates", "lat"],
+    "lon": ["coordinates", "lon"],
+    "street": [["street", "name", "fr"], ["street", "name", "nl"], ["street", "name", "de"]],
+    "housenumber": ["housenumber"],
+    "postalCode": ["postalInfo", "postalCode"],
+    "municipalityCode": ["municipality", "code"],
+    "municipality": [["municipality", "name", "fr"], ["municipality", "name", "nl"], ["municipality", "name", "de"]],
+}
+OUTPUT_PREFIX = "bepelias_"
+
+logger = logging.getLogger("bepelias.cli")
+
+# Each worker (process or thread) uses the Pelias object of its process (shared among threads), created by init_worker
+worker_state = {}
+
+
+def init_worker(config):
+    """ Create the Pelias object of the current process (config: see Pelias.__init__)"""
+    worker_state["pelias"] = Pelias(**config)
+
+
+def get_path(res, path):
+    """ Value in res (nested dict) at path (list of keys), or None"""
+    for k in path:
+        if not isinstance(res, dict) or k not in res:
+            return None
+        res = res[k]
+    return res
+
+
+def flatten_result(res):
+    """ Convert a geocode result into an output row (dict)
+
+    Args:
+        res (dict): result of base.geocode
+
+    Returns:
+        dict: status ("ok", "no_result" or "error"), fields of the first item (see OUTPUT_FIELDS), and call details
+    """
+    if "error" in res:
+        return {"status": "error", "error": res["error"]}
+
+    if len(res.get("items", [])) == 0:
+        row = {"status": "no_result"}
+    else:
+        row = {"status": "ok"}
+        for col, path in OUTPUT_FIELDS.items():
+            if isinstance(path[0], list):
+                row[col] = next((v for v in (get_path(res["items"][0], p) for p in path) if v is not None), None)
+            else:
+                row[col] = get_path(res["items"][0], path)
+    row["total"] = res.get("total")
+    row["callType"] = res.get("callType")
+    row["peliasCallCount"] = res.get("peliasCallCount")
+    return row
+
+
+def geocode_row(record, mode):
+    """ Geocode a single input row
+
+    Args:
+        record (dict): input row, with (some of) INPUT_FIELDS
+        mode (str): basic, simple or advanced (see api._geocode)
+
+    Returns:
+        dict: see flatten_result
+    """
+    street_name, house_number, post_code, post_name = [record.get(f) for f in INPUT_FIELDS]
+    try:
+        res = geocode(worker_state["pelias"], street_name, house_number, post_code, post_name, mode, with_pelias_result=False)
+    except Exception as exc:
+        # An unexpected error on one row should not stop the whole file
+        logger.warning("Error on %s: %s", record, exc)
+        res = {"error": str(exc)}
+    return flatten_result(res)
+
+
+def read_checkpoint(checkpoint_file, input_file):
+    """ Number of input rows already processed, and size of the output file at that time
+
+    Returns:
+        tuple: (rows_done, output_size), (0, 0) if there is no checkpoint
+    """
+    if not os.path.exists(checkpoint_file):
+        return 0, 0
+    with open(checkpoint_file, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint["input"] != os.path.abspath(input_file):
+        raise ValueError(f"Checkpoint {checkpoint_file} refers to another input file ({checkpoint['input']})")
+    return checkpoint["rows_done"], checkpoint["output_size"]
+
+
+def write_checkpoint(checkpoint_file, input_file, rows_done, output_size):
+    """ Atomically write the checkpoint file"""
+    tmp_file = f"{checkpoint_file}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump({"input": os.path.abspath(input_file),
+                   "rows_done": rows_done,
+                   "output_size": output_size}, f)
+    os.replace(tmp_file, checkpoint_file)
+
+
+def geocode_file(input_file, output_file, mode="advanced", nb_workers=4, executor="process", chunk_size=1000,
+                 pelias_kwargs=None, restart=False):
+    """ Geocode all rows of input_file into output_file (see module doc)
+
+    Args:
+        input_file (str): CSV file with (some of) INPUT_FIELDS as columns
+        output_file (str): CSV file with input columns and OUTPUT_PREFIX columns
+        mode (str): basic, simple or advanced
+        nb_workers (int): number of workers
+        executor (str): "process" or "thread"
+        chunk_size (int): number of rows read (and written) at once
+        pelias_kwargs (dict): arguments to Pelias constructor
+        restart (bool): ignore existing checkpoint and start from the first row
+
+    Returns:
+        int: number of rows processed during this run
+    """
+    checkpoint_file = f"{output_file}.checkpoint"
+
+    rows_done, output_size = (0, 0) if restart else read_checkpoint(checkpoint_file, input_file)
+
+    if rows_done > 0 and (not os.path.exists(output_file) or os.path.getsize(output_file) < output_size):
+        logger.warning("Output file %s missing or shorter than at the last checkpoint: restarting from the first row", output_file)
+        rows_done, output_size = 0, 0
+
+    if rows_done > 0:
+        logger.info("Resuming after %s rows", rows_done)
+        with open(output_file, "r+b") as f:  # Remove rows written after the last checkpoint
+            f.truncate(output_size)
+    elif os.path.exists(output_file):
+        os.remove(output_file)
+
+    if executor == "process":  # Each process creates its own Pelias object
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=nb_workers, initializer=init_worker, initargs=(pelias_kwargs or {},))
+    else:  # Threads share the Pelias object of this process
+        init_worker(pelias_kwargs or {})
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=nb_workers)
+
+    start_time = time.time()
+    nb_rows = 0
+    with pool:
+        chunks = pd.read_csv(input_file, dtype=str, keep_default_na=False, chunksize=chunk_size,
+                             skiprows=range(1, rows_done + 1))
+        for chunk in chunks:
+            records = [{k: v.strip() or None for k, v in rec.items() if k in INPUT_FIELDS} for rec in chunk.to_dict("records")]
+
+            results = pool.map(functools.partial(geocode_row, mode=mode), records,
+                               chunksize=max(1, len(records) // (nb_workers * 4)))
+            results = pd.DataFrame(list(results), index=chunk.index, columns=["status"] + list(OUTPUT_FIELDS) + ["total", "callType", "peliasCallCount", "error"])
+
+            output = pd.concat([chunk, results.add_prefix(OUTPUT_PREFIX)], axis=1)
+            with open(output_file, "a", encoding="utf-8", newline="") as f:
+                output.to_csv(f, index=False, header=(rows_done == 0))
+                f.flush()
+                os.fsync(f.fileno())
+                output_size = f.tell()
+
+            rows_done += len(chunk)
+            nb_rows += len(chunk)
+            write_checkpoint(checkpoint_file, input_file, rows_done, output_size)
+
+            logger.info("%s rows done (%.1f rows/s)", rows_done, nb_rows / (time.time() - start_time))
+
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    logger.info("Done: %s rows geocoded in %.1fs, written in %s", nb_rows, time.time() - start_time, output_file)
+    return nb_rows
+
+
+def main(argv=None):
+    """ Command line entry point"""
+    parser = argparse.ArgumentParser(prog="bepelias",
+                                     description="Geocode a CSV file (with columns streetName, houseNumber, postCode, postName) with bePelias. "
+                                                 "An interrupted run is resumed by running the same command again.")
+    parser.add_argument("-i", "--input", required=True, help="Input CSV file")
+    parser.add_argument("-o", "--output", required=True, help="Output CSV file")
+    parser.add_argument("-m", "--mode", choices=["basic", "simple", "advanced"], default="advanced", help="Geocoding mode (default: advanced)")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Number of workers (default: 4)")
+    parser.add_argument("--executor", choices=["process", "thread"], default="process", help="Kind of workers (default: process)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Number of rows read and written at once (default: 1000)")
+    parser.add_argument("--restart", action="store_true", help="Ignore checkpoint, and restart from the first row")
+    parser.add_argument("--pelias-host", default=os.getenv("PELIAS_HOST"), help="Pelias API host:port (default: $PELIAS_HOST)")
+    parser.add_argument("--pelias-es-host", default=os.getenv("PELIAS_ES_HOST"), help="Pelias Elasticsearch host:port (default: $PELIAS_ES_HOST)")
+    parser.add_argument("--pelias-interpol-host", default=os.getenv("PELIAS_INTERPOL_HOST"),
+                        help="Pelias interpolation host:port (default: $PELIAS_INTERPOL_HOST)")
+    parser.add_argument("--cache-size", type=int, default=int(os.getenv("PELIAS_CACHE_SIZE", "0")),
+                        help="Pelias response cache size, per process (default: $PELIAS_CACHE_SIZE or 0)")
+    parser.add_argument("--cache-version-file", default=os.getenv("PELIAS_CACHE_VERSION_FILE") or None,
+                        help="Data version marker file: the cache is emptied when it is touched (default: $PELIAS_CACHE_VERSION_FILE)")
+    parser.add_argument("--best-data-dir", default=os.getenv("BEST_DATA_DIR") or None,
+                        help="Directory with local BeSt address files, used for exact matches (default: $BEST_DATA_DIR)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log details of geocoding")
+    args = parser.parse_args(argv)
+
+    for arg in ["pelias_host", "pelias_es_host", "pelias_interpol_host"]:
+        if not getattr(args, arg):
+            parser.error(f"Missing --{arg.replace('_', '-')} (or environment variable {arg.upper()})")
+
+    logging.basicConfig(format='[%(asctime)s]  %(message)s', stream=sys.stdout)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    logger.setLevel(logging.INFO)
+    for lib in ["urllib3", "elasticsearch"]:
+        logging.getLogger(lib).setLevel(logging.WARNING)
+
+    geocode_file(args.input, args.output, mode=args.mode, nb_workers=args.workers, executor=args.executor,
+                 chunk_size=args.chunk_size, restart=args.restart,
+                 pelias_kwargs={"domain_api": args.pelias_host,
+                                "domain_elastic": args.pelias_es_host,
+                                "domain_interpol": args.pelias_interpol_host,
+                                "pool_size": args.workers,
+                                "cache_size": args.cache_size,
+                                "cache_version_file": args.cache_version_file,
+                                "best_data_dir": args.best_data_dir})
+
+
+if __name__ == "__main__":
+    main()
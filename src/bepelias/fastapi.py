@@ -7,13 +7,19 @@ Fastapi part of bePelias geocoder
 @author: Vandy Berten (vandy.berten@smals.be)
 
 """
+import concurrent.futures
+import json
+import multiprocessing
 import os
 import sys
+import tempfile
+import time
 
 import warnings
 import re
 
-from urllib.parse import unquote_plus
+from contextlib import asynccontextmanager
+from urllib.parse import unquote_plus, urlencode
 
 from typing import Annotated, Union
 # from enum import Enum
@@ -21,23 +27,28 @@ from typing import Annotated, Union
 import logging
 
 from fastapi import FastAPI, Query, Path, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.openapi.utils import get_openapi
-from fastapi.responses import RedirectResponse
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from starlette.requests import ClientDisconnect
 from typing_extensions import Literal
 from pydantic import AfterValidator
 
-from elasticsearch import Elasticsearch
 from elasticsearch.exceptions import ElasticsearchWarning
 
 from bepelias.base import log
-from bepelias.base import (geocode, geocode_reverse, geocode_unstructured,
-                           get_by_id, search_city, health)
+from bepelias.base import (geocode_async, geocode_batch_async, geocode_stream_async, geocode_reverse_async, geocode_reverse_batch_async,
+                           geocode_unstructured_async, get_by_id, search_city, health_async, struct_unstruct_stats)
 
-from bepelias.model import (GeocodeOutput, BePeliasError, Health,
-                            ReverseGeocodeOutput, SearchCityOutput,
+from bepelias.model import (GeocodeOutput, BatchGeocodeInput, BatchGeocodeOutput, BePeliasError, Health, JobOutput,
+                            ReverseGeocodeOutput, BatchReverseInput, BatchReverseOutput, SearchCityOutput,
                             GetByIdOutput, BESTID_PATTERN)
 
-from bepelias.pelias import Pelias
+from bepelias.pelias import AsyncPelias
+from bepelias.utils import similarity_stats
+from bepelias.normalization import get_normalization_stats
+from bepelias.jobs import (JOB_ID_PATTERN, OUTPUT_FILE, create_job, fail_upload, submit_job, get_job, get_job_file,
+                           delete_job, clean_jobs)
 
 logging.basicConfig(format='[%(asctime)s]  %(message)s', stream=sys.stdout)
 
@@ -98,9 +109,88 @@ else:
     sys.exit(1)
 
 
-pelias = Pelias(domain_api=pelias_host,
-                domain_elastic=pelias_es_host,
-                domain_interpol=pelias_interpol_host)
+pelias_pool_size = int(os.getenv('PELIAS_POOL_SIZE', "10"))
+pelias_connect_timeout = float(os.getenv('PELIAS_CONNECT_TIMEOUT', "2"))
+pelias_read_timeout = float(os.getenv('PELIAS_READ_TIMEOUT', "30"))
+logging.debug("Pelias connection pools: size %s, connect timeout %ss, read timeout %ss",
+              pelias_pool_size, pelias_connect_timeout, pelias_read_timeout)
+
+pelias_cache_size = int(os.getenv('PELIAS_CACHE_SIZE', "0"))
+pelias_cache_ttl = float(os.getenv('PELIAS_CACHE_TTL', "3600"))
+pelias_cache_version_file = os.getenv('PELIAS_CACHE_VERSION_FILE', "") or None
+logging.debug("Pelias response cache: size %s, ttl %ss, data version file %s", pelias_cache_size, pelias_cache_ttl, pelias_cache_version_file)
+
+pelias_breaker_threshold = int(os.getenv('PELIAS_BREAKER_THRESHOLD', "5"))
+pelias_breaker_reset_timeout = float(os.getenv('PELIAS_BREAKER_RESET_TIMEOUT', "30"))
+logging.debug("Pelias circuit breakers: open after %s failures, for %ss",
+              pelias_breaker_threshold, pelias_breaker_reset_timeout)
+
+elastic_pool_size = int(os.getenv('ELASTIC_POOL_SIZE', "10"))
+elastic_timeout = float(os.getenv('ELASTIC_TIMEOUT', "10"))
+logging.debug("Elasticsearch client: pool size %s, timeout %ss", elastic_pool_size, elastic_timeout)
+
+geocode_timeout = float(os.getenv('GEOCODE_TIMEOUT', "0"))
+logging.debug("Default geocoding timeout: %ss", geocode_timeout)
+
+advanced_fan_out = int(os.getenv('ADVANCED_FAN_OUT', "1"))
+logging.debug("Advanced mode fan-out: %s", advanced_fan_out)
+
+concurrent_unstruct = os.getenv('CONCURRENT_UNSTRUCT', "false").lower() in ("true", "1", "yes")
+logging.debug("Concurrent structured/unstructured calls: %s", concurrent_unstruct)
+
+batch_max_size = int(os.getenv('BATCH_MAX_SIZE', "1000"))
+batch_concurrency = int(os.getenv('BATCH_CONCURRENCY', "10"))
+logging.debug("Batch geocoding: at most %s addresses per call, %s geocoded concurrently", batch_max_size, batch_concurrency)
+
+job_dir = os.getenv('JOB_DIR', os.path.join(tempfile.gettempdir(), "bepelias_jobs"))
+job_workers = int(os.getenv('JOB_WORKERS', "1"))
+job_threads = int(os.getenv('JOB_THREADS', "4"))
+job_retention = int(os.getenv('JOB_RETENTION', "86400"))
+logging.debug("Geocoding jobs: directory %s, %s jobs at once, %s threads per job, kept %s seconds", job_dir, job_workers, job_threads, job_retention)
+
+best_data_dir = os.getenv('BEST_DATA_DIR', "") or None
+logging.debug("Local BeSt data directory: %s", best_data_dir)
+
+pelias = AsyncPelias(domain_api=pelias_host,
+                     domain_elastic=pelias_es_host,
+                     domain_interpol=pelias_interpol_host,
+                     pool_size=pelias_pool_size,
+                     connect_timeout=pelias_connect_timeout,
+                     read_timeout=pelias_read_timeout,
+                     cache_size=pelias_cache_size,
+                     cache_ttl=pelias_cache_ttl,
+                     cache_version_file=pelias_cache_version_file,
+                     breaker_threshold=pelias_breaker_threshold,
+                     breaker_reset_timeout=pelias_breaker_reset_timeout,
+                     elastic_pool_size=elastic_pool_size,
+                     elastic_timeout=elastic_timeout,
+                     best_data_dir=best_data_dir)
+
+
+# Geocoding jobs are run by their own processes (not by the API workers), with their own (synchronous) Pelias object
+job_pelias_kwargs = {"domain_api": pelias_host,
+                     "domain_elastic": pelias_es_host,
+                     "domain_interpol": pelias_interpol_host,
+                     "pool_size": job_threads,
+                     "connect_timeout": pelias_connect_timeout,
+                     "read_timeout": pelias_read_timeout,
+                     "cache_size": pelias_cache_size,
+                     "cache_ttl": pelias_cache_ttl,
+                     "cache_version_file": pelias_cache_version_file,
+                     "breaker_threshold": pelias_breaker_threshold,
+                     "breaker_reset_timeout": pelias_breaker_reset_timeout,
+                     "best_data_dir": best_data_dir}
+# Each API worker has its own pool (of processes started on demand), but only job_workers jobs run at the
+# same time for all API workers together (job slots in job_dir, see jobs.acquire_job_slot)
+job_executor = concurrent.futures.ProcessPoolExecutor(max_workers=job_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """ Close connections to Pelias (and stop job processes) on shutdown"""
+    yield
+    job_executor.shutdown(wait=False, cancel_futures=True)
+    await pelias.close()
 
 
 app = FastAPI(version='1.0.0',
@@ -116,9 +206,18 @@ app = FastAPI(version='1.0.0',
                 "url": "https://www.smalsresearch.be",
                 "email": "vandy.berten@smals.be"
               },
+              lifespan=lifespan,
               )
 
 
+def get_deadline(timeout):
+    """Deadline (time.monotonic() value) of a request, from its timeout parameter
+    (or GEOCODE_TIMEOUT if not given). None if no timeout applies"""
+    if timeout is None:
+        timeout = geocode_timeout
+    return time.monotonic() + timeout if timeout > 0 else None
+
+
 @app.get("/doc", include_in_schema=False)
 async def redirect():
     """ redirect /doc to /docs"""
@@ -139,48 +238,60 @@ async def redirect():
                 status.HTTP_500_INTERNAL_SERVER_ERROR: {
                     "model": BePeliasError,
                     "description": "In case an error occurred"
+                },
+                status.HTTP_504_GATEWAY_TIMEOUT: {
+                    "model": BePeliasError,
+                    "description": "Timeout reached before any result could be found"
                 }
             })
-def _geocode(street_name: Annotated[
-                            Union[str, None],
-                            Query(description="The name of a passage or way through from one location to another (cf. Fedvoc).",
-                                  example='Avenue Fonsny',
-                                  alias="streetName")] = None,
-             house_number: Annotated[
-                            Union[str, None],
-                            Query(description="An official alphanumeric code assigned to building units, mooring places, stands or parcels (cf. Fedvoc).",
-                                  example='20',
-                                  alias="houseNumber")] = None,
-             post_code: Annotated[
-                            Union[str, None],
-                            Query(description="The post code (a.k.a postal code, zip code etc.) (cf. Fedvoc).",
-                                  example='1060',
-                                  alias="postCode")] = None,
-             post_name: Annotated[
-                            Union[str, None],
-                            Query(description="Name with which the geographical area that groups the addresses for postal purposes can be indicated, usually the city (cf. Fedvoc).",
-                                  example='Saint-Gilles',
-                                  alias="postName")] = None,
-             mode: Annotated[
-                 Literal["basic", "simple", "advanced"],
-                 Query(description="""
+async def _geocode(street_name: Annotated[
+                                  Union[str, None],
+                                  Query(description="The name of a passage or way through from one location to another (cf. Fedvoc).",
+                                        example='Avenue Fonsny',
+                                        alias="streetName")] = None,
+                   house_number: Annotated[
+                                  Union[str, None],
+                                  Query(description="An official alphanumeric code assigned to building units, mooring places, stands or parcels (cf. Fedvoc).",
+                                        example='20',
+                                        alias="houseNumber")] = None,
+                   post_code: Annotated[
+                                  Union[str, None],
+                                  Query(description="The post code (a.k.a postal code, zip code etc.) (cf. Fedvoc).",
+                                        example='1060',
+                                        alias="postCode")] = None,
+                   post_name: Annotated[
+                                  Union[str, None],
+                                  Query(description="Name with which the geographical area that groups the addresses for postal purposes can be indicated, usually the city (cf. Fedvoc).",
+                                        example='Saint-Gilles',
+                                        alias="postName")] = None,
+                   mode: Annotated[
+                       Literal["basic", "simple", "advanced"],
+                       Query(description="""
 How Pelias is used:
 
 - basic: Just call the structured version of Pelias
 - simple: Call the structured version of Pelias. If it does not get any result, call the unstructured version
 - advanced: Try several variants until it gives a result""")] = "advanced",
-             with_pelias_result: Annotated[
-                bool,
-                Query(description="If True, return Pelias result as such in 'peliasRaw'.",
-                      alias="withPeliasResult")
-            ] = False,
-            request: Request = None,
-            response: Response = None):
+                   with_pelias_result: Annotated[
+                      bool,
+                      Query(description="If True, return Pelias result as such in 'peliasRaw'.",
+                            alias="withPeliasResult")
+                  ] = False,
+                   timeout: Annotated[
+                      Union[float, None],
+                      Query(description="Maximal processing time, in seconds. When reached, the best result found so far is returned "
+                                        "(with 'deadlineExceeded': true). Default: server configuration (possibly no limit).",
+                            gt=0,
+                            example=10)
+                  ] = None,
+                   request: Request = None,
+                   response: Response = None):
     """ Single address geocoding"""
 
     log(f"Geocode ({mode}): {street_name} / {house_number} / {post_code} / {post_name}")
 
-    res = geocode(pelias, street_name, house_number, post_code, post_name, mode, with_pelias_result)
+    res = await geocode_async(pelias, street_name, house_number, post_code, post_name, mode, with_pelias_result,
+                              fan_out=advanced_fan_out, concurrent_unstruct=concurrent_unstruct, deadline=get_deadline(timeout))
 
     if "status_code" in res:
         response.status_code = res["status_code"]
@@ -188,6 +299,151 @@ How Pelias is used:
 
     return res
 
+####################
+#  /geocode/batch  #
+####################
+
+
+@app.post("/geocode/batch", response_model_exclude_none=True, responses={
+                status.HTTP_200_OK: {
+                    "model": BatchGeocodeOutput,
+                    "description": "Model in case of success (see 'status' in each item for the result of each address)"
+                },
+                413: {
+                    "model": BePeliasError,
+                    "description": "Too many addresses in a single call"
+                }
+            })
+async def _geocode_batch(batch: BatchGeocodeInput,
+                         request: Request = None,
+                         response: Response = None):
+    """ Batch geocoding of structured addresses.
+
+Each address is geocoded as with /geocode. Results are given in input order, each of them with the HTTP status /geocode would have given
+(200, 500 or 504) and either a 'result' (same model as /geocode) or an 'error'.
+    """
+
+    log(f"Geocode batch ({batch.mode}): {len(batch.addresses)} addresses")
+
+    if len(batch.addresses) > batch_max_size:
+        response.status_code = 413  # Content Too Large (constant name depends on Starlette version)
+        return {"error": f"Too many addresses ({len(batch.addresses)}). Maximum: {batch_max_size}"}
+
+    addresses = [{"street_name": addr.streetName,
+                  "house_number": addr.houseNumber,
+                  "post_code": addr.postCode,
+                  "post_name": addr.postName,
+                  "mode": addr.mode} for addr in batch.addresses]
+
+    items = await geocode_batch_async(pelias, addresses, batch.mode, batch.withPeliasResult,
+                                      concurrency=batch_concurrency,
+                                      fan_out=advanced_fan_out, concurrent_unstruct=concurrent_unstruct,
+                                      get_deadline=lambda: get_deadline(batch.timeout))
+
+    # 'self' of each result: equivalent /geocode call
+    geocode_url = request.url.replace(path=request.url.path.removesuffix("/batch"))
+    for addr, item in zip(batch.addresses, items):
+        if "result" in item:
+            params = {"mode": addr.mode or batch.mode,
+                      "streetName": addr.streetName, "houseNumber": addr.houseNumber,
+                      "postCode": addr.postCode, "postName": addr.postName}
+            item["result"]["self"] = str(geocode_url.replace(query=urlencode({k: v for k, v in params.items() if v is not None})))
+
+    return {"self": str(request.url),
+            "items": items,
+            "total": len(items)}
+
+#####################
+#  /geocode/stream  #
+#####################
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse sent while the request body is still being read.
+
+    StreamingResponse (with ASGI spec < 2.4) watches for client disconnection by reading request messages,
+    hence consuming the request body. Here, a disconnection is detected while reading the body (ClientDisconnect)
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
+async def read_ndjson(request):
+    """Parse the body of a request, line by line, as NDJSON (without loading the whole body).
+    Yields a dict per non empty line, or the exception if it is not valid JSON"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as exc:
+                    yield exc
+    if buffer.strip():
+        try:
+            yield json.loads(buffer)
+        except ValueError as exc:
+            yield exc
+
+
+@app.post("/geocode/stream",
+          responses={
+              status.HTTP_200_OK: {
+                  "content": {"application/x-ndjson": {}},
+                  "description": "One JSON object per line and per input record, as soon as it is geocoded (hence not in input order): "
+                                 "'index' (position of the record in input), 'id' (if given in input), 'status' (200, 422, 500 or 504), "
+                                 "and either 'result' (same model as /geocode) or 'error'"
+              }
+          },
+          openapi_extra={
+              "requestBody": {
+                  "content": {"application/x-ndjson": {"schema": {"type": "string"},
+                                                       "example": '{"id": 1, "streetName": "Avenue Fonsny", "houseNumber": "20", "postCode": "1060", "postName": "Saint-Gilles"}\n'
+                                                                  '{"id": 2, "address": "Avenue Fonsny 20, 1060 Saint-Gilles"}\n'}},
+                  "required": True
+              }
+          })
+async def _geocode_stream(mode: Annotated[
+                             Literal["basic", "simple", "advanced"],
+                             Query(description="Mode for records without their own 'mode' (see /geocode). "
+                                               "For unstructured records, 'simple' is not allowed")] = "advanced",
+                          with_pelias_result: Annotated[
+                             bool,
+                             Query(description="If True, return Pelias result as such in 'peliasRaw'.",
+                                   alias="withPeliasResult")
+                          ] = False,
+                          timeout: Annotated[
+                             Union[float, None],
+                             Query(description="Maximal processing time of each record, in seconds (see /geocode). "
+                                               "Default: server configuration (possibly no limit).",
+                                   gt=0,
+                                   example=10)
+                          ] = None,
+                          request: Request = None):
+    """ Bulk geocoding of an NDJSON stream.
+
+Each line of the body is a record: either a structured address (streetName, houseNumber, postCode, postName, as /geocode)
+or an unstructured one (address, as /geocode/unstructured), with optionally its own 'mode' and an 'id' copied in its result.
+
+Results are streamed back (NDJSON) as soon as they are available. The body is read as results are consumed,
+so that very large inputs can be sent in a single call.
+    """
+
+    log(f"Geocode stream ({mode})")
+
+    results = geocode_stream_async(pelias, read_ndjson(request), mode, with_pelias_result,
+                                   concurrency=batch_concurrency,
+                                   fan_out=advanced_fan_out, concurrent_unstruct=concurrent_unstruct,
+                                   get_deadline=lambda: get_deadline(timeout))
+
+    async def to_ndjson():
+        async for res in results:
+            yield json.dumps(res) + "\n"
+
+    return DuplexStreamingResponse(to_ndjson(), media_type="application/x-ndjson")
+
 ###########################
 #  /geocode/unstructured  #
 ###########################
@@ -201,30 +457,43 @@ How Pelias is used:
                 status.HTTP_500_INTERNAL_SERVER_ERROR: {
                     "model": BePeliasError,
                     "description": "In case an error occurred"
+                },
+                status.HTTP_504_GATEWAY_TIMEOUT: {
+                    "model": BePeliasError,
+                    "description": "Timeout reached before any result could be found"
                 }
             })
-def _geocode_unstructured(address: Annotated[str,
-                                             Query(description="The whole address in a single string",
-                                                   example='Avenue Fonsny 20, 1060 Saint-Gilles')],
-                          mode: Annotated[
-                             Literal["basic", "advanced"],
-                             Query(description="""
+async def _geocode_unstructured(address: Annotated[str,
+                                                   Query(description="The whole address in a single string",
+                                                         example='Avenue Fonsny 20, 1060 Saint-Gilles')],
+                                mode: Annotated[
+                                   Literal["basic", "advanced"],
+                                   Query(description="""
 How Pelias is used:
 
 - basic: Just call the structured version of Pelias
 - advanced: Try several variants until it gives a result""")] = "advanced",
-                          with_pelias_result: Annotated[
-                            bool,
-                            Query(description="If True, return Pelias result as such in 'peliasRaw'.",
-                                  alias="withPeliasResult")
-                         ] = False,
-                          request: Request = None,
-                          response: Response = None):
+                                with_pelias_result: Annotated[
+                                  bool,
+                                  Query(description="If True, return Pelias result as such in 'peliasRaw'.",
+                                        alias="withPeliasResult")
+                               ] = False,
+                                timeout: Annotated[
+                                  Union[float, None],
+                                  Query(description="Maximal processing time, in seconds. When reached, the best result found so far is returned "
+                                                    "(with 'deadlineExceeded': true). Default: server configuration (possibly no limit).",
+                                        gt=0,
+                                        example=10)
+                               ] = None,
+                                request: Request = None,
+                                response: Response = None):
     """ Single (unstructured) address geocoding
     """
 
     log(f"Geocode (unstruct - {mode}): {address}")
-    res = geocode_unstructured(pelias, address, mode, with_pelias_result)
+    res = await geocode_unstructured_async(pelias, address, mode, with_pelias_result,
+                                           fan_out=advanced_fan_out, concurrent_unstruct=concurrent_unstruct,
+                                           deadline=get_deadline(timeout))
 
     if "status_code" in res:
         response.status_code = res["status_code"]
@@ -247,32 +516,32 @@ How Pelias is used:
                     "description": "In case an error occurred"
                 }
             })
-def _geocode_reverse(lat: Annotated[float, Query(description="Latitude, in EPSG:4326. Angular distance from some specified circle or plane of reference",
-                                                 gt=49.49, lt=51.51,
-                                                 example=50.83582)],
-                     lon: Annotated[float, Query(description="Longitude, in EPSG:4326. Angular distance measured on a great circle of reference from the intersection " +
-                                                             "of the adopted zero meridian with this reference circle to the similar intersection of the meridian passing through the object",
-                                                 gt=2.4, lt=6.41,
-                                                 example=4.33844)],
-                     radius: Annotated[float, Query(description="Distance (in kilometers)",
-                                                    gt=0, lt=350,
-                                                    example=1)] = 1,
-                     size: Annotated[int, Query(description="Maximal number of results (default: 10; maximum: 20)",
-                                                gt=0, lt=20,
-                                                example=10)] = 10,
-                     with_pelias_result: Annotated[
-                            bool,
-                            Query(description="If True, return Pelias result as such in 'peliasRaw'.",
-                                  alias="withPeliasResult")
-                         ] = False,
-                     request: Request = None,
-                     response: Response = None):
+async def _geocode_reverse(lat: Annotated[float, Query(description="Latitude, in EPSG:4326. Angular distance from some specified circle or plane of reference",
+                                                       gt=49.49, lt=51.51,
+                                                       example=50.83582)],
+                           lon: Annotated[float, Query(description="Longitude, in EPSG:4326. Angular distance measured on a great circle of reference from the intersection " +
+                                                                   "of the adopted zero meridian with this reference circle to the similar intersection of the meridian passing through the object",
+                                                       gt=2.4, lt=6.41,
+                                                       example=4.33844)],
+                           radius: Annotated[float, Query(description="Distance (in kilometers)",
+                                                          gt=0, lt=350,
+                                                          example=1)] = 1,
+                           size: Annotated[int, Query(description="Maximal number of results (default: 10; maximum: 20)",
+                                                      gt=0, lt=20,
+                                                      example=10)] = 10,
+                           with_pelias_result: Annotated[
+                                  bool,
+                                  Query(description="If True, return Pelias result as such in 'peliasRaw'.",
+                                        alias="withPeliasResult")
+                               ] = False,
+                           request: Request = None,
+                           response: Response = None):
     """
     Reverse geocoding
 
     """
 
-    res = geocode_reverse(pelias, lat, lon, radius, size, with_pelias_result)
+    res = await geocode_reverse_async(pelias, lat, lon, radius, size, with_pelias_result)
 
     if "status_code" in res:
         response.status_code = res["status_code"]
@@ -281,6 +550,46 @@ def _geocode_reverse(lat: Annotated[float, Query(description="Latitude, in EPSG:
     return res
 
 
+@app.post("/reverse/batch", response_model_exclude_none=True, responses={
+                status.HTTP_200_OK: {
+                    "model": BatchReverseOutput,
+                    "description": "Model in case of success (see 'status' in each item for the result of each point)"
+                },
+                413: {
+                    "model": BePeliasError,
+                    "description": "Too many points in a single call"
+                }
+            })
+async def _geocode_reverse_batch(batch: BatchReverseInput,
+                                 request: Request = None,
+                                 response: Response = None):
+    """ Batch reverse geocoding.
+
+Each point is reverse geocoded as with /reverse (same radius and size for all points). Results are given in input order, each of them with the HTTP status
+/reverse would have given and either a 'result' (same model as /reverse) or an 'error'.
+    """
+
+    log(f"Reverse batch: {len(batch.points)} points")
+
+    if len(batch.points) > batch_max_size:
+        response.status_code = 413  # Content Too Large (constant name depends on Starlette version)
+        return {"error": f"Too many points ({len(batch.points)}). Maximum: {batch_max_size}"}
+
+    items = await geocode_reverse_batch_async(pelias, [(pt.lat, pt.lon) for pt in batch.points], batch.radius, batch.size, batch.withPeliasResult,
+                                              concurrency=batch_concurrency)
+
+    # 'self' of each result: equivalent /reverse call
+    reverse_url = request.url.replace(path=request.url.path.removesuffix("/batch"))
+    for pt, item in zip(batch.points, items):
+        if "result" in item:
+            params = {"lat": pt.lat, "lon": pt.lon, "radius": batch.radius, "size": batch.size}
+            item["result"]["self"] = str(reverse_url.replace(query=urlencode(params)))
+
+    return {"self": str(request.url),
+            "items": items,
+            "total": len(items)}
+
+
 #################
 #  /searchCity  #
 #################
@@ -313,8 +622,7 @@ def _search_city(
 Search a city based on a postal code or a name (could be municipality name, part of municipality name or postal name)
 
     """
-    client = Elasticsearch(pelias.elastic_api)
-    res = search_city(client, post_code, city_name)
+    res = search_city(pelias.elastic, post_code, city_name, pelias.local_data.localities)
 
     if "status_code" in res:
         response.status_code = res["status_code"]
@@ -371,6 +679,175 @@ def _get_by_id(
     return res
 
 
+############
+#  /jobs   #
+############
+
+
+@app.post("/jobs", status_code=status.HTTP_202_ACCEPTED, response_model_exclude_none=True,
+          responses={
+              status.HTTP_202_ACCEPTED: {
+                  "model": JobOutput,
+                  "description": "Job created, and queued"
+              }
+          },
+          openapi_extra={
+              "requestBody": {
+                  "content": {"text/csv": {"schema": {"type": "string"},
+                                           "example": "id,streetName,houseNumber,postCode,postName\n1,Avenue Fonsny,20,1060,Saint-Gilles\n"}},
+                  "required": True
+              }
+          })
+async def _create_job(mode: Annotated[
+                         Literal["basic", "simple", "advanced"],
+                         Query(description="How Pelias is used (see /geocode)")] = "advanced",
+                      request: Request = None,
+                      response: Response = None):
+    """ Create a geocoding job for a CSV file (body of the request), with columns streetName, houseNumber, postCode, postName
+(other columns are kept as such in the result).
+
+The job is run in the background: use /jobs/{jobId} to follow its progress, and /jobs/{jobId}/result to download
+the result (input columns, plus bepelias_* columns describing the best result of each row).
+    """
+    await run_in_threadpool(clean_jobs, job_dir, job_retention)
+    job_id, input_file = create_job(job_dir, mode)
+
+    # Upload the body to the job directory, counting lines
+    nb_lines = 0
+    last_byte = b"\n"
+    try:
+        with open(input_file, "wb") as f:
+            async for chunk in request.stream():
+                if chunk:
+                    await run_in_threadpool(f.write, chunk)  # Do not block the event loop on disk writes
+                    nb_lines += chunk.count(b"\n")
+                    last_byte = chunk[-1:]
+    except ClientDisconnect:
+        log(f"Job {job_id}: client disconnected during upload")
+        fail_upload(job_dir, job_id, "Upload not completed (client disconnected)")
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"error": "Upload not completed (client disconnected)", "self": str(request.url)}
+    except BaseException as exc:  # Request cancelled...
+        log(f"Job {job_id}: upload not completed ({exc!r})")
+        fail_upload(job_dir, job_id, f"Upload not completed ({exc!r})")
+        raise
+    if last_byte != b"\n":
+        nb_lines += 1
+
+    log(f"Job {job_id} ({mode}): {nb_lines-1} rows")
+
+    submit_job(job_executor, job_dir, job_id, max(0, nb_lines - 1), job_pelias_kwargs, job_threads, job_workers)
+
+    res = get_job(job_dir, job_id)
+    res["self"] = str(request.url_for("_get_job", job_id=job_id))
+    response.headers["Location"] = res["self"]
+    return res
+
+
+def check_job(job_id):
+    """ Job status, or error (404) if it does not exist"""
+    res = get_job(job_dir, job_id)
+    if res is None:
+        return {"error": f"Unknown job '{job_id}'",
+                "status_code": status.HTTP_404_NOT_FOUND}
+    return res
+
+
+@app.get("/jobs/{job_id}", response_model_exclude_none=True, responses={
+                status.HTTP_200_OK: {
+                    "model": JobOutput,
+                    "description": "Job status and progress"
+                },
+                status.HTTP_404_NOT_FOUND: {
+                    "model": BePeliasError,
+                    "description": "Unknown job"
+                }
+            })
+def _get_job(job_id: Annotated[str, Path(description="Job id (see POST /jobs)",
+                                         pattern=JOB_ID_PATTERN,
+                                         example="3f1c8a0e5b6d4e2f9a7b1c3d5e7f9a1b")],
+             request: Request = None,
+             response: Response = None):
+    """ Status and progress (rows done, rows per second, estimated remaining time) of a geocoding job
+    """
+    res = check_job(job_id)
+    if "status_code" in res:
+        response.status_code = res["status_code"]
+    res["self"] = str(request.url)
+
+    return res
+
+
+@app.get("/jobs/{job_id}/result", response_model_exclude_none=True, responses={
+                status.HTTP_200_OK: {
+                    "content": {"text/csv": {"schema": {"type": "string"}}},
+                    "description": "Job result"
+                },
+                status.HTTP_404_NOT_FOUND: {
+                    "model": BePeliasError,
+                    "description": "Unknown job"
+                },
+                status.HTTP_409_CONFLICT: {
+                    "model": BePeliasError,
+                    "description": "Job not done (yet)"
+                }
+            })
+def _get_job_result(job_id: Annotated[str, Path(description="Job id (see POST /jobs)",
+                                                pattern=JOB_ID_PATTERN,
+                                                example="3f1c8a0e5b6d4e2f9a7b1c3d5e7f9a1b")],
+                    request: Request = None,
+                    response: Response = None):
+    """ Download the result (CSV) of a geocoding job, once its status is 'done'
+    """
+    res = check_job(job_id)
+    if "status_code" not in res and res["status"] != "done":
+        res = {"error": f"Job '{job_id}' is not done (status: {res['status']})",
+               "status_code": status.HTTP_409_CONFLICT}
+
+    if "status_code" in res:
+        response.status_code = res["status_code"]
+        res["self"] = str(request.url)
+        return res
+
+    return FileResponse(get_job_file(job_dir, job_id, OUTPUT_FILE), media_type="text/csv", filename=f"{job_id}.csv")
+
+
+@app.delete("/jobs/{job_id}", response_model_exclude_none=True, responses={
+                status.HTTP_200_OK: {
+                    "model": JobOutput,
+                    "description": "Job removed (with its files)"
+                },
+                status.HTTP_404_NOT_FOUND: {
+                    "model": BePeliasError,
+                    "description": "Unknown job"
+                },
+                status.HTTP_409_CONFLICT: {
+                    "model": BePeliasError,
+                    "description": "Job not finished (yet)"
+                }
+            })
+def _delete_job(job_id: Annotated[str, Path(description="Job id (see POST /jobs)",
+                                            pattern=JOB_ID_PATTERN,
+                                            example="3f1c8a0e5b6d4e2f9a7b1c3d5e7f9a1b")],
+                request: Request = None,
+                response: Response = None):
+    """ Remove a finished (done or failed) geocoding job, and its result. Finished jobs are anyway removed after JOB_RETENTION seconds
+    """
+    res = delete_job(job_dir, job_id)
+    if res is None:
+        res = {"error": f"Unknown job '{job_id}'",
+               "status_code": status.HTTP_404_NOT_FOUND}
+    elif res["status"] not in ("done", "failed"):
+        res = {"error": f"Job '{job_id}' is not finished (status: {res['status']})",
+               "status_code": status.HTTP_409_CONFLICT}
+
+    if "status_code" in res:
+        response.status_code = res["status_code"]
+    res["self"] = str(request.url)
+
+    return res
+
+
 ############
 # /health  #
 ############
@@ -385,8 +862,8 @@ def _get_by_id(
                     "model": Health,
                     "description": "Not running"
                 }})
-def _health(response: Response, request: Request = None) -> Health:
-    res = health(pelias)
+async def _health(response: Response, request: Request = None) -> Health:
+    res = await health_async(pelias)
     if "status_code" in res:
         response.status_code = res["status_code"]
     res["self"] = str(request.url)
@@ -394,6 +871,35 @@ def _health(response: Response, request: Request = None) -> Health:
     return res
 
 
+###########
+# /stats  #
+###########
+
+
+@app.get('/stats', include_in_schema=False)
+def _stats(request: Request = None):
+    """Internal statistics of this worker (connection pools...)"""
+    res = {"pools": pelias.get_pool_stats() | {"elastic_client": pelias.get_elastic_pool_stats()},
+           "cache": pelias.get_cache_stats(),
+           "single_flight": pelias.get_single_flight_stats(),
+           "struct_unstruct": struct_unstruct_stats,
+           "local_data": pelias.local_data.get_stats(),
+           "normalization": get_normalization_stats(),
+           "similarity": similarity_stats}
+    res["self"] = str(request.url)
+
+    return res
+
+
+@app.post('/cache/invalidate', include_in_schema=False)
+def _invalidate_cache(request: Request = None):
+    """Empty the Pelias response cache of this worker (after a data update, all workers empty their cache by themselves, see PELIAS_CACHE_VERSION_FILE)"""
+    res = {"removed_entries": pelias.invalidate_cache()}
+    res["self"] = str(request.url)
+
+    return res
+
+
 # app.openapi_schema["components"]["schemas"]
 
 def custom_openapi():
@@ -424,13 +930,14 @@ def custom_openapi():
 # }
 
     for rte in openapi_schema["paths"]:
-        if '422' in openapi_schema["paths"][rte]["get"]["responses"]:
-            openapi_schema["paths"][rte]["get"]["responses"]["422"]["content"]["application/json"]["schema"]["$ref"] = "#/components/schemas/HttpValidationError"
+        for meth in openapi_schema["paths"][rte]:
+            if '422' in openapi_schema["paths"][rte][meth]["responses"]:
+                openapi_schema["paths"][rte][meth]["responses"]["422"]["content"]["application/json"]["schema"]["$ref"] = "#/components/schemas/HttpValidationError"
 
     # Remove title properties
 
     for _, sch in openapi_schema["components"]["schemas"].items():
-        for prop in sch["properties"]:
+        for prop in sch.get("properties", {}):
             if "title" in sch["properties"][prop]:
                 del sch["properties"][prop]["title"]
         if "title" in sch:
@@ -443,12 +950,15 @@ def custom_openapi():
                     # del openapi_schema["paths"][path][meth]["parameters"][param]["schema"]["title"]
                     del param["schema"]["title"]
 
-            # move application/json in error response to application/problem+json
             for resp in openapi_schema["paths"][path][meth]["responses"]:
-                if resp != "200":
-                    content = openapi_schema["paths"][path][meth]["responses"][resp]["content"]
+                content = openapi_schema["paths"][path][meth]["responses"][resp].get("content", {})
+                if int(resp) >= 400 and "application/json" in content:
+                    # move application/json in error response to application/problem+json
                     content["application/problem+json"] = content["application/json"]
                     del content["application/json"]
+                elif "text/csv" in content:
+                    # CSV only, without the (empty) application/json content added by FastAPI
+                    content.pop("application/json", None)
     app.openapi_schema = openapi_schema
     return app.openapi_schema
 
@@ -0,0 +1,194 @@
+"""
+Asynchronous geocoding jobs: a CSV file is uploaded, geocoded in the background (see cli.geocode_file)
+by a pool of processes separate from the API workers, and its result downloaded when done.
+
+Jobs are stored on disk (one directory per job, in a job directory shared by all API workers):
+- input.csv: uploaded file
+- output.csv: result (see cli.geocode_file), with checkpoint giving the progress
+- status.json: status (queued, running, done, failed), timestamps, number of rows...
+
+Each API worker has its own pool of job processes, but a job only starts once it got one of the job
+slots (lock files in the job directory, see acquire_job_slot): the number of jobs running at the same
+time is limited for all API workers together.
+
+Finished (done or failed) jobs are removed after a retention delay (see clean_jobs), or on demand
+(see delete_job). A job whose upload did not complete is failed at once, and its input removed
+(see fail_upload).
+"""
+
+import fcntl
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+from bepelias.cli import geocode_file, read_checkpoint
+
+JOB_ID_PATTERN = r'^[0-9a-f]{32}$'
+
+INPUT_FILE = "input.csv"
+OUTPUT_FILE = "output.csv"
+STATUS_FILE = "status.json"
+
+# Progress is updated after each chunk
+CHUNK_SIZE = 100
+
+# Seconds between two attempts to get a job slot
+SLOT_WAIT = 1
+
+
+def get_job_file(job_dir, job_id, name):
+    """ Path of a file of a job"""
+    return os.path.join(job_dir, job_id, name)
+
+
+def read_status(job_dir, job_id):
+    """ Status of a job (dict), None if the job does not exist"""
+    try:
+        with open(get_job_file(job_dir, job_id, STATUS_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def update_status(job_dir, job_id, **updates):
+    """ Atomically update some fields of the status of a job"""
+    status = (read_status(job_dir, job_id) or {}) | updates
+
+    status_file = get_job_file(job_dir, job_id, STATUS_FILE)
+    with open(f"{status_file}.tmp", "w", encoding="utf-8") as f:
+        json.dump(status, f)
+    os.replace(f"{status_file}.tmp", status_file)
+    return status
+
+
+def create_job(job_dir, mode):
+    """ Create a new (empty) job, in status "uploading"
+
+    Returns:
+        tuple: job id, path of the input file, to be filled in before calling submit_job
+    """
+    job_id = uuid.uuid4().hex
+    os.makedirs(os.path.join(job_dir, job_id))
+    update_status(job_dir, job_id, jobId=job_id, status="uploading", mode=mode, created=time.time(), pid=os.getpid())
+    return job_id, get_job_file(job_dir, job_id, INPUT_FILE)
+
+
+def fail_upload(job_dir, job_id, error):
+    """ Mark a job whose upload did not complete (client disconnected...) as failed, and remove its input"""
+    try:
+        os.remove(get_job_file(job_dir, job_id, INPUT_FILE))
+    except FileNotFoundError:
+        pass
+    update_status(job_dir, job_id, status="failed", finished=time.time(), error=error)
+
+
+def submit_job(executor, job_dir, job_id, rows_total, pelias_kwargs, nb_threads, nb_slots):
+    """ Queue an uploaded job in executor (a process pool)"""
+    update_status(job_dir, job_id, status="queued", rowsTotal=rows_total)
+    executor.submit(run_job, job_dir, job_id, pelias_kwargs, nb_threads, nb_slots)
+
+
+def acquire_job_slot(job_dir, nb_slots):
+    """ Wait until one of the nb_slots job slots of job_dir is free, and take it
+
+    Returns:
+        int: file descriptor of the (locked) slot file. The slot is released when it is closed, or when the process stops
+    """
+    while True:
+        for slot in range(nb_slots):
+            fd = os.open(os.path.join(job_dir, f"slot_{slot}.lock"), os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        time.sleep(SLOT_WAIT)
+
+
+def run_job(job_dir, job_id, pelias_kwargs, nb_threads, nb_slots):
+    """ Geocode the input of a job (run by a process of the job pool), once a job slot is free"""
+    slot_fd = acquire_job_slot(job_dir, nb_slots)
+    try:
+        status = update_status(job_dir, job_id, status="running", started=time.time(), pid=os.getpid())
+        rows_done = geocode_file(get_job_file(job_dir, job_id, INPUT_FILE),
+                                 get_job_file(job_dir, job_id, OUTPUT_FILE),
+                                 mode=status["mode"], nb_workers=nb_threads, executor="thread", chunk_size=CHUNK_SIZE,
+                                 pelias_kwargs=pelias_kwargs, restart=True)
+        if not os.path.exists(get_job_file(job_dir, job_id, OUTPUT_FILE)):  # Empty input
+            with open(get_job_file(job_dir, job_id, OUTPUT_FILE), "w", encoding="utf-8"):
+                pass
+        update_status(job_dir, job_id, status="done", finished=time.time(), rowsDone=rows_done)
+    except Exception as exc:
+        update_status(job_dir, job_id, status="failed", finished=time.time(), error=str(exc))
+    finally:
+        os.close(slot_fd)
+
+
+def is_alive(pid):
+    """ Check whether a process is still running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def get_job(job_dir, job_id):
+    """ Status of a job, with progress (see _get_job). None if the job does not exist"""
+    status = read_status(job_dir, job_id)
+    if status is None:
+        return None
+
+    if status["status"] in ("uploading", "queued", "running") and not is_alive(status["pid"]):
+        # API worker (uploading, queued) or job process (running) stopped before the end of the job
+        status = update_status(job_dir, job_id, status="failed", finished=time.time(), error="Job interrupted (server restarted?)")
+
+    if status["status"] == "running":
+        status["rowsDone"], _ = read_checkpoint(f"{get_job_file(job_dir, job_id, OUTPUT_FILE)}.checkpoint",
+                                                get_job_file(job_dir, job_id, INPUT_FILE))
+        elapsed = time.time() - status["started"]
+        if status["rowsDone"] > 0 and elapsed > 0:
+            status["rowsPerSecond"] = status["rowsDone"] / elapsed
+            status["eta"] = max(0, status["rowsTotal"] - status["rowsDone"]) / status["rowsPerSecond"]
+    elif status["status"] == "done" and status["finished"] > status["started"]:
+        status["rowsPerSecond"] = status["rowsDone"] / (status["finished"] - status["started"])
+
+    del status["pid"]
+    return status
+
+
+def delete_job(job_dir, job_id):
+    """ Remove a finished (done or failed) job, with all its files
+
+    Returns:
+        dict: status of the job (see get_job), None if the job does not exist. If the job is not
+        finished, it is not removed
+    """
+    status = get_job(job_dir, job_id)
+    if status is not None and status["status"] in ("done", "failed"):
+        shutil.rmtree(os.path.join(job_dir, job_id), ignore_errors=True)
+    return status
+
+
+def clean_jobs(job_dir, retention):
+    """ Remove jobs finished for more than retention seconds (0: keep them forever)
+
+    Returns:
+        int: number of removed jobs
+    """
+    if retention <= 0 or not os.path.isdir(job_dir):
+        return 0
+    nb_removed = 0
+    for job_id in os.listdir(job_dir):
+        if not re.match(JOB_ID_PATTERN, job_id):  # Slot lock files
+            continue
+        status = get_job(job_dir, job_id)  # None if being created
+        if status is not None and status["status"] in ("done", "failed") and time.time() - status["finished"] > retention:
+            shutil.rmtree(os.path.join(job_dir, job_id), ignore_errors=True)
+            nb_removed += 1
+    return nb_removed
@@ -0,0 +1,993 @@
+"""
+Local copies of BeSt data (CSV files produced by prepare_best_files.py, in BEST_DATA_DIR),
+allowing some requests to be answered without calling Pelias.
+
+Each kind of data is optional: if its files are missing, the corresponding attribute of
+LocalData is None, and Pelias is called as usual.
+
+Indexes are built (and saved next to CSV files) at feed time by: python -m bepelias.local_data <data_dir>
+"""
+
+import csv
+import glob
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from unidecode import unidecode
+
+from bepelias.utils import log, to_camel_case
+
+# Position of a row: file index (in AddressIndex.files) in the highest bits, offset in the file in the lowest ones
+OFFSET_BITS = 40
+
+
+def normalize_street(street_name):
+    """ Normalized street name, used in index keys: no accent, upper case, only letters/digits separated by a single space"""
+    return re.sub("[^A-Z0-9]+", " ", unidecode(street_name).upper()).strip()
+
+
+def normalize_house_number(house_number):
+    """ Normalized house number, used in index keys: upper case, only letters/digits ("20 a" -> "20A")"""
+    return re.sub("[^A-Z0-9]+", "", unidecode(house_number).upper())
+
+
+def address_key(post_code, street_name, house_number):
+    """ 64 bits hash of a (postal code, street name, house number) triplet"""
+    key = f"{post_code.strip()}|{normalize_street(street_name)}|{normalize_house_number(house_number)}"
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def street_key(street_name):
+    """ 64 bits hash of a (normalized) street name"""
+    return int.from_bytes(hashlib.blake2b(normalize_street(street_name).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def get_street_names(row, addendum):
+    """ All (distinct) street names of an address row, in any language"""
+    names = [row["street"]] + list(addendum.get("street", {}).get("name", {}).values())
+    return list({n for n in names if n})
+
+
+def get_signature(files):
+    """ Name, size and modification time of each file (to check whether a saved index is still valid)"""
+    return [[os.path.basename(f), os.path.getsize(f), os.path.getmtime(f)] for f in files]
+
+
+def load_or_build(data_dir, files, name, build):
+    """
+    Numpy array built from files by build(files), saved as <name>.npy in data_dir
+
+    If the saved array is still valid (files did not change since it was saved), it is memory-mapped
+    (and then shared by all processes), otherwise it is built and saved.
+    """
+    index_file = os.path.join(data_dir, f"{name}.npy")
+    signature_file = os.path.join(data_dir, f"{name}.json")
+    signature = get_signature(files)
+
+    try:
+        with open(signature_file, encoding="utf-8") as f:
+            if json.load(f) == signature:
+                log(f"Loading {name} from {index_file}")
+                return np.load(index_file, mmap_mode="r")
+    except (OSError, ValueError):
+        pass
+
+    index = build(files)
+    try:
+        # Save under temporary names, then rename: another process could be building it at the same time
+        np.save(f"{index_file}.{os.getpid()}.npy", index)
+        os.replace(f"{index_file}.{os.getpid()}.npy", index_file)
+        with open(f"{signature_file}.{os.getpid()}", "w", encoding="utf-8") as f:
+            json.dump(signature, f)
+        os.replace(f"{signature_file}.{os.getpid()}", signature_file)
+    except OSError as exc:
+        log(f"Cannot save {name} in {data_dir} ({exc}): it will be built again by the next process")
+    return index
+
+
+def iter_records(f):
+    """
+    Iterate over the CSV records of binary file f, giving for each record its offset and its text.
+    A record spans several lines when a quoted field contains a newline: its number of quotes
+    is odd at the end of the first line (quotes inside a quoted field are doubled)
+    """
+    offset = f.tell()
+    record = b""
+    for line in f:
+        record += line
+        if record.count(b'"') % 2 == 0:
+            yield offset, record.decode("utf-8")
+            offset += len(record)
+            record = b""
+    if record:
+        yield offset, record.decode("utf-8")
+
+
+def iter_rows(files, name):
+    """ Iterate over rows of CSV files, giving for each row its position (see OFFSET_BITS) and content (dict). Blank lines are skipped"""
+    for file_index, fname in enumerate(files):
+        log(f"Building {name}: {fname}")
+        with open(fname, "rb") as f:
+            offset = [0]  # Offset of the record being parsed
+
+            def texts():
+                for record_offset, text in iter_records(f):
+                    offset[0] = record_offset
+                    yield text
+
+            reader = csv.reader(texts())
+            header = next(reader, [])
+            for fields in reader:
+                if fields:
+                    yield (file_index << OFFSET_BITS) | offset[0], dict(zip(header, fields))
+
+
+def read_record(fd, offset, block_size=4096):
+    """ Read the CSV record (see iter_records) starting at offset in file fd, without moving any file pointer (thread safe)"""
+    data = b""
+    start = 0  # Where to look for the end of the record
+    while True:
+        block = os.pread(fd, block_size, offset + len(data))
+        if not block:
+            return data
+        data += block
+        end = data.find(b"\n", start)
+        while end >= 0:
+            if data.count(b'"', 0, end) % 2 == 0:
+                return data[:end]
+            start = end + 1
+            end = data.find(b"\n", start)
+        start = len(data)
+
+
+def parse_record(data):
+    """ Fields of a CSV record (bytes, see read_record)"""
+    return next(csv.reader([data.decode("utf-8")]), [])
+
+
+class AddressIndex:
+    """
+    Index of BeSt addresses (bestaddresses_be*.csv files, see prepare_best_files.create_address_data),
+    on (postal code, street name in any language, house number).
+
+    Only hashes of keys and positions of rows are kept in memory (sorted numpy array): rows are read
+    from CSV files when found. The array is saved (address_index.npy) next to CSV files, and memory-mapped
+    by the next processes (shared by all workers), as long as the CSV files are not modified.
+    """
+
+    def __init__(self, files, index):
+        self.files = files
+        self.index = index
+        self.fds = [os.open(f, os.O_RDONLY) for f in files]
+        self.headers = []
+        for fd in self.fds:
+            self.headers.append(parse_record(read_record(fd, 0)))
+
+        self.counters = {"hits": 0, "misses": 0, "ambiguous": 0}
+        self.counters_lock = threading.Lock()
+
+    def __del__(self):
+        # No reader left (see LocalData.reload): files can be closed
+        for fd in getattr(self, "fds", []):
+            os.close(fd)
+
+    @staticmethod
+    def get_files(data_dir):
+        """ Address CSV files in data_dir"""
+        return sorted(glob.glob(os.path.join(data_dir, "bestaddresses_be*.csv")))
+
+    @classmethod
+    def load(cls, data_dir):
+        """ Load (or build) the index of CSV files in data_dir. None if there is no such file"""
+        files = cls.get_files(data_dir)
+        if len(files) == 0:
+            log(f"No address file in '{data_dir}', no local address index")
+            return None
+
+        return cls(files, load_or_build(data_dir, files, "address_index", cls.build))
+
+    @staticmethod
+    def build(files):
+        """ Build the index (sorted array of (key, position)) of all rows of files"""
+        start = time.time()
+        keys = []
+        positions = []
+        for position, row in iter_rows(files, "address index"):
+            try:
+                addendum = json.loads(row["addendum_json_best"])
+            except ValueError:
+                addendum = {}
+            if row["postalcode"] and row["housenumber"]:
+                for street_name in get_street_names(row, addendum):
+                    keys.append(address_key(row["postalcode"], street_name, row["housenumber"]))
+                    positions.append(position)
+
+        index = np.empty(len(keys), dtype=[("key", "<u8"), ("pos", "<u8")])
+        index["key"] = keys
+        index["pos"] = positions
+        index.sort(order="key")
+        log(f"Address index built: {len(index)} keys in {time.time()-start:.1f}s")
+        return index
+
+    def read_row(self, position):
+        """ CSV row (dict) at a position"""
+        file_index = int(position) >> OFFSET_BITS
+        data = read_record(self.fds[file_index], int(position) & ((1 << OFFSET_BITS) - 1))
+        return dict(zip(self.headers[file_index], parse_record(data)))
+
+    def count(self, counter):
+        """ Increment a counter"""
+        with self.counters_lock:
+            self.counters[counter] += 1
+
+    def lookup(self, post_code, street_name, house_number):
+        """
+        Find the address matching exactly (after normalization) post_code, street_name (in any language) and house_number
+
+        Returns:
+            list: Pelias features (same content as Pelias would give), empty if no (unambiguous) match
+        """
+        key = address_key(post_code, street_name, house_number)
+        first = np.searchsorted(self.index["key"], np.uint64(key), side="left")
+        last = np.searchsorted(self.index["key"], np.uint64(key), side="right")
+
+        features = {}
+        for position in self.index["pos"][first:last]:
+            row = self.read_row(position)
+            addendum = json.loads(row["addendum_json_best"])
+            # Check the row really matches (hash collision)
+            if all(address_key(row["postalcode"], s, row["housenumber"]) != key for s in get_street_names(row, addendum)):
+                continue
+            features[addendum.get("best_id", row["id"])] = row_to_feature(row, addendum)
+
+        if len(features) > 1:
+            # Several addresses (e.g., a retired and a current one): keep current one(s)
+            features = {k: f for k, f in features.items() if f["properties"]["addendum"]["best"].get("status") == "current"}
+            if len(features) != 1:
+                self.count("ambiguous")
+                return []
+
+        self.count("hits" if features else "misses")
+        return list(features.values())
+
+    def get_stats(self):
+        """ Number of keys, hits, misses, ambiguous lookups"""
+        with self.counters_lock:
+            return {"keys": len(self.index)} | self.counters
+
+
+class SpatialIndex:
+    """
+    Grid index of the coordinates of BeSt addresses (same files as AddressIndex), for reverse geocoding.
+
+    Points are sorted by grid cell (CELL_SIZE degrees), cells being numbered row by row: the cells of a
+    row of the grid intersecting a circle are contiguous in the array. The array is saved as reverse_index.npy
+    (and memory-mapped, see load_or_build). Rows are read from CSV files, through the AddressIndex.
+
+    Searches start within a small box around each point, enlarged (FIRST_BOX_RADIUS, times BOX_GROWTH at each
+    step) until enough addresses are found, so that the work depends on the number of results rather than on
+    the radius. Radiuses above MAX_RADIUS are not served (see serves): Pelias is called instead.
+    """
+
+    CELL_SIZE = 0.01
+    NB_COLUMNS = int(360 / CELL_SIZE)
+
+    MAX_RADIUS = 10  # km
+    FIRST_BOX_RADIUS = 0.2  # km
+    BOX_GROWTH = 4
+    # Part of the radius of a box where all points are surely in the box (bounding boxes are approximated)
+    BOX_MARGIN = 0.99
+    # Number of points of nearest_many searched at once
+    CHUNK_SIZE = 100
+
+    def __init__(self, addresses, grid):
+        self.addresses = addresses
+        self.grid = grid
+        self.counters = {"searches": 0}
+        self.counters_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, data_dir, addresses):
+        """ Load (or build) the grid of the address files of addresses (AddressIndex). None if addresses is None"""
+        if addresses is None:
+            return None
+        return cls(addresses, load_or_build(data_dir, addresses.files, "reverse_index", cls.build))
+
+    @classmethod
+    def get_cells(cls, lat, lon):
+        """ Cell number of (arrays of) coordinates"""
+        return np.floor(lat / cls.CELL_SIZE).astype("i8") * cls.NB_COLUMNS + np.floor((lon + 180) / cls.CELL_SIZE).astype("i8")
+
+    @classmethod
+    def build(cls, files):
+        """ Build the grid (array of (cell, lat, lon, position), sorted by cell) of all located rows of files"""
+        start = time.time()
+        points = []
+        for position, row in iter_rows(files, "reverse index"):
+            lat, lon = float(row["lat"] or 0), float(row["lon"] or 0)
+            if lat != 0 or lon != 0:
+                points.append((0, lat, lon, position))
+
+        grid = np.array(points, dtype=[("cell", "<i8"), ("lat", "<f8"), ("lon", "<f8"), ("pos", "<u8")])
+        grid["cell"] = cls.get_cells(grid["lat"], grid["lon"])
+        grid.sort(order="cell", kind="stable")
+        log(f"Reverse index built: {len(grid)} points in {time.time()-start:.1f}s")
+        return grid
+
+    def serves(self, radius):
+        """ Whether searches within radius (in km) are answered by this index (see MAX_RADIUS)"""
+        return radius <= self.MAX_RADIUS
+
+    def get_candidates(self, lats, lons, radius):
+        """
+        Indices (in grid) of points in cells intersecting the bounding box of circles (radius in km) centered
+        on each (lats[k], lons[k]). The cells of each row of each bounding box are found with a single searchsorted
+
+        Returns:
+            tuple: candidates (concatenated for all centers), and index of the center of each candidate (ascending)
+        """
+        delta_lat = radius / 111.2
+        delta_lon = radius / (111.2 * np.maximum(np.cos(np.radians(lats)), 0.01))
+        first_rows = np.floor((lats - delta_lat) / self.CELL_SIZE).astype("i8")
+        nb_rows = np.floor((lats + delta_lat) / self.CELL_SIZE).astype("i8") - first_rows + 1
+
+        # One range of cells per (center, grid row)
+        range_center = np.repeat(np.arange(len(lats)), nb_rows)
+        range_row = first_rows[range_center] + np.arange(len(range_center)) - np.repeat(np.cumsum(nb_rows) - nb_rows, nb_rows)
+        first_cells = range_row * self.NB_COLUMNS + np.floor((lons - delta_lon + 180) / self.CELL_SIZE).astype("i8")[range_center]
+        last_cells = range_row * self.NB_COLUMNS + np.floor((lons + delta_lon + 180) / self.CELL_SIZE).astype("i8")[range_center]
+        starts = np.searchsorted(self.grid["cell"], first_cells, side="left")
+        lengths = np.searchsorted(self.grid["cell"], last_cells, side="right") - starts
+
+        # Concatenation of range(starts[k], starts[k] + lengths[k]) for all ranges k
+        candidates = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return candidates, np.repeat(range_center, lengths)
+
+    def nearest(self, lat, lon, radius, size):
+        """
+        Nearest (distinct) BeSt addresses within radius (in km, at most MAX_RADIUS) of (lat, lon)
+
+        Returns:
+            list: at most size Pelias features (as Pelias reverse gives, with properties>distance in km), closest first
+        """
+        return self.nearest_many([(lat, lon)], radius, size)[0]
+
+    def nearest_many(self, points, radius, size):
+        """
+        Batch version of nearest: points is a list of (lat, lon), searched by chunks of CHUNK_SIZE points.
+        The first box of all points of a chunk is searched at once (see get_candidates), and each CSV row
+        is read once, even if it is close to several points
+
+        Returns:
+            list: features (see nearest) of each point
+        """
+        if not self.serves(radius):
+            raise ValueError(f"Radius above {self.MAX_RADIUS} km: not served by the local spatial index")
+        with self.counters_lock:
+            self.counters["searches"] += len(points)
+
+        rows = {}  # position -> CSV row
+        res = []
+        for first in range(0, len(points), self.CHUNK_SIZE):
+            chunk = np.array(points[first:first + self.CHUNK_SIZE], dtype="f8").reshape(-1, 2)
+            res.extend(self.search_boxes(chunk[:, 0], chunk[:, 1], radius, size, rows))
+        return res
+
+    def search_boxes(self, lats, lons, radius, size, rows, box_radius=None):
+        """
+        Features (see nearest) of each point (lats[k], lons[k]), searched in growing boxes (first one: box_radius,
+        FIRST_BOX_RADIUS by default): a point is done as soon as size addresses are found in the part of its box
+        surely within the box (see BOX_MARGIN), or when its box reaches radius. rows caches CSV rows read
+        """
+        res = [None] * len(lats)
+        pending = np.arange(len(lats))
+        box_radius = min(box_radius or self.FIRST_BOX_RADIUS, radius)
+        while len(pending) > 0:
+            candidates, centers = self.get_candidates(lats[pending], lons[pending], box_radius)
+            grid = self.grid[candidates]
+            distances = haversine(lats[pending][centers], lons[pending][centers], grid["lat"], grid["lon"])
+            bounds = np.searchsorted(centers, np.arange(len(pending) + 1))
+
+            last_box = box_radius >= radius
+            max_distance = radius if last_box else box_radius * self.BOX_MARGIN
+            still_pending = []
+            for k, point in enumerate(pending):
+                point_distances = distances[bounds[k]:bounds[k+1]]
+                within = np.flatnonzero(point_distances <= max_distance)
+                within = bounds[k] + within[np.argsort(point_distances[within], kind="stable")]
+                features = self.get_features(grid["pos"][within], distances[within], size, rows)
+                if last_box or len(features) >= size:
+                    res[point] = features
+                else:
+                    still_pending.append(point)
+
+            box_radius = min(box_radius * self.BOX_GROWTH, radius)
+            if len(pending) > 1:  # Larger boxes may contain many points: search them one point at a time
+                for point in still_pending:
+                    res[point] = self.search_boxes(lats[point:point+1], lons[point:point+1], radius, size, rows, box_radius)[0]
+                break
+            pending = np.array(still_pending, dtype="i8")
+        return res
+
+    def get_features(self, positions, distances, size, rows):
+        """ First size distinct features (by BeSt id) of rows at positions (sorted by distance). rows caches CSV rows read"""
+        features = {}
+        for position, distance in zip(positions, distances):
+            if len(features) >= size:
+                break
+            position = int(position)
+            if position not in rows:
+                rows[position] = self.addresses.read_row(position)
+            row = rows[position]
+            addendum = json.loads(row["addendum_json_best"])
+            best_id = addendum.get("best_id", row["id"])
+            if best_id not in features:
+                features[best_id] = row_to_feature(row, addendum)
+                features[best_id]["properties"]["distance"] = round(float(distance), 3)
+        return list(features.values())
+
+    def get_stats(self):
+        """ Number of points and searches"""
+        with self.counters_lock:
+            return {"points": len(self.grid)} | self.counters
+
+
+def haversine(lat, lon, lats, lons):
+    """ Distance (in km) between (lat, lon) and each point of (arrays) lats, lons"""
+    lat, lon, lats, lons = np.radians(lat), np.radians(lon), np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2)**2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2)**2
+    return 2 * 6371.0 * np.arcsin(np.sqrt(a))
+
+
+def tokenize(name):
+    """ Tokens of a locality name, as indexed by Pelias Elasticsearch (no accent, lower case, split on spaces and punctuation)"""
+    return [t for t in re.split("[^a-z0-9]+", unidecode(name).lower()) if t]
+
+
+class LocalityTable:
+    """
+    In-memory table of BeSt localities (bestaddresses_localities_be*.csv files, see prepare_best_files.create_locality_data),
+    giving the same results as the Elasticsearch query of base.search_city.
+
+    Localities are indexed by postal code, and by prefix of each token of their name (Elasticsearch
+    indexes names with edge n-grams): a name matches a city name if the tokens of the city name are,
+    in the same order, prefixes of consecutive tokens of the name.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.tokens = [tokenize(row["name"]) for row in rows]
+
+        self.by_postcode = {}
+        self.by_prefix = {}
+        for i, row in enumerate(rows):
+            self.by_postcode.setdefault(row["postalcode"].strip(), []).append(i)
+            for token in self.tokens[i]:
+                for length in range(1, len(token)+1):
+                    self.by_prefix.setdefault(token[:length], set()).add(i)
+
+        self.counters = {"searches": 0}
+        self.counters_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, data_dir):
+        """ Load locality CSV files in data_dir. None if there is no such file"""
+        files = sorted(glob.glob(os.path.join(data_dir, "bestaddresses_localities_be*.csv")))
+        if len(files) == 0:
+            log(f"No locality file in '{data_dir}', /searchCity will query Elasticsearch")
+            return None
+
+        rows = []
+        for fname in files:
+            with open(fname, encoding="utf-8", newline="") as f:
+                rows.extend(row for row in csv.DictReader(f) if row.get("layer", "locality") == "locality")
+        log(f"Locality table loaded: {len(rows)} localities")
+        return cls(rows)
+
+    def match_name(self, i, query_tokens):
+        """ Check that query_tokens are prefixes of consecutive tokens of the name of row i"""
+        tokens = self.tokens[i]
+        return any(all(tokens[start+k].startswith(t) for k, t in enumerate(query_tokens))
+                   for start in range(len(tokens) - len(query_tokens) + 1))
+
+    def search(self, post_code=None, city_name=None, size=100):
+        """
+        Localities matching post_code (exactly) and city_name (see class doc)
+
+        Returns:
+            list: features (with properties>addendum>best and geometry), at most size
+        """
+        with self.counters_lock:
+            self.counters["searches"] += 1
+
+        candidates = None
+        if post_code:
+            candidates = set(self.by_postcode.get(post_code.strip(), []))
+        if city_name:
+            query_tokens = tokenize(city_name)
+            if len(query_tokens) == 0:
+                return []
+            for token in query_tokens:
+                matching = self.by_prefix.get(token, set())
+                candidates = matching if candidates is None else candidates & matching
+            candidates = [i for i in candidates if self.match_name(i, query_tokens)]
+
+        features = []
+        for i in sorted(candidates)[:size]:
+            row = self.rows[i]
+            features.append({"properties": {"addendum": {"best": json.loads(row["addendum_json_best"])}},
+                             "geometry": {"coordinates": {"lon": float(row["lon"] or 0), "lat": float(row["lat"] or 0)}},
+                             "name": {"default": row["name"]}})
+        return features
+
+    def get_stats(self):
+        """ Number of localities and searches"""
+        with self.counters_lock:
+            return {"localities": len(self.rows)} | self.counters
+
+
+def row_to_feature(row, addendum):
+    """ Convert an address CSV row into a Pelias feature (as Pelias would give for an exact match)"""
+    prop = {"id": row["id"],
+            "layer": "address",
+            "source": row.get("source") or "csv",
+            "source_id": row["id"],
+            "name": row.get("name") or f"{row['housenumber']} {row['street']}",
+            "housenumber": row["housenumber"],
+            "street": row["street"],
+            "postalcode": row["postalcode"],
+            "confidence": 1,
+            "match_type": "exact",
+            "accuracy": "point",
+            "addendum": {"best": addendum}}
+    if row.get("locality"):
+        prop["locality"] = row["locality"]
+    if row.get("country"):
+        prop["country"] = row["country"]
+    prop["gid"] = f"{prop['source']}:address:{row['id']}"
+
+    return {"type": "Feature",
+            "geometry": {"type": "Point",
+                         "coordinates": [float(row["lon"] or 0), float(row["lat"] or 0)]},
+            "properties": prop}
+
+
+class StreetCenterTable:
+    """
+    Street centers (see README, "Street center") computed by prepare_best_files.create_street_data
+    (bestaddresses_streets_be*.csv files), by (postal code, normalized street name in any language)
+    """
+
+    def __init__(self, centers):
+        self.centers = centers
+        self.counters = {"hits": 0, "misses": 0}
+        self.counters_lock = threading.Lock()
+
+    @staticmethod
+    def get_key(street_name, post_code):
+        """ Key of a (street name, postal code) in centers"""
+        return f"{post_code.strip()}|{normalize_street(street_name)}"
+
+    @classmethod
+    def load(cls, data_dir):
+        """ Load street CSV files in data_dir. None if there is no such file"""
+        files = sorted(glob.glob(os.path.join(data_dir, "bestaddresses_streets_be*.csv")))
+        if len(files) == 0:
+            log(f"No street file in '{data_dir}', street centers will be asked to Pelias")
+            return None
+
+        centers = {}
+        for fname in files:
+            with open(fname, encoding="utf-8", newline="") as f:
+                for row in csv.DictReader(f):
+                    if not row["postalcode"]:
+                        continue
+                    try:
+                        addendum = json.loads(row["addendum_json_best"])
+                    except ValueError:
+                        addendum = {}
+                    center = [float(row["lon"] or 0), float(row["lat"] or 0)]
+                    for street_name in get_street_names(row, addendum):
+                        # As Pelias, keep the first one
+                        centers.setdefault(cls.get_key(street_name, row["postalcode"]), center)
+        log(f"Street center table loaded: {len(centers)} streets")
+        return cls(centers)
+
+    def get_center(self, street_name, post_code):
+        """ Center ([lon, lat]) of a street, None if unknown"""
+        center = self.centers.get(self.get_key(street_name, post_code))
+        with self.counters_lock:
+            self.counters["hits" if center else "misses"] += 1
+        return list(center) if center else None
+
+    def get_stats(self):
+        """ Number of streets, hits and misses"""
+        with self.counters_lock:
+            return {"streets": len(self.centers)} | self.counters
+
+
+def interpolate_numbers(numbers, lats, lons, query):
+    """
+    Vectorized linear interpolation of the position of house numbers on a street
+
+    A number is interpolated between the closest known numbers on the same side of the street
+    (same parity) if any, otherwise between the closest known numbers of any parity. Numbers
+    outside the range of known numbers are not extrapolated (NaN).
+
+    Args:
+        numbers (np.array): known house numbers of the street (sorted, distinct)
+        lats (np.array): latitude of each known number
+        lons (np.array): longitude of each known number
+        query (np.array): house numbers to interpolate
+
+    Returns:
+        tuple: latitudes, longitudes (np.array, NaN if not found)
+    """
+    query = np.asarray(query)
+    lat = np.full(len(query), np.nan)
+    lon = np.full(len(query), np.nan)
+    for parity in (0, 1):
+        side = numbers % 2 == parity
+        if not side.any():
+            continue
+        inside = (query % 2 == parity) & (query >= numbers[side][0]) & (query <= numbers[side][-1])
+        lat[inside] = np.interp(query[inside], numbers[side], lats[side])
+        lon[inside] = np.interp(query[inside], numbers[side], lons[side])
+
+    missing = np.isnan(lat) & (query >= numbers[0]) & (query <= numbers[-1])
+    lat[missing] = np.interp(query[missing], numbers, lats)
+    lon[missing] = np.interp(query[missing], numbers, lons)
+    return lat, lon
+
+
+class InterpolationEngine:
+    """
+    Embedded replacement of the interpolation service (pelias/interpolation), built from the files given
+    to it (bestaddresses_interpolation_be*.csv, see prepare_best_files.create_interpolation_data).
+
+    All known (street, postal code, number) positions are kept in a single array, sorted by street name
+    hash, postal code and number, saved as interpolation.npy (and memory-mapped, see load_or_build).
+    As the remote service, a street is found from its name and an approximate position (its center):
+    among postal codes having this street name, the closest one is taken.
+    """
+
+    # Maximal distance (in degrees) between the given position and the center of a street
+    MAX_DISTANCE = 0.05
+
+    def __init__(self, table):
+        self.table = table
+        self.counters = {"exact": 0, "interpolated": 0, "not_found": 0}
+        self.counters_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, data_dir):
+        """ Load (or build) the interpolation table of CSV files in data_dir. None if there is no such file"""
+        files = sorted(glob.glob(os.path.join(data_dir, "bestaddresses_interpolation_be*.csv")))
+        if len(files) == 0:
+            log(f"No interpolation file in '{data_dir}', the interpolation service will be called")
+            return None
+        return cls(load_or_build(data_dir, files, "interpolation", cls.build))
+
+    @staticmethod
+    def build(files):
+        """ Build the (sorted) table of all known positions in files"""
+        start = time.time()
+        data = pd.concat([pd.read_csv(f, usecols=["STREET", "NUMBER", "POSTALCODE", "LAT", "LON"]) for f in files])
+        data["NUMBER"] = pd.to_numeric(data["NUMBER"], errors="coerce")
+        data["POSTALCODE"] = pd.to_numeric(data["POSTALCODE"], errors="coerce")
+        data = data.dropna()
+        keys = {street: street_key(street) for street in data["STREET"].unique()}
+
+        table = np.empty(len(data), dtype=[("key", "<u8"), ("postcode", "<u4"), ("number", "<i4"), ("lat", "<f8"), ("lon", "<f8")])
+        table["key"] = data["STREET"].map(keys).to_numpy(dtype="u8")
+        table["postcode"] = data["POSTALCODE"]
+        table["number"] = data["NUMBER"]
+        table["lat"] = data["LAT"]
+        table["lon"] = data["LON"]
+        table.sort(order=["key", "postcode", "number"])
+
+        # Same number given twice (e.g., several ids): keep the first one
+        if len(table) > 0:
+            table = table[np.concatenate([[True], (table["key"][1:] != table["key"][:-1]) |
+                                                  (table["postcode"][1:] != table["postcode"][:-1]) |
+                                                  (table["number"][1:] != table["number"][:-1])])]
+        log(f"Interpolation table built: {len(table)} positions in {time.time()-start:.1f}s")
+        return table
+
+    def get_street(self, lat, lon, street):
+        """ Known positions (part of table) of the street closest to (lat, lon), None if there is none"""
+        key = np.uint64(street_key(street))
+        rows = self.table[np.searchsorted(self.table["key"], key, side="left"):np.searchsorted(self.table["key"], key, side="right")]
+        if len(rows) == 0:
+            return None
+
+        postcodes, first = np.unique(rows["postcode"], return_index=True)
+        bounds = list(first) + [len(rows)]
+        streets = [rows[bounds[i]:bounds[i+1]] for i in range(len(postcodes))]
+        distances = [(s["lat"].mean() - lat)**2 + (s["lon"].mean() - lon)**2 for s in streets]
+        closest = int(np.argmin(distances))
+        if distances[closest] > self.MAX_DISTANCE**2:
+            return None
+        return streets[closest]
+
+    def count(self, counter):
+        """ Increment a counter"""
+        with self.counters_lock:
+            self.counters[counter] += 1
+
+    def interpolate(self, lat, lon, number, street):
+        """
+        Position of a house number in a street (see Pelias.interpolate)
+
+        Returns:
+            dict: GeoJSON feature, as the interpolation service gives (properties>type being "exact" or
+                  "interpolated"), or an empty dict if the number cannot be located
+        """
+        mtch = re.match("^[0-9]+", str(number).strip())
+        rows = self.get_street(float(lat), float(lon), street) if mtch else None
+        if rows is None:
+            self.count("not_found")
+            return {}
+
+        num = int(mtch[0])
+        exact = np.flatnonzero(rows["number"] == num)
+        if len(exact) > 0:
+            res_type, res_lat, res_lon = "exact", rows["lat"][exact[0]], rows["lon"][exact[0]]
+        else:
+            res_lat, res_lon = interpolate_numbers(rows["number"], rows["lat"], rows["lon"], [num])
+            res_type, res_lat, res_lon = "interpolated", res_lat[0], res_lon[0]
+            if np.isnan(res_lat):
+                self.count("not_found")
+                return {}
+
+        self.count(res_type)
+        res_lat, res_lon = round(float(res_lat), 7), round(float(res_lon), 7)
+        return {"type": "Feature",
+                "properties": {"type": res_type,
+                               "source": "OA" if res_type == "exact" else "mixed",
+                               "number": str(num),
+                               "lat": res_lat,
+                               "lon": res_lon},
+                "geometry": {"type": "Point",
+                             "coordinates": [res_lon, res_lat]}}
+
+    def get_stats(self):
+        """ Number of known positions, and of exact, interpolated and not found numbers"""
+        with self.counters_lock:
+            return {"positions": len(self.table)} | self.counters
+
+
+class IdStore:
+    """
+    Key-value store from BeSt id to (pre-serialized) /id item, for addresses, streets and localities
+    (bestaddresses_be*.csv, bestaddresses_streets_be*.csv and bestaddresses_localities_be*.csv files).
+
+    Built at feed time by build (python -m bepelias.local_data <data_dir>), in two files:
+    - id_store.data: JSON items, one after the other
+    - id_store.npy: "<layer>|<lower case id>" keys (sorted), with offset and length of their item in id_store.data
+    Both are memory-mapped: pages are shared by all workers (and processes).
+    """
+
+    FILES = {"address": "bestaddresses_be*.csv",
+             "street": "bestaddresses_streets_be*.csv",
+             "locality": "bestaddresses_localities_be*.csv"}
+
+    def __init__(self, index, data):
+        self.index = index
+        self.data = data
+
+    @classmethod
+    def get_files(cls, data_dir):
+        """ CSV files in data_dir, per layer"""
+        return {layer: sorted(glob.glob(os.path.join(data_dir, pattern))) for layer, pattern in cls.FILES.items()}
+
+    @classmethod
+    def get_signature(cls, data_dir):
+        """ Signature (see get_signature) of all CSV files"""
+        return get_signature([f for files in cls.get_files(data_dir).values() for f in files])
+
+    @classmethod
+    def load(cls, data_dir):
+        """ Open the store built in data_dir. None if it does not exist, or is older than CSV files"""
+        try:
+            with open(os.path.join(data_dir, "id_store.json"), encoding="utf-8") as f:
+                signature = json.load(f)
+        except (OSError, ValueError):
+            log(f"No id store in '{data_dir}', /id will query Elasticsearch")
+            return None
+
+        if signature != cls.get_signature(data_dir):
+            log(f"Id store in '{data_dir}' does not match CSV files (run 'python -m bepelias.local_data {data_dir}'), /id will query Elasticsearch")
+            return None
+
+        index = np.load(os.path.join(data_dir, "id_store.npy"), mmap_mode="r")
+        with open(os.path.join(data_dir, "id_store.data"), "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(f.name) > 0 else b""
+        log(f"Id store loaded: {len(index)} ids")
+        return cls(index, data)
+
+    @classmethod
+    def build(cls, data_dir):
+        """ Build (and save) the store from CSV files in data_dir"""
+        start = time.time()
+        signature = cls.get_signature(data_dir)
+        keys = []
+        positions = []
+        offset = 0
+        with open(os.path.join(data_dir, f"id_store.data.{os.getpid()}"), "wb") as data_file:
+            for layer, files in cls.get_files(data_dir).items():
+                for fname in files:
+                    log(f"Building id store: {fname}")
+                    with open(fname, encoding="utf-8", newline="") as f:
+                        for row in csv.DictReader(f):
+                            if row.get("layer", layer) != layer or not row["id"]:
+                                continue
+                            addendum = json.loads(row["addendum_json_best"])
+                            addendum.pop("normalized", None)  # Only used to compare names (see base.check_streetname)
+                            item = to_camel_case(addendum | {"coordinates": {"lon": float(row["lon"] or 0), "lat": float(row["lat"] or 0)}})
+                            item = json.dumps(item, ensure_ascii=False).encode("utf-8")
+                            data_file.write(item)
+                            keys.append(f"{layer}|{row['id'].lower()}".encode("utf-8"))
+                            positions.append((offset, len(item)))
+                            offset += len(item)
+
+        index = np.empty(len(keys), dtype=[("key", f"S{max((len(k) for k in keys), default=1)}"), ("offset", "<u8"), ("length", "<u4")])
+        index["key"] = keys
+        index["offset"] = [p[0] for p in positions]
+        index["length"] = [p[1] for p in positions]
+        index.sort(order="key")
+
+        # Save under temporary names, then rename (signature last: a running API only uses the store once complete)
+        np.save(os.path.join(data_dir, f"id_store.{os.getpid()}.npy"), index)
+        os.replace(os.path.join(data_dir, f"id_store.data.{os.getpid()}"), os.path.join(data_dir, "id_store.data"))
+        os.replace(os.path.join(data_dir, f"id_store.{os.getpid()}.npy"), os.path.join(data_dir, "id_store.npy"))
+        with open(os.path.join(data_dir, f"id_store.json.{os.getpid()}"), "w", encoding="utf-8") as f:
+            json.dump(signature, f)
+        os.replace(os.path.join(data_dir, f"id_store.json.{os.getpid()}"), os.path.join(data_dir, "id_store.json"))
+        log(f"Id store built: {len(index)} ids in {time.time()-start:.1f}s")
+
+    def lookup(self, layer, bestid, size=10):
+        """
+        Items of layer whose id starts with bestid (case insensitive), as the Elasticsearch prefix query of base.get_by_id
+
+        Returns:
+            list: /id items (at most size)
+        """
+        prefix = f"{layer}|{bestid.lower()}".encode("utf-8")
+        first = np.searchsorted(self.index["key"], prefix, side="left")
+        last = np.searchsorted(self.index["key"], prefix + b"\xff", side="left")
+
+        items = []
+        for key, offset, length in self.index[first:min(last, first + size)]:
+            item = json.loads(self.data[offset:offset+length])
+            if key.startswith(prefix) and item not in items:
+                items.append(item)
+        return items
+
+
+class LocalData:
+    """
+    All local BeSt data available in data_dir (attributes being None if not available).
+
+    Data are reloaded when files of data_dir change (checked at most every CHECK_INTERVAL seconds).
+    feed.sh replaces files by renaming new ones (with their indexes) into data_dir, so data loaded
+    before keep reading the files they were loaded from until the reload is done.
+    """
+
+    CHECK_INTERVAL = 10
+
+    def __init__(self, data_dir=None):
+        self.data_dir = data_dir
+        self.lock = threading.Lock()
+        self.checked_at = time.monotonic()
+        self.reloading = False
+        self.signature = self.get_data_signature() if data_dir else None
+        self.data = self.load()
+
+    def get_data_signature(self):
+        """ Signature (see get_signature) of CSV files and saved indexes of data_dir"""
+        return get_signature(sorted(glob.glob(os.path.join(self.data_dir, "*.csv")) + glob.glob(os.path.join(self.data_dir, "*.json"))))
+
+    def load(self):
+        """ Load all data of data_dir"""
+        if not self.data_dir:
+            return dict.fromkeys(["addresses", "localities", "ids", "street_centers", "interpolation", "reverse"])
+
+        addresses = AddressIndex.load(self.data_dir)
+        return {"addresses": addresses,
+                "localities": LocalityTable.load(self.data_dir),
+                "ids": IdStore.load(self.data_dir),
+                "street_centers": StreetCenterTable.load(self.data_dir),
+                "interpolation": InterpolationEngine.load(self.data_dir),
+                "reverse": SpatialIndex.load(self.data_dir, addresses)}
+
+    def check(self):
+        """ Start a reload (in background, current data being used meanwhile) if files of data_dir changed"""
+        if not self.data_dir or time.monotonic() - self.checked_at < self.CHECK_INTERVAL:
+            return
+        with self.lock:
+            if self.reloading or time.monotonic() - self.checked_at < self.CHECK_INTERVAL:
+                return
+            self.checked_at = time.monotonic()
+            try:
+                signature = self.get_data_signature()
+            except OSError:  # A file was renamed meanwhile: feed in progress, check again later
+                return
+            if signature == self.signature:
+                return
+            self.reloading = True
+        threading.Thread(target=self.reload, args=(signature,), daemon=True).start()
+
+    def reload(self, signature):
+        """ Load data again, and replace current ones (see check)"""
+        log(f"Local BeSt data in '{self.data_dir}' changed: reloading")
+        try:
+            self.data = self.load()
+            self.signature = signature
+        except Exception as exc:  # Keep current data
+            log(f"Cannot reload local BeSt data: {exc}")
+        finally:
+            self.reloading = False
+
+    @property
+    def addresses(self):
+        """ AddressIndex or None"""
+        self.check()
+        return self.data["addresses"]
+
+    @property
+    def localities(self):
+        """ LocalityTable or None"""
+        self.check()
+        return self.data["localities"]
+
+    @property
+    def ids(self):
+        """ IdStore or None"""
+        self.check()
+        return self.data["ids"]
+
+    @property
+    def street_centers(self):
+        """ StreetCenterTable or None"""
+        self.check()
+        return self.data["street_centers"]
+
+    @property
+    def interpolation(self):
+        """ InterpolationEngine or None"""
+        self.check()
+        return self.data["interpolation"]
+
+    @property
+    def reverse(self):
+        """ SpatialIndex or None"""
+        self.check()
+        return self.data["reverse"]
+
+    def get_stats(self):
+        """ Statistics of each local data"""
+        data = self.data
+        return {"addresses": data["addresses"].get_stats() if data["addresses"] else None,
+                "localities": data["localities"].get_stats() if data["localities"] else None,
+                "ids": {"ids": len(data["ids"].index)} if data["ids"] else None,
+                "street_centers": data["street_centers"].get_stats() if data["street_centers"] else None,
+                "interpolation": data["interpolation"].get_stats() if data["interpolation"] else None,
+                "reverse": data["reverse"].get_stats() if data["reverse"] else None}
+
+
+if __name__ == "__main__":
+    # Feed time (see feed.sh): build local indexes of data_dir, to be used by the API
+    BEST_DATA_DIR = sys.argv[1] if len(sys.argv) > 1 else "/data/best"
+    IdStore.build(BEST_DATA_DIR)
+    SpatialIndex.load(BEST_DATA_DIR, AddressIndex.load(BEST_DATA_DIR))
+    InterpolationEngine.load(BEST_DATA_DIR)
@@ -2,9 +2,9 @@
 FastAPI models for bepelias responses
 """
 
-from typing import Annotated, Union
+from typing import Annotated, Dict, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 from typing_extensions import Literal
 
@@ -22,14 +22,28 @@ class HealthDetails(BaseModel):
     details: str
 
 
+class CircuitBreakerState(BaseModel):
+    """ State of the circuit breaker protecting calls to a Pelias backend"""
+    state: Annotated[Literal["closed", "open", "half_open"],
+                     Field(description="closed: calls are sent normally; open: calls fail without being sent; "
+                                       "half_open: a probe call is allowed, to check whether the backend recovered",
+                           example="closed")]
+    failures: Annotated[int,
+                        Field(description="Number of consecutive failed calls",
+                              example=0)]
+
+
 class Health(BaseModel):
     """
     - {'status': 'DOWN'}: Pelias server does not answer (or gives an unexpected answer)
     - {'status': 'DEGRADED'}: Interpolation engine is down. Geocoding is still possible but might be not optimal
     - {'status': 'UP'}: Service works correctly
+
+    circuitBreakers gives the circuit breaker state of each Pelias backend (api, interpolation, elastic)
     """
     status: Literal["UP", "DOWN", "DEGRADED"]
     details: Union[HealthDetails, None] = None
+    circuitBreakers: Union[Dict[str, CircuitBreakerState], None] = None
 
 
 class Name(BaseModel):
@@ -169,10 +183,74 @@ class GeocodeOutput(BaseModel):
                       Field(description="Number of results",
                             example=10)]
     peliasRaw: dict = None
-    callType: Union[Literal["struct", "unstruct"], None] = None
+    callType: Union[Literal["struct", "unstruct", "local"], None] = None
     inAddr: Union[dict, str, None] = None
     peliasCallCount: int
     transformers: Union[str, None] = None
+    deadlineExceeded: Annotated[Union[bool, None],
+                                Field(description="True if the timeout was reached before all variants could be tried: "
+                                                  "the best result found so far is returned")] = None
+
+
+GeocodeMode = Literal["basic", "simple", "advanced"]
+
+
+class GeocodeInput(BaseModel):
+    """ One structured address to geocode (batch input)"""
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+    streetName: Annotated[Union[str, None],
+                          Field(description="The name of a passage or way through from one location to another (cf. Fedvoc).",
+                                example="Avenue Fonsny")] = None
+    houseNumber: Annotated[Union[str, None],
+                           Field(description="An official alphanumeric code assigned to building units, mooring places, stands or parcels (cf. Fedvoc).",
+                                 example="20")] = None
+    postCode: Annotated[Union[str, None],
+                        Field(description="The post code (a.k.a postal code, zip code etc.) (cf. Fedvoc).",
+                              example="1060")] = None
+    postName: Annotated[Union[str, None],
+                        Field(description="Name with which the geographical area that groups the addresses for postal purposes can be indicated, usually the city (cf. Fedvoc).",
+                              example="Saint-Gilles")] = None
+    mode: Annotated[Union[GeocodeMode, None],
+                    Field(description="Mode for this address (see /geocode). Default: mode of the batch",
+                          example="advanced")] = None
+
+
+class BatchGeocodeInput(BaseModel):
+    """ batch geocode input model"""
+    addresses: Annotated[list[GeocodeInput],
+                         Field(description="Addresses to geocode",
+                               min_length=1)]
+    mode: Annotated[GeocodeMode,
+                    Field(description="Mode for all addresses without their own mode (see /geocode)",
+                          example="advanced")] = "advanced"
+    withPeliasResult: Annotated[bool,
+                                Field(description="If True, return Pelias result as such in 'peliasRaw'.")] = False
+    timeout: Annotated[Union[float, None],
+                       Field(description="Maximal processing time of each address, in seconds (see /geocode). "
+                                         "Default: server configuration (possibly no limit).",
+                             gt=0,
+                             example=10)] = None
+
+
+class BatchGeocodeResult(BaseModel):
+    """ Result of one address in a batch"""
+    status: Annotated[int,
+                      Field(description="HTTP status the single address call (/geocode) would have given",
+                            example=200)]
+    result: Union[GeocodeOutput, None] = None
+    error: Union[str, None] = None
+
+
+class BatchGeocodeOutput(BaseModel):
+    """ batch geocode output model"""
+    self: Annotated[str, Field(description="Absolute URI (http or https) to the the resource's own location.",
+                               example="http://<hostname>/REST/bepelias/v1/geocode/batch")]
+    items: Annotated[list[BatchGeocodeResult],
+                     Field(description="One result per input address, in input order")]
+    total:  Annotated[int,
+                      Field(description="Number of results",
+                            example=10)]
 
 
 class ReverseGeocodeOutput(BaseModel):
@@ -186,6 +264,49 @@ class ReverseGeocodeOutput(BaseModel):
     peliasRaw: dict = None
 
 
+class ReversePoint(BaseModel):
+    """ point of a batch reverse geocode input"""
+    lat: Annotated[float, Field(description="Latitude, in EPSG:4326", gt=49.49, lt=51.51, example=50.83582)]
+    lon: Annotated[float, Field(description="Longitude, in EPSG:4326", gt=2.4, lt=6.41, example=4.33844)]
+
+
+class BatchReverseInput(BaseModel):
+    """ batch reverse geocode input model"""
+    points: Annotated[list[ReversePoint],
+                      Field(description="Points to reverse geocode",
+                            min_length=1)]
+    radius: Annotated[float,
+                      Field(description="Distance (in kilometers), for all points",
+                            gt=0, lt=350,
+                            example=1)] = 1
+    size: Annotated[int,
+                    Field(description="Maximal number of results per point (default: 10; maximum: 20)",
+                          gt=0, lt=20,
+                          example=10)] = 10
+    withPeliasResult: Annotated[bool,
+                                Field(description="If True, return Pelias result as such in 'peliasRaw'.")] = False
+
+
+class BatchReverseResult(BaseModel):
+    """ Result of one point in a batch"""
+    status: Annotated[int,
+                      Field(description="HTTP status the single point call (/reverse) would have given",
+                            example=200)]
+    result: Union[ReverseGeocodeOutput, None] = None
+    error: Union[str, None] = None
+
+
+class BatchReverseOutput(BaseModel):
+    """ batch reverse geocode output model"""
+    self: Annotated[str, Field(description="Absolute URI (http or https) to the the resource's own location.",
+                               example="http://<hostname>/REST/bepelias/v1/reverse/batch")]
+    items: Annotated[list[BatchReverseResult],
+                     Field(description="One result per input point, in input order")]
+    total:  Annotated[int,
+                      Field(description="Number of results",
+                            example=10)]
+
+
 class SearchCityOutput(BaseModel):
     """ reverse geocode output model"""
     self: Annotated[str, Field(description="Absolute URI (http or https) to the the resource's own location.",
@@ -204,3 +325,34 @@ class GetByIdOutput(BaseModel):
     total:  Annotated[int,
                       Field(description="Number of results",
                             example=10)]
+
+
+class JobOutput(BaseModel):
+    """ geocoding job model"""
+    self: Annotated[str, Field(description="Absolute URI (http or https) to the the resource's own location.",
+                               example="http://<hostname>/REST/bepelias/v1/jobs/3f1c8a0e5b6d4e2f9a7b1c3d5e7f9a1b")]
+    jobId: Annotated[str,
+                     Field(description="Job id",
+                           example="3f1c8a0e5b6d4e2f9a7b1c3d5e7f9a1b")]
+    status: Annotated[Literal["uploading", "queued", "running", "done", "failed"],
+                      Field(description="Job status. When 'done', result can be downloaded from /jobs/{jobId}/result",
+                            example="running")]
+    mode: Annotated[Literal["basic", "simple", "advanced"],
+                    Field(description="Geocoding mode (see /geocode)",
+                          example="advanced")]
+    rowsTotal: Annotated[Union[int, None],
+                         Field(description="Number of rows in the uploaded file",
+                               example=100000)] = None
+    rowsDone: Annotated[Union[int, None],
+                        Field(description="Number of rows already geocoded",
+                              example=25000)] = None
+    rowsPerSecond: Annotated[Union[float, None],
+                             Field(description="Geocoding speed",
+                                   example=120.5)] = None
+    eta: Annotated[Union[float, None],
+                   Field(description="Estimated remaining time (in seconds) before the end of the job",
+                         example=622.4)] = None
+    created: Annotated[float, Field(description="Creation time (Unix timestamp)", example=1760000000.0)]
+    started: Annotated[Union[float, None], Field(description="Start time (Unix timestamp)", example=1760000010.0)] = None
+    finished: Annotated[Union[float, None], Field(description="End time (Unix timestamp)", example=1760000840.0)] = None
+    error: Annotated[Union[str, None], Field(description="Error message, if the job failed")] = None
@@ -0,0 +1,129 @@
+"""
+Normalization of street and city names before comparing them. Used at query time (see
+base.check_streetname) and at feed time (see prepare_best_files), so it only depends on
+unidecode.
+"""
+import functools
+import re
+
+from unidecode import unidecode
+
+
+street_type_patterns = [re.compile(pat) for pat in ["^RUE ", "^AVENUE ", "^CHAUSSEE ", "^ALLEE ", "^BOULEVARD ", "^PLACE ", "^CHEMIN ",
+                                                    "STRAAT$", "STEENWEG$", "LAAN$",
+                                                    "^DE LA ", "^DE ", "^DU ", "^DES "]]
+
+
+def remove_street_types(street_name):
+    """
+    From a street name, remove most 'classical' street types, in French and Dutch
+    (Rue, Avenue, Straat...). Allow to improve string comparison reliability
+
+    Parameters
+    ----------
+    street_name : str
+        A street name.
+
+    Returns
+    -------
+    str
+        Cleansed version of input street_name.
+    """
+
+    # Applied one after the other (a street name could start with several of them)
+    for pat in street_type_patterns:
+        street_name = pat.sub("", street_name)
+
+    return street_name.strip()
+
+
+remove_patterns = [(r"\(.+\)$",      ""),
+                   ("[, ]*(SN|ZN)$", ""),
+                   ("' ", "'"),
+                   (" [a-zA-Z][. ]", " "),
+                   ("[.]", " "),
+                   (",[a-zA-Z .'-]*$", " ")
+                   ]
+
+remove_patterns_compiled = [(re.compile(pat), rep) for pat, rep in remove_patterns]
+
+
+def clean_name(name):
+    """
+    Apply the substitutions described in 'remove_patterns' to a street or city name
+
+    Parameters
+    ----------
+    name : str
+        A street or city name.
+
+    Returns
+    -------
+    str
+        Cleansed version of name.
+    """
+    for pat, rep in remove_patterns_compiled:
+        name = pat.sub(rep, name)
+    return name
+
+
+normalization_steps = {
+    "upper": str.upper,
+    "lower": str.lower,
+    "unidecode": unidecode,
+    "street_types": remove_street_types,
+    "clean": clean_name,
+}
+
+# Normalization steps of BeSt names (street, postal, municipality and part of municipality names),
+# applied at feed time (in addendum.best.normalized, see prepare_best_files.build_normalized_names)
+# or at query time when not available (see utils.get_best_name)
+best_name_normalization = {"streetname": ("upper", "unidecode", "street_types"),
+                           "postname": ("upper", "unidecode"),
+                           "municipality_name": ("upper", "unidecode"),
+                           "part_of_municipality_name": ("upper", "unidecode")}
+
+# The same street and city names are normalized over and over (for each candidate of each
+# variant of each address), so results are memoized, up to NORMALIZATION_CACHE_SIZE names
+NORMALIZATION_CACHE_SIZE = 100000
+
+
+@functools.lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
+def normalize_name(name, steps):
+    """
+    Normalize a name (street, city...) before comparing it, applying steps in the given order
+
+    Parameters
+    ----------
+    name : str
+        A street or city name.
+    steps : tuple
+        Steps to apply, among the keys of 'normalization_steps'
+        (upper, lower, unidecode, street_types, clean).
+
+    Returns
+    -------
+    str
+        Normalized version of name.
+    """
+    for step in steps:
+        name = normalization_steps[step](name)
+    return name
+
+
+def get_normalization_stats():
+    """
+    Hit rate of the normalize_name cache
+
+    Returns
+    -------
+    dict
+        hits, misses, size, max_size and hit_rate.
+    """
+    info = normalize_name.cache_info()
+    calls = info.hits + info.misses
+    return {"hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "max_size": info.maxsize,
+            "hit_rate": info.hits / calls if calls > 0 else None}
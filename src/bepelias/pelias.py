@@ -2,13 +2,27 @@
 
 Raises:
     PeliasException: raised when some unexcepted event occurs when calling Pelias
+    CircuitOpenException: raised (without calling Pelias) when the circuit breaker of a backend is open
+    DeadlineExceededException: raised when the deadline of a call is reached
 
 """
 
-import urllib
+import abc
+import asyncio
+import copy
+import threading
+import urllib.parse
 import time
 import json
 
+import httpx
+import urllib3
+
+from elasticsearch import Elasticsearch
+
+from bepelias.local_data import LocalData
+from bepelias.resilience import (time_left, has_time_left, backoff_delay,
+                                 CircuitBreaker, ResponseCache, InFlightCall)
 from bepelias.utils import (log, vlog)
 
 
@@ -19,9 +33,34 @@ class PeliasException(Exception):
     """
 
 
-class Pelias:
+class CircuitOpenException(PeliasException):
+    """
+    Call not sent, because the circuit breaker of the backend is open
+    """
+
+
+class DeadlineExceededException(PeliasException):
     """
-    Class calling Pelias REST API
+    Call not sent (or not answered), because its deadline is reached
+    """
+
+
+class BasePelias(abc.ABC):
+    """
+    State and helpers shared by the clients of Pelias REST API: Pelias (synchronous)
+    and AsyncPelias (asyncio), which differ only in the way calls are sent.
+
+    Each backend (api, interpolation, elastic) gets its own pool of keep-alive
+    connections, so that successive calls do not pay TCP/HTTP setup again.
+    If cache_size > 0, responses are kept in a ResponseCache (emptied when the
+    modification time of cache_version_file changes). Identical calls
+    sent concurrently are coalesced into a single call to Pelias.
+    Each backend is protected by a CircuitBreaker, and failed calls are retried
+    with a jittered exponential backoff (see backoff_delay).
+    A single Elasticsearch client (self.elastic) is kept for direct queries to
+    Pelias Elasticsearch index.
+    If best_data_dir is given, local copies of BeSt data found there (see
+    local_data.LocalData) allow some calls to Pelias to be skipped.
     """
     def __init__(
             self,
@@ -29,6 +68,19 @@ class Pelias:
             domain_elastic,
             domain_interpol,
             scheme="http",
+            pool_size=10,
+            connect_timeout=2.0,
+            read_timeout=30.0,
+            cache_size=0,
+            cache_ttl=3600,
+            cache_version_file=None,
+            breaker_threshold=5,
+            breaker_reset_timeout=30,
+            backoff_base=0.25,
+            backoff_max=4.0,
+            elastic_pool_size=10,
+            elastic_timeout=10,
+            best_data_dir=None,
     ):
 
         self.geocode_path = '/v1/search'
@@ -62,74 +114,293 @@ class Pelias:
             f'{self.scheme}://{self.domain_elastic}'
         )
 
-    def call_service(self, url, nb_attempts=6):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        self.backend_urls = {
+            "api":           f'{self.scheme}://{self.domain_api}',
+            "interpolation": f'{self.scheme}://{self.domain_interpol}',
+            "elastic":       f'{self.scheme}://{self.domain_elastic}',
+        }
+
+        self.pools = self.create_pools()
+        self.cache = ResponseCache(cache_size, cache_ttl, cache_version_file)
+
+        self.breakers = {backend: CircuitBreaker(breaker_threshold, breaker_reset_timeout)
+                         for backend in self.backend_urls}
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.in_flight = {}
+        self.in_flight_lock = threading.Lock()
+        self.single_flight_counters = {"coalesced": 0}
+
+        self.elastic_pool_size = elastic_pool_size
+        self.elastic_timeout = elastic_timeout
+        self.elastic = self.create_elastic_client()
+
+        self.local_data = LocalData(best_data_dir)
+
+    def create_elastic_client(self):
         """
-        Call URL. If something went wrong, wait a short delay, and try again,
-        up to nb_attempts times
+        Create the (long-lived) Elasticsearch client used by search_city and get_by_id
+
+        Returns
+        -------
+        Elasticsearch
+            Client keeping a pool of (at most) elastic_pool_size connections.
+        """
+        return Elasticsearch(self.elastic_api,
+                             maxsize=self.elastic_pool_size,
+                             timeout=self.elastic_timeout)
+
+    def get_elastic_pool_stats(self):
+        """
+        Connection pool statistics of the Elasticsearch client (see get_pool_stats)
+        """
+        pools = [conn.pool for conn in self.elastic.transport.connection_pool.connections]
+        nb_requests = sum(pool.num_requests for pool in pools)
+        nb_connections = sum(pool.num_connections for pool in pools)
+        return {"pool_size": self.elastic_pool_size,
+                "requests": nb_requests,
+                "connections": nb_connections,
+                "reused": max(nb_requests - nb_connections, 0)}
+
+    @abc.abstractmethod
+    def create_pools(self):
+        """
+        Create one pool of keep-alive connections per backend
+
+        Returns
+        -------
+        dict
+            Connection pool (or client), per backend.
+        """
+
+    @abc.abstractmethod
+    def get_pool_stats(self):
+        """
+        Connection pools statistics, per backend
+
+        Returns
+        -------
+        dict
+            For each backend: pool size, number of requests sent, number of
+            connections opened, and number of requests served by a reused connection.
+        """
+
+    def get_backend(self, url):
+        """
+        Get the name of the backend ("api", "interpolation" or "elastic") serving url
 
         Parameters
         ----------
-        url : TYPE
-            DESCRIPTION.
-        nb_attempts : TYPE, optional
-            DESCRIPTION. The default is 6.
+        url : str
+            Full URL.
 
         Raises
         ------
         PeliasException
-            If a valid answer is not received after nb_attempts .
+            If url does not belong to any backend.
 
         Returns
         -------
-        dict
-            Pelias result.
+        str
+            Backend name.
         """
-        delay = 1
-        while nb_attempts > 0:
-            try:
-                with urllib.request.urlopen(url) as response:
-                    res = response.read()
-                    res = json.loads(res)
-                    return res
-            except urllib.error.HTTPError as exc:
-                if exc.code == 400 and self.interpolate_api in url:  # bad request, typically bad house number format
-                    log(f"Error 400 ({url}): {exc}")
-                    return {}
-
-                if nb_attempts == 1:
-                    log(f"Cannot get Pelias results after several attempts({url}): {exc}")
-                    raise PeliasException(f"Cannot get Pelias results after several attempts ({url}): {exc}") from exc
-                nb_attempts -= 1
-                log(f"Cannot get Pelias results ({url}): {exc}. Try again in {delay} seconds...")
-                time.sleep(delay)
-                delay += 0.5
-            except ConnectionRefusedError as exc:
-                raise PeliasException(f"Cannot connect to Pelias, service probably down ({url}): {exc}") from exc
-            except urllib.error.URLError as exc:
-                raise PeliasException(f"Cannot connect to Pelias, service probably down ({url}): {exc}") from exc
-            except Exception as exc:
-                log(f"Cannot get Pelias results ({url}): {exc}")
-                raise exc
+        for backend, backend_url in self.backend_urls.items():
+            if url.startswith(f"{backend_url}/"):
+                return backend
+        raise PeliasException(f"Unknown backend for '{url}'")
 
-    def geocode(self, query, layers=None):
+    def get_circuit_breaker_states(self):
         """
-        Call Pelias geocoder
+        Circuit breaker state, per backend (see CircuitBreaker.get_state)
+        """
+        return {backend: breaker.get_state() for backend, breaker in self.breakers.items()}
+
+    def get_cache_stats(self):
+        """
+        Response cache statistics (see ResponseCache.get_stats)
+        """
+        return self.cache.get_stats()
+
+    def invalidate_cache(self):
+        """
+        Empty the response cache (see ResponseCache.invalidate)
+        """
+        return self.cache.invalidate()
+
+    def get_single_flight_stats(self):
+        """
+        Request coalescing statistics: number of calls currently in flight, and
+        number of calls that waited for an identical call instead of calling Pelias
+        """
+        with self.in_flight_lock:
+            return {"in_flight": len(self.in_flight),
+                    **self.single_flight_counters}
+
+    def get_timeouts(self, deadline, url):
+        """
+        Connect and read timeouts for a call, shrunk to fit in the time left before deadline
+
+        Raises
+        ------
+        DeadlineExceededException
+            If deadline is already reached.
+
+        Returns
+        -------
+        tuple
+            (connect timeout, read timeout), in seconds.
+        """
+        left = time_left(deadline)
+        if left is None:
+            return self.connect_timeout, self.read_timeout
+        if left <= 0:
+            raise DeadlineExceededException(f"Deadline exceeded, call not sent ({url})")
+        return min(self.connect_timeout, left), min(self.read_timeout, left)
+
+    def acquire_breaker(self, backend, url):
+        """
+        Ask the circuit breaker of backend whether a call can be sent (see CircuitBreaker.acquire)
+
+        Raises
+        ------
+        CircuitOpenException
+            If the circuit is open.
+
+        Returns
+        -------
+        bool
+            Whether the call is the probe call of a half open circuit.
+        """
+        allowed, probe = self.breakers[backend].acquire()
+        if not allowed:
+            raise CircuitOpenException(f"Circuit breaker open for Pelias {backend}, call not sent ({url})")
+        return probe
+
+    def timeout_exception(self, backend, url, exc, deadline):
+        """
+        Exception to raise after a call timed out: if the timeout (shrunk by get_timeouts) ended
+        at the deadline, DeadlineExceededException, which is not a backend failure. Otherwise,
+        PeliasException, the timeout being recorded as a backend failure
+
+        Returns
+        -------
+        PeliasException
+            Exception to raise.
+        """
+        if not has_time_left(deadline):
+            return DeadlineExceededException(f"Deadline exceeded while waiting for Pelias ({url}): {exc}")
+        return self.failure_exception(backend, url, exc)
+
+    def failure_exception(self, backend, url, exc):
+        """
+        Record a call that could not reach backend as a backend failure
+
+        Returns
+        -------
+        PeliasException
+            Exception to raise.
+        """
+        self.breakers[backend].record_failure()
+        return PeliasException(f"Cannot connect to Pelias, service probably down ({url}): {exc}")
+
+    def check_connection_lost(self, backend, url, exc, nb_attempts):
+        """
+        Handle a keep-alive connection closed by the server (typically while idle in the pool):
+        the call is tried again at once, without counting as a backend failure, unless this was
+        the last attempt
+
+        Raises
+        ------
+        PeliasException
+            If nb_attempts is 1.
+        """
+        if nb_attempts == 1:
+            self.breakers[backend].record_failure()
+            log(f"Cannot get Pelias results after several attempts({url}): {exc}")
+            raise PeliasException(f"Cannot get Pelias results after several attempts ({url}): {exc}") from exc
+        log(f"Connection to Pelias lost ({url}): {exc}. Try again...")
+
+    def read_response(self, backend, url, status, reason, data, use_cache):
+        """
+        Record the answer of backend in its circuit breaker (a 4xx error is still an answer),
+        and read it
 
         Parameters
         ----------
-        query : dict or str
-            if dict, should contain "address", "locality" and "postalcode" fields
-            if str, should contain an address
+        status : int
+            HTTP status.
+        reason : str
+            HTTP reason phrase.
+        data : bytes
+            Response body.
+
+        Returns
+        -------
+        tuple
+            (result, None) if the call is over (result: Pelias result), or (None, error message)
+            if it failed and may be tried again.
+        """
+        if status < 500:
+            self.breakers[backend].record_success()
+        else:
+            self.breakers[backend].record_failure()
+
+        if status < 400:
+            res = json.loads(data)
+            if use_cache:
+                self.cache.put(url, data)
+            return res, None
+
+        err = f"HTTP Error {status}: {reason}"
+        if status == 400 and backend == "interpolation":  # bad request, typically bad house number format
+            log(f"Error 400 ({url}): {err}")
+            if use_cache:
+                self.cache.put(url, b"{}")
+            return {}, None
+        return None, err
+
+    def retry_delay(self, url, err, attempt, nb_attempts, deadline):
+        """
+        Delay before trying again a failed call (see backoff_delay)
+
+        Parameters
+        ----------
+        err : str
+            Error of the failed call.
+        attempt : int
+            Number of failed attempts so far (starting at 0).
+        nb_attempts : int
+            Number of attempts left, including the failed one.
 
         Raises
         ------
         PeliasException
-            If anything went wrong while calling Pelias.
+            If no attempt is left.
+        DeadlineExceededException
+            If the delay would end after deadline.
 
         Returns
         -------
-        res : str
-            Pelias result.
+        float
+            Delay, in seconds.
+        """
+        if nb_attempts == 1:
+            log(f"Cannot get Pelias results after several attempts({url}): {err}")
+            raise PeliasException(f"Cannot get Pelias results after several attempts ({url}): {err}")
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+        if deadline is not None and delay >= time_left(deadline):
+            raise DeadlineExceededException(f"Deadline exceeded, no time left to retry ({url}): {err}")
+        log(f"Cannot get Pelias results ({url}): {err}. Try again in {delay:.2f} seconds...")
+        return delay
+
+    def geocode_url(self, query, layers=None):
+        """
+        Build the URL to call Pelias geocoder (see geocode)
         """
         if isinstance(query, dict):
             struct = True
@@ -154,7 +425,262 @@ class Pelias:
         url = f"{url}?{params}"
         vlog(f"Call to Pelias: {url}")
 
-        return self.call_service(url)
+        return url
+
+    def reverse_url(self, lat, lon, radius, size):
+        """
+        Build the URL to call Pelias reverse geocoder (see reverse)
+        """
+
+        params = {
+            "point.lat": lat,
+            "point.lon": lon,
+            "boundary.circle.radius": radius,
+            "size": size,
+            "layers": "address"
+        }
+
+        url = self.reverse_api
+
+        params = urllib.parse.urlencode(params)
+
+        url = f"{url}?{params}"
+        vlog(f"Call to Pelias: {url}")
+
+        return url
+
+    def interpolate_url(self, lat, lon, number, street):
+        """
+        Build the URL to call Pelias interpolate service (see interpolate)
+        """
+
+        url = self.interpolate_api
+
+        params = urllib.parse.urlencode({"lat": lat, "lon": lon, "number": number, "street": street})
+
+        url = f"{url}?{params}"
+        vlog(f"Call to interpolate: {url}")
+
+        return url
+
+    def check_result(self, city_test_from, pelias_res):
+        """
+        Evaluate the answer of Pelias to the health check call (see Pelias.check)
+        """
+        if city_test_from.lower() == pelias_res["geocoding"]["query"]["text"].lower():
+            return True  # Everything is fine
+        return pelias_res  # Server answers, but gives an unexpected result
+
+
+class Pelias(BasePelias):
+    """
+    Class calling Pelias REST API (see BasePelias), from one or several threads,
+    through one urllib3 pool of keep-alive connections per backend
+    """
+
+    def create_pools(self):
+        """
+        Create one urllib3 pool of keep-alive connections per backend
+
+        Returns
+        -------
+        dict
+            urllib3 connection pool, per backend.
+        """
+        return {
+            backend: urllib3.connection_from_url(backend_url,
+                                                 maxsize=self.pool_size,
+                                                 timeout=urllib3.Timeout(connect=self.connect_timeout,
+                                                                         read=self.read_timeout),
+                                                 retries=False)
+            for backend, backend_url in self.backend_urls.items()
+        }
+
+    def get_pool_stats(self):
+        """
+        Connection pools statistics, per backend (see BasePelias.get_pool_stats)
+        """
+        return {backend: {"pool_size": self.pool_size,
+                          "requests": pool.num_requests,
+                          "connections": pool.num_connections,
+                          "reused": max(pool.num_requests - pool.num_connections, 0)}
+                for backend, pool in self.pools.items()}
+
+    def call_service(self, url, nb_attempts=6, use_cache=True, deadline=None):
+        """
+        Call URL (see send_request), unless its response is in cache (if use_cache)
+        or an identical call is already in flight. In the latter case, wait for
+        the result of this call (single-flight), instead of calling Pelias again.
+
+        Parameters
+        ----------
+        url : str
+            Full URL.
+        nb_attempts : int, optional
+            See send_request. The default is 6.
+        use_cache : bool, optional
+            If True, get the response from (and keep it into) the response cache.
+            The default is True.
+        deadline : float, optional
+            time.monotonic() value after which the call is abandoned. The default
+            is None (no deadline).
+
+        Raises
+        ------
+        PeliasException
+            If a valid answer is not received after nb_attempts .
+        DeadlineExceededException
+            If deadline is reached before getting an answer.
+
+        Returns
+        -------
+        dict
+            Pelias result.
+        """
+        if use_cache:
+            data = self.cache.get(url)
+            if data is not None:
+                vlog(f"Pelias result from cache: {url}")
+                return json.loads(data)
+
+        key = self.cache.normalize_url(url)
+        with self.in_flight_lock:
+            call = self.in_flight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = InFlightCall()
+                self.in_flight[key] = call
+            else:
+                call.nb_followers += 1
+                self.single_flight_counters["coalesced"] += 1
+
+        if not is_leader:
+            vlog(f"Identical call in flight, waiting for its result: {url}")
+            left = time_left(deadline)
+            if not call.done.wait(None if left is None else max(left, 0)):
+                raise DeadlineExceededException(f"Deadline exceeded while waiting for an identical call ({url})")
+            if isinstance(call.exception, DeadlineExceededException) and has_time_left(deadline):
+                # The deadline of the leader was shorter than ours: try again
+                return self.call_service(url, nb_attempts, use_cache, deadline)
+            if call.exception is not None:
+                raise call.exception
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = self.send_request(url, nb_attempts, use_cache, deadline)
+        except Exception as exc:
+            call.exception = exc
+            raise
+        finally:
+            with self.in_flight_lock:
+                del self.in_flight[key]
+            call.done.set()
+
+        # Followers get a copy of call.result: keep it untouched
+        return copy.deepcopy(call.result) if call.nb_followers > 0 else call.result
+
+    def send_request(self, url, nb_attempts=6, use_cache=True, deadline=None):
+        """
+        Call URL, using a keep-alive connection from the backend pool.
+        If something went wrong, wait a short delay (see backoff_delay), and try again,
+        up to nb_attempts times. Fails fast if the backend circuit breaker is open.
+        If deadline is given, timeouts are shrunk to the time left (see get_timeouts),
+        and no retry is attempted if its delay would end after deadline.
+
+        Parameters
+        ----------
+        url : TYPE
+            DESCRIPTION.
+        nb_attempts : TYPE, optional
+            DESCRIPTION. The default is 6.
+        use_cache : bool, optional
+            If True, keep the response into the response cache. The default is True.
+        deadline : float, optional
+            See call_service. The default is None.
+
+        Raises
+        ------
+        PeliasException
+            If a valid answer is not received after nb_attempts .
+        CircuitOpenException
+            If the backend circuit breaker is open.
+        DeadlineExceededException
+            If deadline is reached.
+
+        Returns
+        -------
+        dict
+            Pelias result.
+        """
+        backend = self.get_backend(url)
+        pool = self.pools[backend]
+        path = url[len(self.backend_urls[backend]):]
+
+        attempt = 0
+        check_breaker = True
+        probe = False
+        try:
+            while nb_attempts > 0:
+                if check_breaker:
+                    probe = self.acquire_breaker(backend, url)
+                check_breaker = True
+                connect_timeout, read_timeout = self.get_timeouts(deadline, url)
+                try:
+                    response = pool.request("GET", path, timeout=urllib3.Timeout(connect=connect_timeout, read=read_timeout))
+                except urllib3.exceptions.TimeoutError as exc:
+                    raise self.timeout_exception(backend, url, exc, deadline) from exc
+                except urllib3.exceptions.ProtocolError as exc:
+                    self.check_connection_lost(backend, url, exc, nb_attempts)
+                    nb_attempts -= 1
+                    check_breaker = False  # Not a backend failure: retry at once
+                    continue
+                except urllib3.exceptions.HTTPError as exc:
+                    raise self.failure_exception(backend, url, exc) from exc
+                except Exception as exc:
+                    self.breakers[backend].record_failure()
+                    log(f"Cannot get Pelias results ({url}): {exc}")
+                    raise exc
+
+                probe = False
+                res, err = self.read_response(backend, url, response.status, response.reason, response.data, use_cache)
+                if err is None:
+                    return res
+                delay = self.retry_delay(url, err, attempt, nb_attempts, deadline)
+                nb_attempts -= 1
+                attempt += 1
+                time.sleep(delay)
+        finally:
+            if probe:  # Probe call ended without any answer nor failure of the backend
+                self.breakers[backend].release_probe()
+
+        return None
+
+    def geocode(self, query, layers=None, deadline=None):
+        """
+        Call Pelias geocoder
+
+        Parameters
+        ----------
+        query : dict or str
+            if dict, should contain "address", "locality" and "postalcode" fields
+            if str, should contain an address
+        layers : str, optional
+            Comma separated list of Pelias layers
+        deadline : float, optional
+            See call_service
+
+        Raises
+        ------
+        PeliasException
+            If anything went wrong while calling Pelias.
+
+        Returns
+        -------
+        res : str
+            Pelias result.
+        """
+
+        return self.call_service(self.geocode_url(query, layers), deadline=deadline)
 
     def reverse(self, lat, lon, radius, size):
         """
@@ -178,26 +704,12 @@ class Pelias:
             Pelias result.
         """
 
-        params = {
-            "point.lat": lat,
-            "point.lon": lon,
-            "boundary.circle.radius": radius,
-            "size": size,
-            "layers": "address"
-        }
-
-        url = self.reverse_api
-
-        params = urllib.parse.urlencode(params)
-
-        url = f"{url}?{params}"
-        vlog(f"Call to Pelias: {url}")
-
-        return self.call_service(url)
+        return self.call_service(self.reverse_url(lat, lon, radius, size))
 
-    def interpolate(self, lat, lon, number, street):
+    def interpolate(self, lat, lon, number, street, use_cache=True, deadline=None):
         """
-        Call Pelias interpolate service
+        Call Pelias interpolate service (or the embedded interpolation engine, if any, see
+        local_data.InterpolationEngine)
 
         Parameters
         ----------
@@ -209,6 +721,10 @@ class Pelias:
             House number to interpolate
         street: str
             Street name where the number should be interpolate
+        use_cache: bool
+            See call_service
+        deadline: float
+            See call_service
 
         Raises
         ------
@@ -221,14 +737,10 @@ class Pelias:
             Pelias result.
         """
 
-        url = self.interpolate_api
-
-        params = urllib.parse.urlencode({"lat": lat, "lon": lon, "number": number, "street": street})
+        if self.local_data.interpolation is not None:
+            return self.local_data.interpolation.interpolate(lat, lon, number, street)
 
-        url = f"{url}?{params}"
-        vlog(f"Call to interpolate: {url}")
-
-        return self.call_service(url)
+        return self.call_service(self.interpolate_url(lat, lon, number, street), use_cache=use_cache, deadline=deadline)
 
     def check(self, city_test_from="Bruxelles"):
         """
@@ -243,10 +755,9 @@ class Pelias:
         """
 
         try:
-            pelias_res = self.geocode(city_test_from)
-            if city_test_from.lower() == pelias_res["geocoding"]["query"]["text"].lower():
-                return True  # Everything is fine
-            return pelias_res  # Server answers, but gives an unexpected result
+            # Health check: always call Pelias, never use the cache
+            pelias_res = self.call_service(self.geocode_url(city_test_from), use_cache=False)
+            return self.check_result(city_test_from, pelias_res)
         except PeliasException as exc:
             vlog("Exception occured: ")
             vlog(exc)
@@ -282,3 +793,208 @@ class Pelias:
         if i == 9:
             vlog("Pelias not up & running !")
             vlog(f"Pelias: {self.geocode_api }")
+
+
+class AsyncPelias(BasePelias):
+    """
+    Asyncio counterpart of Pelias (see BasePelias): same interface, but call_service,
+    geocode, reverse, interpolate, check and wait are coroutines, sent through one
+    httpx.AsyncClient (keeping a pool of keep-alive connections) per backend.
+    """
+
+    def create_pools(self):
+        """
+        Create one httpx.AsyncClient per backend
+
+        Returns
+        -------
+        dict
+            httpx.AsyncClient, per backend.
+        """
+        self.pool_counters = {backend: {"requests": 0, "connections": 0} for backend in self.backend_urls}
+
+        return {
+            backend: httpx.AsyncClient(limits=httpx.Limits(max_connections=self.pool_size,
+                                                           max_keepalive_connections=self.pool_size),
+                                       timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout))
+            for backend in self.backend_urls
+        }
+
+    def get_pool_stats(self):
+        """
+        Connection pools statistics, per backend (see BasePelias.get_pool_stats)
+        """
+        return {backend: {"pool_size": self.pool_size,
+                          "requests": cnt["requests"],
+                          "connections": cnt["connections"],
+                          "reused": max(cnt["requests"] - cnt["connections"], 0)}
+                for backend, cnt in self.pool_counters.items()}
+
+    async def close(self):
+        """
+        Close all connections
+        """
+        for client in self.pools.values():
+            await client.aclose()
+        self.elastic.close()
+
+    async def call_service(self, url, nb_attempts=6, use_cache=True, deadline=None):
+        """
+        Call URL (see Pelias.call_service)
+
+        Identical calls in flight share a single task sending the request. This
+        task is shielded: cancelling one of the callers does not cancel it for
+        the others.
+        """
+        if use_cache:
+            data = self.cache.get(url)
+            if data is not None:
+                vlog(f"Pelias result from cache: {url}")
+                return json.loads(data)
+
+        key = self.cache.normalize_url(url)
+        call = self.in_flight.get(key)
+        is_leader = call is None
+        if is_leader:
+            task = asyncio.ensure_future(self.send_request_in_flight(key, url, nb_attempts, use_cache, deadline))
+            # Avoid "exception never retrieved" warnings if all callers have been cancelled
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            call = {"task": task, "nb_waiters": 1}
+            self.in_flight[key] = call
+        else:
+            vlog(f"Identical call in flight, waiting for its result: {url}")
+            call["nb_waiters"] += 1
+            self.single_flight_counters["coalesced"] += 1
+
+        try:
+            res = await asyncio.wait_for(asyncio.shield(call["task"]), time_left(deadline))
+        except asyncio.TimeoutError as exc:
+            raise DeadlineExceededException(f"Deadline exceeded while waiting for Pelias ({url})") from exc
+        except DeadlineExceededException:
+            if is_leader or not has_time_left(deadline):
+                raise
+            # The deadline of the leader was shorter than ours: try again
+            return await self.call_service(url, nb_attempts, use_cache, deadline)
+        # Once the task is done, no caller can join anymore: nb_waiters is final
+        return copy.deepcopy(res) if call["nb_waiters"] > 1 else res
+
+    async def send_request_in_flight(self, key, url, nb_attempts, use_cache, deadline):
+        """
+        Call send_request, and remove key from calls in flight when done
+        """
+        try:
+            return await self.send_request(url, nb_attempts, use_cache, deadline)
+        finally:
+            del self.in_flight[key]
+
+    async def send_request(self, url, nb_attempts=6, use_cache=True, deadline=None):
+        """
+        Call URL (see Pelias.send_request)
+        """
+        backend = self.get_backend(url)
+        client = self.pools[backend]
+        counters = self.pool_counters[backend]
+
+        async def trace(event_name, _info):
+            if event_name == "connection.connect_tcp.complete":
+                counters["connections"] += 1
+
+        attempt = 0
+        check_breaker = True
+        probe = False
+        try:
+            while nb_attempts > 0:
+                if check_breaker:
+                    probe = self.acquire_breaker(backend, url)
+                check_breaker = True
+                connect_timeout, read_timeout = self.get_timeouts(deadline, url)
+                try:
+                    response = await client.get(url, timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                                                extensions={"trace": trace})
+                    counters["requests"] += 1
+                except httpx.TimeoutException as exc:
+                    raise self.timeout_exception(backend, url, exc, deadline) from exc
+                except httpx.RemoteProtocolError as exc:
+                    self.check_connection_lost(backend, url, exc, nb_attempts)
+                    nb_attempts -= 1
+                    check_breaker = False  # Not a backend failure: retry at once
+                    continue
+                except httpx.TransportError as exc:
+                    raise self.failure_exception(backend, url, exc) from exc
+                except Exception as exc:
+                    self.breakers[backend].record_failure()
+                    log(f"Cannot get Pelias results ({url}): {exc}")
+                    raise exc
+
+                probe = False
+                res, err = self.read_response(backend, url, response.status_code, response.reason_phrase, response.content, use_cache)
+                if err is None:
+                    return res
+                delay = self.retry_delay(url, err, attempt, nb_attempts, deadline)
+                nb_attempts -= 1
+                attempt += 1
+                await asyncio.sleep(delay)
+        finally:
+            if probe:  # Probe call ended without any answer nor failure of the backend
+                self.breakers[backend].release_probe()
+
+        return None
+
+    async def geocode(self, query, layers=None, deadline=None):
+        """
+        Call Pelias geocoder (see Pelias.geocode)
+        """
+        return await self.call_service(self.geocode_url(query, layers), deadline=deadline)
+
+    async def reverse(self, lat, lon, radius, size):
+        """
+        Call Pelias reverse geocoder (see Pelias.reverse)
+        """
+        return await self.call_service(self.reverse_url(lat, lon, radius, size))
+
+    async def interpolate(self, lat, lon, number, street, use_cache=True, deadline=None):
+        """
+        Call Pelias interpolate service (see Pelias.interpolate)
+        """
+        if self.local_data.interpolation is not None:
+            return self.local_data.interpolation.interpolate(lat, lon, number, street)
+
+        return await self.call_service(self.interpolate_url(lat, lon, number, street), use_cache=use_cache, deadline=deadline)
+
+    async def check(self, city_test_from="Bruxelles"):
+        """
+        Check that Pelias server is up&running (see Pelias.check)
+        """
+
+        try:
+            pelias_res = await self.call_service(self.geocode_url(city_test_from), use_cache=False)
+            return self.check_result(city_test_from, pelias_res)
+        except PeliasException as exc:
+            vlog("Exception occured: ")
+            vlog(exc)
+            return False    # Server does not answer
+
+    async def wait(self, city_test_from="Bruxelles"):
+        """
+        Wait for Pelias to be up & running (see Pelias.wait)
+        """
+
+        delay = 2
+        for _ in range(10):
+            pel = await self.check(city_test_from)
+            if pel is True:
+                log("Pelias working properly")
+                return
+            vlog("Pelias not up & running")
+            vlog(f"Try again in {delay} seconds")
+            if pel is not False:
+                vlog("Answer:")
+                vlog(pel)
+
+                vlog(f"Pelias host: {self.geocode_api }")
+
+            await asyncio.sleep(delay)
+            delay += 0.5
+
+        vlog("Pelias not up & running !")
+        vlog(f"Pelias: {self.geocode_api }")
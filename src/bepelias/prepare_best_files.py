@@ -24,6 +24,8 @@ import numpy as np
 import geopandas as gpd
 import shapely
 
+from bepelias.normalization import normalize_name, best_name_normalization
+
 logging.basicConfig(format='[%(asctime)s]  %(message)s', stream=sys.stdout)
 
 
@@ -132,6 +134,33 @@ def build_addendum(data_dict, no_quotes, index):
     return '{'+pd.Series(res, index=index).str[0:-2]+'}'  # remove the last ", "
 
 
+def build_normalized_names(data):
+    """
+    Normalized version of all names (see normalization.best_name_normalization) available in data, in all
+    languages, to be added as "normalized" in the addendum (see build_addendum): doing it once
+    here avoids doing it for each request in bePelias
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        With (some of) columns streetname_fr, ..., part_of_municipality_name_de.
+
+    Returns
+    -------
+    dict
+        For each name, for each language, a pd.Series.
+    """
+    res = {}
+    for name, steps in best_name_normalization.items():
+        res[name] = {}
+        for lang in ["fr", "nl", "de"]:
+            if f"{name}_{lang}" in data:
+                col = data[f"{name}_{lang}"]
+                values = col.dropna().unique()  # Most names are repeated many times
+                res[name][lang] = col.map(dict(zip(values, [normalize_name(v, steps) for v in values])))
+    return {name: langs for name, langs in res.items() if langs}
+
+
 def build_locality(data, lang):
     """
     Create a column containing a "locality name" in the language "lang".
@@ -467,7 +496,8 @@ def create_address_data(data, region):
             },
             "housenumber": chunk.housenumber,
             "status": chunk.status,
-            "box_info": chunk.box_info
+            "box_info": chunk.box_info,
+            "normalized": build_normalized_names(chunk)
             }, ['box_info'], chunk.index)
         addendum_chunks.append(addendum_chunk)
 
@@ -643,7 +673,8 @@ def create_street_data(data, empty_street, region):
         "postal_info": {
             "name": {"fr": data_streets.postname_fr, "nl": data_streets.postname_nl, "de": data_streets.postname_de},
             "postal_code": data_streets.postalcode
-        }
+        },
+        "normalized": build_normalized_names(data_streets)
         }, [], data_streets.index)
 
     data_streets = data_streets.rename(columns={"streetname": "street"})
@@ -706,7 +737,8 @@ def create_locality_data(data, region):
         "postal_info": {
             "name": {"fr": data_localities.postname_fr, "nl": data_localities.postname_nl, "de": data_localities.postname_de},
             "postal_code": data_localities.postalcode
-        }
+        },
+        "normalized": build_normalized_names(data_localities)
         }, [], data_localities.index)
 
     # add a stable suffix to best id to avoid duplicates
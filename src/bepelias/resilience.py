@@ -0,0 +1,298 @@
+"""Building blocks of resilient calls to backends: deadlines, retries with backoff,
+circuit breakers, response cache and single-flight calls (see pelias.BasePelias)
+
+"""
+
+import collections
+import os
+import random
+import threading
+import urllib.parse
+import time
+
+from bepelias.utils import log
+
+
+def time_left(deadline):
+    """
+    Time (in seconds) left before deadline (a time.monotonic() value), or None if deadline is None
+    """
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def has_time_left(deadline):
+    """
+    Whether deadline (possibly None: no deadline) is not reached yet
+    """
+    return deadline is None or time_left(deadline) > 0
+
+
+def backoff_delay(attempt, base=0.25, max_delay=4.0):
+    """
+    Delay before retrying a failed call: exponential backoff with (equal) jitter
+
+    Parameters
+    ----------
+    attempt : int
+        Number of failed attempts so far (starting at 0).
+    base : float, optional
+        Delay after the first failed attempt (before jitter). The default is 0.25.
+    max_delay : float, optional
+        Maximal delay (before jitter). The default is 4.0.
+
+    Returns
+    -------
+    float
+        Delay, in seconds, between half and the full exponential delay.
+    """
+    delay = min(max_delay, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker protecting calls to a backend.
+
+    - closed: calls are sent. After failure_threshold consecutive failures, the circuit opens
+    - open: calls fail fast, without being sent. After reset_timeout seconds, the circuit is half open
+    - half_open: a single (probe) call is sent. If it succeeds, the circuit closes; if not, it opens again
+
+    Thread safe.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """
+        Parameters
+        ----------
+        failure_threshold : int, optional
+            Number of consecutive failures opening the circuit. The default is 5.
+        reset_timeout : float, optional
+            Time (in seconds) the circuit stays open before a probe call is allowed. The default is 30.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Whether a call can be sent now
+
+        Returns
+        -------
+        tuple
+            (allowed, probe): allowed is False if the circuit is open (or half open with a probe
+            call already in flight); probe is True if the call is the probe call of a half open
+            circuit. A probe ending without record_success nor record_failure must be released
+            (see release_probe).
+        """
+        with self.lock:
+            if self.state == "closed":
+                return True, False
+            now = time.monotonic()
+            if self.state == "open":
+                if now - self.opened_at < self.reset_timeout:
+                    return False, False
+                log("Circuit breaker half open, sending a probe call")
+                self.state = "half_open"
+            # half open: only one probe at a time (unless the previous one got lost)
+            if self.probe_started_at is not None and now - self.probe_started_at < self.reset_timeout:
+                return False, False
+            self.probe_started_at = now
+            return True, True
+
+    def release_probe(self):
+        """
+        Forget the probe call in flight, without changing the state: the probe ended without telling
+        anything about the backend (deadline exceeded, call cancelled...), next call will be a probe
+        """
+        with self.lock:
+            self.probe_started_at = None
+
+    def record_success(self):
+        """
+        Record a call that got an answer from the backend
+        """
+        with self.lock:
+            if self.state != "closed":
+                log("Circuit breaker closed")
+            self.state = "closed"
+            self.failures = 0
+            self.probe_started_at = None
+
+    def record_failure(self):
+        """
+        Record a call that failed (backend not reachable or server error)
+        """
+        with self.lock:
+            self.failures += 1
+            self.probe_started_at = None
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                log(f"Circuit breaker open ({self.failures} consecutive failures)")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def get_state(self):
+        """
+        Current state ("closed", "open" or "half_open") and number of consecutive failures
+        """
+        with self.lock:
+            state = self.state
+            if state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                state = "half_open"  # next call will be a probe
+            return {"state": state, "failures": self.failures}
+
+
+class ResponseCache:
+    """
+    Bounded in-process cache of (raw) Pelias responses, keyed by normalized URL.
+
+    Least recently used entries are evicted when the cache is full, and entries
+    older than ttl seconds are discarded. Responses are kept as raw bytes, so that
+    each hit gives a fresh (parsed) object, that callers are free to modify.
+    If version_file is given, the whole cache is emptied when the modification time
+    of this file changes (checked at most every CHECK_INTERVAL seconds): feed.sh
+    touches it after each data update, so that all workers (and processes) sharing
+    this file drop their responses computed on the previous data.
+    Thread safe.
+    """
+
+    CHECK_INTERVAL = 10
+
+    def __init__(self, max_size=0, ttl=3600, version_file=None):
+        """
+        Parameters
+        ----------
+        max_size : int, optional
+            Maximal number of entries. 0 disables the cache. The default is 0.
+        ttl : float, optional
+            Time to live, in seconds. The default is 3600.
+        version_file : str, optional
+            Data version marker file. The default is None (no marker).
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version_file = version_file
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+        self.version = self.get_version()
+        self.checked_at = time.monotonic()
+
+    def get_version(self):
+        """
+        Current data version: modification time of version_file (None if there is no such file)
+        """
+        if not self.version_file:
+            return None
+        try:
+            return os.stat(self.version_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def check_version(self):
+        """
+        Empty the cache if the data version changed since last check. Must be called with lock held
+        """
+        if not self.version_file or time.monotonic() - self.checked_at < self.CHECK_INTERVAL:
+            return
+        self.checked_at = time.monotonic()
+        version = self.get_version()
+        if version != self.version:
+            self.version = version
+            log(f"Data version changed ({self.version_file}): Pelias cache invalidated ({len(self.entries)} entries removed)")
+            self.entries.clear()
+            self.counters["invalidations"] += 1
+
+    @staticmethod
+    def normalize_url(url):
+        """
+        Normalize url, by sorting its query parameters
+        """
+        parts = urllib.parse.urlsplit(url)
+        query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+        return urllib.parse.urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, query, ""))
+
+    def get(self, url):
+        """
+        Get the cached response for url
+
+        Returns
+        -------
+        bytes or None
+            None if url is not in cache (or expired).
+        """
+        if self.max_size <= 0:
+            return None
+        key = self.normalize_url(url)
+        with self.lock:
+            self.check_version()
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                self.counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[1]
+
+    def put(self, url, data):
+        """
+        Add the (raw) response data for url into the cache
+        """
+        if self.max_size <= 0:
+            return
+        key = self.normalize_url(url)
+        with self.lock:
+            self.check_version()
+            self.entries[key] = (time.monotonic(), data)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def invalidate(self):
+        """
+        Remove all entries (typically after Pelias data have been updated)
+
+        Returns
+        -------
+        int
+            Number of removed entries.
+        """
+        with self.lock:
+            nb_entries = len(self.entries)
+            self.entries.clear()
+            self.counters["invalidations"] += 1
+        log(f"Pelias cache invalidated ({nb_entries} entries removed)")
+        return nb_entries
+
+    def get_stats(self):
+        """
+        Cache statistics: size, max size, ttl, and hits/misses/evictions/expirations/invalidations counters
+        """
+        with self.lock:
+            return {"size": len(self.entries),
+                    "max_size": self.max_size,
+                    "ttl": self.ttl,
+                    "version_file": self.version_file,
+                    **self.counters}
+
+
+class InFlightCall:
+    """
+    Call to Pelias currently being sent by one thread, that other threads
+    sending the same call can wait for (see Pelias.call_service)
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+        self.nb_followers = 0
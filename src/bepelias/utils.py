@@ -4,10 +4,14 @@
 import logging
 import re
 import copy
+from collections import Counter
 
 
+import numpy as np
 import textdistance
 
+from bepelias.normalization import normalize_name, best_name_normalization
+
 
 # General functions
 
@@ -111,6 +115,7 @@ def to_rest_guidelines(pelias_res, with_pelias_raw=True):
     for feat in pelias_res["features"]:
         if "addendum" in feat["properties"] and "best" in feat["properties"]["addendum"]:
             item = feat["properties"]["addendum"]["best"]
+            item.pop("normalized", None)  # Only used to compare names
             item["coordinates"] = convert_coordinates(feat["geometry"]["coordinates"])
         else:
             item = {"coordinates": convert_coordinates(feat["geometry"]["coordinates"]),
@@ -182,7 +187,37 @@ def pelias_check_postcode(pelias_res, postcode, match_length=3):
     return pelias_res
 
 
-def get_street_names(feature):
+def get_best_name(best, name, lang, normalized=False):
+    """
+    From a BeSt addendum, get a name in a given language
+
+    Parameters
+    ----------
+    best : dict
+        BeSt addendum (properties>addendum>best of a Pelias feature).
+    name : str
+        streetname, postname, municipality_name or part_of_municipality_name.
+    lang : str
+        fr, nl or de.
+    normalized : bool, optional
+        If True, give the name normalized with best_name_normalization[name], computed at
+        feed time if available. The default is False.
+
+    Returns
+    -------
+    str or None
+        Name (best["{name}_{lang}"]), None if not available.
+    """
+
+    value = best.get(f"{name}_{lang}")
+    if value is None or not normalized:
+        return value
+
+    feed_value = best.get("normalized", {}).get(name, {}).get(lang)
+    return feed_value if feed_value is not None else normalize_name(value, best_name_normalization[name])
+
+
+def get_street_names(feature, normalized=False):
     """
     From a Pelias feature, extract all possible street name
 
@@ -190,87 +225,153 @@ def get_street_names(feature):
     ----------
     feature : dict
         Pelias feature.
+    normalized : bool, optional
+        If True, give names without accents and street types (see get_best_name).
+        The default is False.
 
     Yields
     ------
     str
-        street name.
+        street name, in upper case.
     """
 
     if "street" in feature["properties"]:
-        yield feature["properties"]["street"].upper()
+        street = feature["properties"]["street"].upper()
+        yield normalize_name(street, ("unidecode", "street_types")) if normalized else street
     if "addendum" not in feature["properties"] or "best" not in feature["properties"]["addendum"]:
         return
 
     best = feature["properties"]["addendum"]["best"]
-    for n in ["streetname_fr", "streetname_nl", "streetname_de"]:
-        if n in best:
-            yield best[n].upper()
+    for lang in ["fr", "nl", "de"]:
+        street = get_best_name(best, "streetname", lang, normalized)
+        if street is not None:
+            yield street if normalized else street.upper()
 
 
-def remove_street_types(street_name):
+def is_partial_substring(s1, s2):
     """
-    From a street name, remove most 'classical' street types, in French and Dutch
-    (Rue, Avenue, Straat...). Allow to improve string comparison reliability
+    Check that s1 (assuming s1 is shorter than s2) is a subsequence of s2, i.e.,
+    s1 can be obtained by removing some characters to s2.
+    Example:"Rue Albert" vs "Rue Marcel Albert", or vs "Rue Albert Marcel". "Rue M. Albert" vs "Rue Marcel Albert"
 
     Parameters
     ----------
-    street_name : str
-        A street name.
+    s1 : str
+
+    s2 : str
 
     Returns
     -------
-    str
-        Cleansed version of input street_name.
+    int
+        1 if the shortest can be obtained by removing some characters from the longest
+        0 otherwise
     """
 
-    to_remove = ["^RUE ", "^AVENUE ", "^CHAUSSEE ", "^ALLEE ", "^BOULEVARD ", "^PLACE ", "^CHEMIN ",
-                 "STRAAT$", "STEENWEG$", "LAAN$"]
+    # Dots and spaces are ignored
+    if len(s1) - s1.count(".") - s1.count(" ") > len(s2) - s2.count(".") - s2.count(" "):
+        s1, s2 = s2, s1
 
-    for s in to_remove:
-        street_name = re.sub(s, "", street_name)
+    # Find each character of s1 in s2, after the previous one
+    pos = 0
+    for c in s1:
+        if c in ". ":
+            continue
+        pos = s2.find(c, pos)
+        if pos < 0:
+            return 0
+        pos += 1
 
-    to_remove = ["^DE LA ", "^DE ", "^DU ", "^DES "]
+    return 1
 
-    for s in to_remove:
-        street_name = re.sub(s, "", street_name)
 
-    return street_name.strip()
+def get_similarity_upper_bounds(str1, str2):
+    """
+    Cheap upper bounds (based on lengths and common characters) of the similarities
+    computed by apply_sim_functions
 
+    Parameters
+    ----------
+    str1 : str
+        Any string
+    str2: str
+        Any string.
 
-def is_partial_substring(s1, s2):
+    Returns
+    -------
+    tuple
+        Upper bounds of Jaro-Winkler and Sorensen-Dice similarities.
     """
-    Check that s1 (assuming s1 is shorter than s2) is a subsequence of s2, i.e.,
-    s1 can be obtained by removing some characters to s2.
-    Example:"Rue Albert" vs "Rue Marcel Albert", or vs "Rue Albert Marcel". "Rue M. Albert" vs "Rue Marcel Albert"
+    len1, len2 = len(str1), len(str2)
+    if len1 == 0 or len2 == 0:
+        return (1, 1) if len1 == len2 else (0, 0)
+
+    # Number of characters in common (with repetitions): bounds the number of matching
+    # characters in Jaro, and is exactly the intersection of Sorensen-Dice (on characters)
+    common = sum((Counter(str1) & Counter(str2)).values())
+
+    jaro_winkler = (common / len1 + common / len2 + 1) / 3 if common else 0
+    if jaro_winkler > 0.7:  # Winkler bonus, for a common prefix of at most 4 characters
+        prefix = 0
+        while prefix < min(len1, len2, 4) and str1[prefix] == str2[prefix]:
+            prefix += 1
+        jaro_winkler += prefix * 0.1 * (1 - jaro_winkler)
+
+    return jaro_winkler, 2 * common / (len1 + len2)
+
+
+# Number of calls to apply_sim_functions decided by each similarity function ("none" if
+# none of them reaches the threshold), and number of similarity computations skipped thanks
+# to get_similarity_upper_bounds
+similarity_stats = {"decided_by": {"jaro_winkler": 0, "sorensen_dice": 0, "partial_substring": 0, "none": 0},
+                    "skipped": {"jaro_winkler": 0, "sorensen_dice": 0}}
+
+# Margin on upper bounds, to be robust to float rounding
+SIMILARITY_BOUND_MARGIN = 1e-9
+
+
+def similarity_cascade(str1, str2, threshold):
+    """
+    Same as apply_sim_functions, also giving the similarity function which decided.
+    A similarity is only computed if its upper bound (see get_similarity_upper_bounds) is
+    not below threshold
 
     Parameters
     ----------
-    s1 : str
-
-    s2 : str
+    str1 : str
+        Any string
+    str2: str
+        Any string.
+    threshold : float
+        String similarity we want to reach.
 
     Returns
     -------
-    int
-        1 if the shortest can be obtained by removing some characters from the longest
-        0 otherwise
+    tuple
+        sim (see apply_sim_functions), and name of the similarity function giving sim
+        (jaro_winkler, sorensen_dice or partial_substring), None if sim is None
     """
+    jaro_winkler_ub, sorensen_dice_ub = get_similarity_upper_bounds(str1, str2)
+    min_bound = threshold - SIMILARITY_BOUND_MARGIN
 
-    s1 = re.sub("[. ]", "", s1)
-    s2 = re.sub("[. ]", "", s2)
+    if jaro_winkler_ub >= min_bound:
+        sim = textdistance.jaro_winkler(str1, str2)
+        if sim >= threshold:
+            return sim, "jaro_winkler"
+    else:
+        similarity_stats["skipped"]["jaro_winkler"] += 1
 
-    if len(s1) > len(s2):
-        s1, s2 = s2, s1
+    if sorensen_dice_ub >= min_bound:
+        sim = textdistance.sorensen_dice(str1, str2)
+        if sim >= threshold:
+            return sim, "sorensen_dice"
+    else:
+        similarity_stats["skipped"]["sorensen_dice"] += 1
 
-    while len(s1) > 0 and len(s2) > 0:
-        if s1[0] == s2[0]:
-            s1 = s1[1:]
-            s2 = s2[1:]
-        else:
-            s2 = s2[1:]
+    sim = is_partial_substring(str1, str2)
+    if sim >= threshold:
+        return sim, "partial_substring"
 
-    return int(len(s1) == 0)  # and len(s2)==0
+    return None, None
 
 
 def apply_sim_functions(str1, str2, threshold):
@@ -280,7 +381,12 @@ def apply_sim_functions(str1, str2, threshold):
     return None
 
     Following string similarities are tested: Jaro-Winkler, Sorensen-Dice,
-        Levenshtiein similarity
+        partial substring. Computations which can not reach threshold are skipped
+        (see similarity_cascade); the function which decided is counted in similarity_stats.
+        Levenshtein similarity (1 - distance/max length), formerly tested after Sorensen-Dice,
+        is not computed anymore: it can never decide. An alignment matches at most "common"
+        characters (common to both strings, with repetitions), so distance >= max_len - common,
+        and Levenshtein similarity <= common/max_len <= 2*common/(len1+len2) = Sorensen-Dice
 
     Parameters
     ----------
@@ -298,13 +404,101 @@ def apply_sim_functions(str1, str2, threshold):
         of them if bellow, return None.
     """
 
-    sim_functions = [textdistance.jaro_winkler,
-                     textdistance.sorensen_dice,
-                     lambda s1, s2: 1 - textdistance.levenshtein(s1, s2)/max(len(s1), len(s2)),
-                     is_partial_substring
-                     ]
-    for sim_fct in sim_functions:
-        sim = sim_fct(str1, str2)
-        if sim >= threshold:
-            return sim
-    return None
+    sim, stage = similarity_cascade(str1, str2, threshold)
+    similarity_stats["decided_by"][stage or "none"] += 1
+    return sim
+
+
+def encode_strings(strings):
+    """
+    Encode a list of strings for vectorized comparisons
+
+    Parameters
+    ----------
+    strings : list
+        List of strings.
+
+    Returns
+    -------
+    tuple
+        lengths (array of n ints), histograms (n x alphabet array: number of occurrences of each
+        character in each string), alphabet (array of character codes), and prefixes (n x 4
+        array: codes of the first 4 characters, -1 after the end of a string).
+    """
+    lengths = np.array([len(st) for st in strings], dtype=np.int64)
+    codes = np.frombuffer("".join(strings).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    owner = np.repeat(np.arange(len(strings)), lengths)
+    position = np.arange(len(codes)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    alphabet, char_index = np.unique(codes, return_inverse=True)
+    histograms = np.zeros((len(strings), len(alphabet)), dtype=np.int64)
+    np.add.at(histograms, (owner, char_index), 1)
+
+    prefixes = np.full((len(strings), 4), -1, dtype=np.int64)
+    in_prefix = position < 4
+    prefixes[owner[in_prefix], position[in_prefix]] = codes[in_prefix]
+
+    return lengths, histograms, alphabet, prefixes
+
+
+def batch_sim_decisions(strings, queries, query_index, threshold):
+    """
+    Vectorized version of "apply_sim_functions(strings[i], queries[query_index[i]], threshold) is not None"
+    for all i. All pairs are compared in one numpy pass:
+        - Sorensen-Dice (on characters) is computed exactly: pairs reaching threshold are kept;
+        - pairs whose Jaro-Winkler upper bound (see get_similarity_upper_bounds) and Sorensen-Dice
+          are below threshold, and where the multiset of characters of the shortest string is not
+          included in the one of the longest (dots and spaces excluded: no partial substring) are
+          dropped;
+        - remaining pairs are decided by apply_sim_functions.
+
+    Parameters
+    ----------
+    strings : list
+        List of n strings.
+    queries : list
+        List of strings compared to strings.
+    query_index : list
+        n indexes in queries.
+    threshold : float
+        String similarity we want to reach.
+
+    Returns
+    -------
+    np.array
+        n booleans.
+    """
+    if len(strings) == 0:
+        return np.zeros(0, dtype=bool)
+
+    query_index = np.asarray(query_index, dtype=np.int64)
+    lengths, histograms, alphabet, prefixes = encode_strings(list(strings) + list(queries))
+    nb_str = len(strings)
+    len1, hist1, prefix1 = lengths[:nb_str], histograms[:nb_str], prefixes[:nb_str]
+    len2, hist2, prefix2 = lengths[nb_str:][query_index], histograms[nb_str:][query_index], prefixes[nb_str:][query_index]
+
+    identical = np.array([st == queries[q] for st, q in zip(strings, query_index)], dtype=bool)
+    non_empty = (len1 > 0) & (len2 > 0)
+    common = np.minimum(hist1, hist2).sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sorensen_dice = np.where(non_empty, 2.0 * common / (len1 + len2), 0.0)
+        jaro = np.where(common > 0, (common / len1 + common / len2 + 1) / 3, 0.0)
+    prefix = np.cumprod(prefix1 == np.where(prefix2 < 0, -2, prefix2), axis=1).sum(axis=1)
+    jaro_winkler = np.where(jaro > 0.7, jaro + prefix * 0.1 * (1 - jaro), jaro)
+
+    # Partial substring: characters of the shortest (without dots and spaces) included in the longest
+    ignored = np.isin(alphabet, [ord("."), ord(" ")])
+    hist1[:, ignored] = 0
+    hist2[:, ignored] = 0
+    shortest_first = hist1.sum(axis=1) <= hist2.sum(axis=1)
+    included = np.where(shortest_first, (hist1 <= hist2).all(axis=1), (hist2 <= hist1).all(axis=1))
+
+    keep = (identical & (1 >= threshold)) | (non_empty & (sorensen_dice >= threshold))
+
+    min_bound = threshold - SIMILARITY_BOUND_MARGIN
+    undecided = ~keep & ((jaro_winkler >= min_bound) | (sorensen_dice >= min_bound) | included)
+    for i in np.flatnonzero(undecided):
+        keep[i] = apply_sim_functions(strings[i], queries[query_index[i]], threshold) is not None
+
+    return keep
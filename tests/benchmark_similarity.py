@@ -0,0 +1,54 @@
+"""
+Micro-benchmark of the similarity functions used by apply_sim_functions (not a test:
+not collected by pytest).
+
+Usage: python tests/benchmark_similarity.py [-n 1000]
+"""
+import argparse
+import timeit
+
+import textdistance
+
+from bepelias.utils import apply_sim_functions, is_partial_substring, normalize_name
+
+# (input street name, BeSt street name) pairs, from very close to unrelated
+PAIRS = [("Rue de la Loi", "Rue de la Loi"),
+         ("Av. Louise", "Avenue Louise"),
+         ("Rue M. Albert", "Rue Marcel Albert"),
+         ("Chaussee d'Ixelles", "Chaussée d'Ixelles"),
+         ("Kerkstr.", "Kerkstraat"),
+         ("Boulevard Anspach", "Rue Neuve"),
+         ("Rue du Marché aux Herbes", "Marché aux Herbes - Grasmarkt"),
+         ("Place Sainte-Catherine", "Sint-Katelijneplein"),
+         ("Avenue du Port " * 5, "Avenue du Port " * 4 + "Havenlaan")]
+
+THRESHOLD = 0.8
+
+
+FUNCTIONS = {"jaro_winkler": textdistance.jaro_winkler,
+             "sorensen_dice": textdistance.sorensen_dice,
+             "is_partial_substring": is_partial_substring,
+             "apply_sim_functions": lambda s1, s2: apply_sim_functions(s1, s2, THRESHOLD)}
+
+
+def main():
+    """ Print the time per call of each function, on each pair"""
+    parser = argparse.ArgumentParser(description="Micro-benchmark of similarity functions")
+    parser.add_argument("-n", "--number", type=int, default=1000, help="Number of calls per function and pair (default: 1000)")
+    args = parser.parse_args()
+
+    pairs = [(normalize_name(s1, ("upper", "unidecode", "street_types", "clean")),
+              normalize_name(s2.upper(), ("unidecode", "street_types"))) for s1, s2 in PAIRS]
+
+    print(f"{'function':<22}" + "".join(f"{i:>8}" for i in range(len(pairs))) + f"{'total':>10}   (µs per call, pair index)")
+    for name, fct in FUNCTIONS.items():
+        times = [timeit.timeit(lambda: fct(s1, s2), number=args.number) / args.number * 1e6 for s1, s2 in pairs]
+        print(f"{name:<22}" + "".join(f"{t:>8.1f}" for t in times) + f"{sum(times):>10.1f}")
+
+    print()
+    for i, (s1, s2) in enumerate(pairs):
+        print(f"{i}: '{s1}' vs '{s2}': {apply_sim_functions(s1, s2, THRESHOLD)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,12 @@
 Unitest for bepelias using pytest
 """
 
+import asyncio
+import io
 import json
+import os
+import socket
+import time
 from typing import Literal
 from urllib.parse import quote_plus
 
@@ -22,15 +27,22 @@ CITY_FIELD = "postName"
 FILENAME = "data.csv"  # A csv file with as header "streetName,houseNumber,postCode,postName"
 
 
-def call_ws(url, params):
+def call_ws(url, params, body=None):
     """
-        Call bePelias web service
+        Call bePelias web service (with a POST request if body is given)
     """
     try:
-        r = requests.get(
-            url,
-            params=params,
-            timeout=30)
+        if body is None:
+            r = requests.get(
+                url,
+                params=params,
+                timeout=30)
+        else:
+            r = requests.post(
+                url,
+                params=params,
+                json=body,
+                timeout=300)
 
     except Exception as e:
         print("Exception !")
@@ -86,6 +98,63 @@ def call_unstruct(address, mode="advanced"):
                    addr_data)
 
 
+def call_batch(addresses, mode="advanced"):
+    """Call batch bePelias
+
+    Args:
+        addresses (list): list of structured addresses (dict)
+        mode (str, optional):
+    """
+    return call_ws(f'http://{WS_HOSTNAME}/REST/bepelias/v1/geocode/batch', {},
+                   {"addresses": addresses,
+                    "mode": mode,
+                    "withPeliasResult": False})
+
+
+def call_stream(records, mode="advanced"):
+    """Call streaming bePelias
+
+    Args:
+        records (list): list of records (dict), one NDJSON line each
+        mode (str, optional):
+
+    Returns:
+        list: results (dict), in the order they were received
+    """
+    r = requests.post(f'http://{WS_HOSTNAME}/REST/bepelias/v1/geocode/stream',
+                      params={"mode": mode},
+                      data="".join(json.dumps(rec) + "\n" for rec in records),
+                      headers={"Content-Type": "application/x-ndjson"},
+                      timeout=300)
+    assert r.status_code == 200
+    return [json.loads(line) for line in r.iter_lines() if line]
+
+
+def call_job(filename, mode="advanced", max_wait=600):
+    """Create a geocoding job for a CSV file, and wait until it ends
+
+    Returns:
+        tuple: last job status (dict), result (CSV content, None if the job failed)
+    """
+    with open(filename, "rb") as f:
+        r = requests.post(f'http://{WS_HOSTNAME}/REST/bepelias/v1/jobs',
+                          params={"mode": mode},
+                          data=f,
+                          headers={"Content-Type": "text/csv"},
+                          timeout=300)
+    assert r.status_code == 202
+    job = r.json()
+
+    start = time.time()
+    while job["status"] not in ("done", "failed") and time.time() - start < max_wait:
+        time.sleep(1)
+        job = call_ws(job["self"], {})
+
+    if job["status"] != "done":
+        return job, None
+    return job, requests.get(f"{job['self']}/result", timeout=30).text
+
+
 def call_reverse(lat, lon, radius=1, size=10):
     """Call reverse geocoder
     """
@@ -95,6 +164,18 @@ def call_reverse(lat, lon, radius=1, size=10):
                    data)
 
 
+def call_reverse_batch(points, radius=1, size=10):
+    """Call batch reverse geocoder
+
+    Args:
+        points (list): list of (lat, lon)
+    """
+    return call_ws(f'http://{WS_HOSTNAME}/REST/bepelias/v1/reverse/batch', {},
+                   {"points": [{"lat": lat, "lon": lon} for lat, lon in points],
+                    "radius": radius,
+                    "size": size})
+
+
 def call_search_city(postcode=None, cityname=None):
     """call searchCity endpoing
 
@@ -210,6 +291,7 @@ def test_check_health():
     """
     health = call_health()
     assert "status" in health and health["status"] == "UP"
+    assert all(cb["state"] == "closed" for cb in health["circuitBreakers"].values())
 
 
 @pytest.mark.parametrize(
@@ -234,6 +316,7 @@ def test_check_single_addr(addr, expectings):
         "function, params, expected_code",
         [
             (call_geocode, {"addr_data": test_data["smals"]["fixture"], "mode": "1"}, 422),
+            (call_geocode, {"addr_data": {**test_data["smals"]["fixture"], "timeout": 0}}, 422),
             (call_unstruct, {"address": None}, 422),
             (call_unstruct, {"address": "test", "mode": "1"}, 422),
             (call_reverse, {"lat": 0, "lon": 0}, 422),
@@ -249,6 +332,304 @@ def test_wrong_calls(function, params, expected_code):
     assert "status_code" in res and res["status_code"] == expected_code
 
 
+def test_geocode_timeout():
+    """ A (very) short timeout gives either the best result found so far, or a 504 error"""
+    res = call_geocode({**test_data["nores"]["fixture"], "timeout": 0.001})
+    assert res["status_code"] == 504 or res.get("deadlineExceeded") is True
+
+
+def test_breaker_probe_deadline():
+    """ A half open circuit probe call ending on the deadline (no answer from the backend) must not keep the circuit closed to the next calls"""
+    pelias_module = pytest.importorskip("bepelias.pelias")
+
+    with socket.socket() as server:  # Accepts connections, but never answers
+        server.bind(("127.0.0.1", 0))
+        server.listen(10)
+        host = f"127.0.0.1:{server.getsockname()[1]}"
+        url = f"http://{host}/v1/search?text=test"
+
+        def open_breaker(pelias):
+            breaker = pelias.breakers["api"]
+            breaker.state = "open"
+            breaker.opened_at = time.monotonic() - breaker.reset_timeout
+            return breaker
+
+        pelias = pelias_module.Pelias(domain_api=host, domain_elastic=host, domain_interpol=host)
+        breaker = open_breaker(pelias)
+        with pytest.raises(pelias_module.DeadlineExceededException):
+            pelias.call_service(url, deadline=time.monotonic() + 0.5)
+        assert breaker.acquire() == (True, True)
+
+        async def async_probe():
+            pelias = pelias_module.AsyncPelias(domain_api=host, domain_elastic=host, domain_interpol=host)
+            breaker = open_breaker(pelias)
+            try:
+                with pytest.raises(pelias_module.DeadlineExceededException):
+                    await pelias.call_service(url, deadline=time.monotonic() + 0.5)
+                # The (shielded) call in flight may outlive its caller by a few ms
+                await asyncio.gather(*(call["task"] for call in pelias.in_flight.values()), return_exceptions=True)
+                assert breaker.acquire() == (True, True)
+            finally:
+                await pelias.close()
+        asyncio.run(async_probe())
+
+
+def test_breaker_timeout_under_deadline():
+    """ A backend timing out before the deadline of a call is a backend failure: enough of them open the circuit"""
+    pelias_module = pytest.importorskip("bepelias.pelias")
+
+    with socket.socket() as server:  # Accepts connections, but never answers
+        server.bind(("127.0.0.1", 0))
+        server.listen(10)
+        host = f"127.0.0.1:{server.getsockname()[1]}"
+        url = f"http://{host}/v1/search?text=test"
+        # The deadline shrinks connect timeout, but read timeout is reached well before it
+        params = {"domain_api": host, "domain_elastic": host, "domain_interpol": host,
+                  "connect_timeout": 2, "read_timeout": 0.2, "breaker_threshold": 2}
+
+        pelias = pelias_module.Pelias(**params)
+        for _ in range(2):
+            with pytest.raises(pelias_module.PeliasException) as exc_info:
+                pelias.call_service(url, deadline=time.monotonic() + 1)
+            assert not isinstance(exc_info.value, pelias_module.DeadlineExceededException)
+        assert pelias.breakers["api"].state == "open"
+        with pytest.raises(pelias_module.CircuitOpenException):
+            pelias.call_service(url, deadline=time.monotonic() + 1)
+
+        async def async_timeouts():
+            pelias = pelias_module.AsyncPelias(**params)
+            try:
+                for _ in range(2):
+                    with pytest.raises(pelias_module.PeliasException) as exc_info:
+                        await pelias.call_service(url, deadline=time.monotonic() + 1)
+                    assert not isinstance(exc_info.value, pelias_module.DeadlineExceededException)
+                assert pelias.breakers["api"].state == "open"
+                with pytest.raises(pelias_module.CircuitOpenException):
+                    await pelias.call_service(url, deadline=time.monotonic() + 1)
+            finally:
+                await pelias.close()
+        asyncio.run(async_timeouts())
+
+
+def test_cache_version_file(tmp_path):
+    """ Touching the data version marker file empties the Pelias response cache"""
+    pelias_module = pytest.importorskip("bepelias.pelias")
+
+    version_file = tmp_path / "data_version"
+    cache = pelias_module.ResponseCache(max_size=10, version_file=str(version_file))
+    cache.CHECK_INTERVAL = 0
+    url = "http://localhost/v1/search?text=test"
+    cache.put(url, b"{}")
+    assert cache.get(url) == b"{}"
+
+    version_file.touch()  # First data update
+    assert cache.get(url) is None
+    cache.put(url, b"{}")
+    assert cache.get(url) == b"{}"
+
+    os.utime(version_file, ns=(time.time_ns() + 10**9,) * 2)  # Next data update
+    assert cache.get(url) is None
+    assert cache.get_stats()["invalidations"] == 2
+
+
+def test_local_data_csv_records(tmp_path):
+    """ Local BeSt CSV files: blank lines are skipped, and quoted fields may contain newlines"""
+    local_data = pytest.importorskip("bepelias.local_data")
+
+    csv_file = tmp_path / "bestaddresses_bebru.csv"
+    csv_file.write_bytes(b'id,name,addendum_json_best\r\n'
+                         b'a1,"20 Avenue Fonsny\nbis","{""best_id"": ""id1""}"\r\n'
+                         b'\r\n'
+                         b'a2,22 Avenue Fonsny,"{""best_id"": ""id2""}"\r\n')
+    rows = list(local_data.iter_rows([str(csv_file)], "test"))
+    assert [row["id"] for _, row in rows] == ["a1", "a2"]
+    assert rows[0][1]["name"] == "20 Avenue Fonsny\nbis"
+
+    addresses = local_data.AddressIndex([str(csv_file)], None)
+    assert [addresses.read_row(position) for position, _ in rows] == [row for _, row in rows]
+
+
+def test_local_reverse_large_radius(tmp_path):
+    """ Local reverse geocoding: large radiuses are left to Pelias, and a batch at the largest radius only reads points close to each point"""
+    local_data = pytest.importorskip("bepelias.local_data")
+    np = pytest.importorskip("numpy")
+
+    rng = np.random.default_rng(0)
+    lats, lons = 50.80 + rng.random(3000) * 0.1, 4.30 + rng.random(3000) * 0.1
+    with open(tmp_path / "bestaddresses_bebru.csv", "w", encoding="utf-8") as f:
+        f.write("id,lat,lon,housenumber,postalcode,street,addendum_json_best\n")
+        for i, (lat, lon) in enumerate(zip(lats, lons)):
+            f.write(f'a{i},{lat},{lon},{i},1000,Rue Neuve,"{{""best_id"": ""id{i}""}}"\n')
+    addresses = local_data.AddressIndex.load(str(tmp_path))
+    reverse = local_data.SpatialIndex.load(str(tmp_path), addresses)
+
+    assert not reverse.serves(300)
+    with pytest.raises(ValueError):
+        reverse.nearest_many([(50.85, 4.35)], 300, 5)
+
+    nb_candidates = []
+    get_candidates = reverse.get_candidates
+
+    def count_candidates(*args):
+        res = get_candidates(*args)
+        nb_candidates.append(len(res[0]))
+        return res
+    reverse.get_candidates = count_candidates
+
+    points = list(zip(50.80 + rng.random(1000) * 0.1, 4.30 + rng.random(1000) * 0.1))
+    results = reverse.nearest_many(points, reverse.MAX_RADIUS, 5)
+    for (lat, lon), features in zip(points, results):
+        distances = local_data.haversine(lat, lon, reverse.grid["lat"], reverse.grid["lon"])
+        expected = reverse.grid["pos"][np.argsort(distances, kind="stable")[:5]]
+        assert [feat["properties"]["id"] for feat in features] == [addresses.read_row(pos)["id"] for pos in expected]
+    # The whole box of MAX_RADIUS contains all 3000 points
+    assert sum(nb_candidates) < len(points) * len(reverse.grid) / 10
+
+
+def test_job_cleanup(tmp_path):
+    """ Geocoding jobs: an interrupted upload fails the job, and finished jobs are removed on demand or after the retention delay"""
+    jobs = pytest.importorskip("bepelias.jobs")
+
+    job_dir = str(tmp_path)
+    job_id, input_file = jobs.create_job(job_dir, "advanced")
+    with open(input_file, "w", encoding="utf-8") as f:
+        f.write("streetName,houseNumber,postCode,postName\nAvenue Fonsny")
+    jobs.fail_upload(job_dir, job_id, "Upload not completed")
+    assert jobs.get_job(job_dir, job_id)["status"] == "failed"
+    assert not os.path.exists(input_file)
+
+    running_id, _ = jobs.create_job(job_dir, "advanced")  # Still uploading: never removed
+    assert jobs.delete_job(job_dir, running_id)["status"] == "uploading"
+    assert jobs.clean_jobs(job_dir, 0) == 0
+    assert jobs.clean_jobs(job_dir, 3600) == 0
+    jobs.update_status(job_dir, job_id, finished=time.time() - 7200)
+    assert jobs.clean_jobs(job_dir, 3600) == 1
+    assert jobs.get_job(job_dir, job_id) is None
+    assert jobs.get_job(job_dir, running_id)["status"] == "uploading"
+
+    jobs.update_status(job_dir, running_id, status="done", started=time.time(), finished=time.time(), rowsDone=0)
+    assert jobs.delete_job(job_dir, running_id)["status"] == "done"
+    assert jobs.delete_job(job_dir, running_id) is None
+    assert os.listdir(job_dir) == []
+
+
+def test_cli_resume(tmp_path, monkeypatch):
+    """ Command line geocoding (with geocode stubbed): a run interrupted is resumed after its last checkpoint,
+    and restarted from scratch if the output file is missing"""
+    cli = pytest.importorskip("bepelias.cli")
+
+    class Interrupted(BaseException):
+        """ Interruption of a run (not caught as an error on a row)"""
+
+    calls = []
+    interrupt_at = {"houseNumber": None}
+
+    def fake_geocode(_pelias, street_name, house_number, post_code, post_name, mode, with_pelias_result=False):
+        if house_number == interrupt_at["houseNumber"]:
+            raise Interrupted()
+        calls.append(house_number)
+        return {"items": [{"bestId": f"id{house_number}", "housenumber": house_number}],
+                "total": 1, "callType": "local", "peliasCallCount": 0}
+    monkeypatch.setattr(cli, "geocode", fake_geocode)
+
+    input_file, output_file = str(tmp_path / "input.csv"), str(tmp_path / "output.csv")
+    pd.DataFrame({"id": range(25), "streetName": "Avenue Fonsny", "houseNumber": [str(i) for i in range(25)],
+                  "postCode": "1060", "postName": "Saint-Gilles"}).to_csv(input_file, index=False)
+    kwargs = {"nb_workers": 2, "executor": "thread", "chunk_size": 10,
+              "pelias_kwargs": {"domain_api": "localhost:1", "domain_elastic": "localhost:1", "domain_interpol": "localhost:1"}}
+
+    assert cli.geocode_file(input_file, output_file, **kwargs) == 25
+    with open(output_file, "rb") as f:
+        expected = f.read()
+    result = pd.read_csv(output_file, dtype=str)
+    assert list(result["bepelias_bestId"]) == [f"id{i}" for i in range(25)]
+    assert not os.path.exists(f"{output_file}.checkpoint")
+
+    def interrupted_run():
+        calls.clear()
+        interrupt_at["houseNumber"] = "15"
+        with pytest.raises(Interrupted):
+            cli.geocode_file(input_file, output_file, **kwargs)
+        assert cli.read_checkpoint(f"{output_file}.checkpoint", input_file)[0] == 10
+        interrupt_at["houseNumber"] = None
+        calls.clear()
+
+    # Resumed after the first chunk, rows written after the checkpoint being removed
+    interrupted_run()
+    with open(output_file, "a", encoding="utf-8") as f:
+        f.write("10,Avenue Fonsny,10,1060,Saint")
+    assert cli.geocode_file(input_file, output_file, **kwargs) == 15
+    assert sorted(calls, key=int) == [str(i) for i in range(10, 25)]
+    with open(output_file, "rb") as f:
+        assert f.read() == expected
+
+    # Output file missing: restarted from the first row
+    interrupted_run()
+    os.remove(output_file)
+    assert cli.geocode_file(input_file, output_file, **kwargs) == 25
+    with open(output_file, "rb") as f:
+        assert f.read() == expected
+
+
+def test_local_exact_match():
+    """ An exact BeSt address gives the same building, whether it is found locally (BEST_DATA_DIR) or by Pelias"""
+    addr = {STREET_FIELD: "Avenue Fonsny", HOUSENBR_FIELD: "20", POSTCODE_FIELD: "1060"}
+    res = call_geocode(dict(addr), mode="simple")
+    assert res["total"] > 0 and res["items"][0]["precision"] == "address"
+    if res["callType"] == "local":
+        assert res["peliasCallCount"] == 0
+    assert res["items"][0]["bestId"] == call_geocode(dict(addr), mode="basic")["items"][0]["bestId"]
+
+
+def test_check_batch():
+    """Check that a batch call gives, in input order, the same results as single calls"""
+    fields = [STREET_FIELD, HOUSENBR_FIELD, POSTCODE_FIELD, CITY_FIELD]
+    addresses = [{f: it["fixture"][f] for f in fields if f in it["fixture"]} for it in test_data.values()]
+
+    actual = call_batch(addresses)
+    assert actual["status_code"] == 200
+    assert actual["total"] == len(addresses)
+
+    for addr, item, expected in zip(addresses, actual["items"], test_data.values()):
+        assert item["status"] == 200
+        check_expectings(item["result"], expected["expectings"])
+        assert item["result"]["items"] == call_geocode(dict(addr))["items"]
+
+
+def test_reverse_batch():
+    """Check that a batch reverse call gives, in input order, the same results as single calls"""
+    points = [(50.83582, 4.33844), (50.84, 4.35), (50.5, 5.5)]
+
+    actual = call_reverse_batch(points, size=5)
+    assert actual["status_code"] == 200
+    assert actual["total"] == len(points)
+
+    for (lat, lon), item in zip(points, actual["items"]):
+        assert item["status"] == 200
+        assert item["result"]["items"] == call_reverse(lat, lon, size=5)["items"]
+
+
+def test_check_stream():
+    """Check that a stream call gives, for each record (identified by its index), the expected result"""
+    fields = [STREET_FIELD, HOUSENBR_FIELD, POSTCODE_FIELD, CITY_FIELD]
+    records = [{f: it["fixture"][f] for f in fields if f in it["fixture"]} for it in test_data.values()]
+    records += [{"address": it["unstruct_fixture"]} for it in test_data.values() if "unstruct_fixture" in it]
+    records.append({"id": "wrong", "streetName": "x", "mode": "1"})
+
+    expected = [it["expectings"] for it in test_data.values()]
+    expected += [it["expectings"] for it in test_data.values() if "unstruct_fixture" in it]
+
+    actual = call_stream(records)
+    assert sorted(res["index"] for res in actual) == list(range(len(records)))
+
+    for res in actual:
+        if res["index"] < len(expected):
+            assert res["status"] == 200
+            check_expectings(res["result"], expected[res["index"]])
+        else:
+            assert res["status"] == 422 and res["id"] == "wrong"
+
+
 @pytest.mark.parametrize(
         "addr, expectings",
         [
@@ -343,6 +724,26 @@ def test_get_by_id(addr):
             assert res_by_id["items"][0]["coordinates"] == item["coordinates"]
 
 
+@pytest.mark.parametrize(
+        "filename",
+        [
+            "tests/data.csv"
+        ]
+)
+def test_job(filename, tmp_path):
+    """Check that a geocoding job gives a result for each row"""
+    addresses = pd.read_csv(filename).iloc[0:20]
+    addresses.to_csv(tmp_path / "job.csv", index=False)
+
+    job, result = call_job(tmp_path / "job.csv")
+    assert job["status"] == "done"
+    assert job["rowsDone"] == job["rowsTotal"] == len(addresses)
+    assert len(pd.read_csv(io.StringIO(result))) == len(addresses)
+
+    assert requests.delete(job["self"], timeout=30).status_code == 200
+    assert requests.get(job["self"], timeout=30).status_code == 404
+
+
 @pytest.mark.parametrize(
         "filename",
         [